@@ -1,20 +1,87 @@
+from dotenv import load_dotenv
+# The settings are read when utils is imported, so the .env file is loaded first
+load_dotenv()
+
 import time
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from telebot import types
+from feeds import PollingFeed, StreamingFeed
+from scheduler import AdaptiveScheduler, nearest_trigger_distance
+from alerts import TriggerIndex, evaluate_threshold_alerts
+from indicators import WindowedAlerts, parse_windowed_alert, describe_alert, MAX_WINDOW_MINUTES
+from outbox import MessageOutbox
+from sharding import ShardCoordinator
+from webhook import WebhookServer
+from dispatcher import ChatDispatcher, UserStates
+from metrics import MetricsServer, SamplingProfiler, registry, instrumented, instrument_handlers
 from utils import (
-    load_json_file,
-    save_json_file,
     get_token_info,
+    resolve_tokens,
+    parse_import,
     get_crypto_price,
-    WATCHLIST_FILE,
-    NOTIFICATIONS_FILE,
+    get_token_prices,
+    get_http_stats,
+    price_key,
+    notification_key,
+    watchlist_key,
     ITEMS_PER_PAGE,
-    bot
+    SUPPORTED_NETWORKS,
+    IMPORT_MAX_TOKENS,
+    IMPORT_MAX_FILE_SIZE,
+    IMPORT_PROGRESS_INTERVAL,
+    POLL_INTERVAL,
+    POLL_MIN_INTERVAL,
+    POLL_MAX_INTERVAL,
+    POLL_CONCURRENCY,
+    OUTBOX_GLOBAL_RATE,
+    OUTBOX_CHAT_RATE,
+    OUTBOX_CHAT_BURST,
+    OUTBOX_MERGE_WINDOW,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    RESTART_DELAY,
+    RESTART_MAX_DELAY,
+    DISPATCH_WORKERS,
+    USER_STATE_TTL,
+    PRICE_FEED,
+    PRICE_STREAM_URL,
+    STREAM_FLUSH_INTERVAL,
+    STORAGE_BACKEND,
+    SHARD_MODE,
+    SHARD_DB_FILE,
+    SHARD_WORKER_ID,
+    SHARD_HEARTBEAT_INTERVAL,
+    SHARD_WORKER_TTL,
+    SHARD_RELOAD_INTERVAL,
+    HISTORY_SAVE_INTERVAL,
+    METRICS_HOST,
+    METRICS_PORT,
+    PROFILE_FILE,
+    price_cache,
+    get_price_history,
+    get_store,
+    get_bot,
+    configure_logging,
+    save_warm_state,
+    load_warm_state
 )
 
-# In-memory storage for conversation states
-user_states = {}
+bot = get_bot()
+store = get_store()
+price_history = get_price_history()
+
+# In-memory storage for conversation states, dropped after USER_STATE_TTL idle seconds
+user_states = UserStates(ttl=USER_STATE_TTL)
+
+# Runs the handlers concurrently across chats and in order within each chat
+dispatcher = ChatDispatcher(workers=DISPATCH_WORKERS)
+dispatcher.attach(bot)
 
 #===============================================
 #================= COMMANDS ====================
@@ -30,6 +97,7 @@ def start(message):
     user_states[chat_id] = {'state': None}
     bot.send_message(chat_id, "👋 Welcome! Use the following commands:\n"
                               "/addwatchlist - 📈 Add a token to your watchlist\n"
+                              "/importwatchlist - 📥 Import many tokens at once\n"
                               "/addnotification - 🔔 Add a notification for a token\n"
                               "/viewwatchlist - 📋 View your watchlist\n"
                               "/viewnotifications - 📩 View your notifications\n"
@@ -73,29 +141,28 @@ def process_contract_address(message):
     network = user_states.get(chat_id, {}).get('network', None)
 
     try:
-        # Load the current watchlist
-        watchlist = load_json_file(WATCHLIST_FILE)
-        
         # Check if the token already exists in the watchlist by contract address
-        token_exists = any(token['address'].lower() == contract_address.lower() for token in watchlist.values())
-        
-        if token_exists:
+        if store.find_token_by_address(contract_address):
             bot.send_message(chat_id, "❌ This token is already in your watchlist.")
-            logging.info(f"Attempted to add a token already in the watchlist: {contract_address}")
+            logging.info("Attempted to add a token already in the watchlist: %s", contract_address)
         else:
             # Get token info
             crypto_id, symbol, name = get_token_info(contract_address, network)
 
-            if crypto_id:
+            if crypto_id and store.find_symbol(symbol):
+                bot.send_message(chat_id, f"❌ The symbol {watchlist_key(symbol)} is already used by another token in your watchlist.")
+                logging.info("Symbol %s already in the watchlist for another token: %s", symbol, contract_address)
+            elif crypto_id:
                 # Add token to watchlist
-                watchlist[symbol] = {
-                    'symbol': symbol.upper(),
+                key = watchlist_key(symbol)
+                store.add_token(key, {
+                    'symbol': key,
                     'network': network,
-                    'address': contract_address
-                }
-                save_json_file(WATCHLIST_FILE, watchlist)
-                bot.send_message(chat_id, f"✅ Token added to watchlist: {name} ({symbol.upper()})")
-                logging.info(f"Token added to watchlist: {name} ({symbol.upper()})")
+                    'address': contract_address,
+                    'chat_id': chat_id
+                })
+                bot.send_message(chat_id, f"✅ Token added to watchlist: {name} ({key})")
+                logging.info("Token added to watchlist: %s (%s)", name, key)
             else:
                 bot.send_message(chat_id, "❌ Invalid contract address or token not found.")
                 logging.error("Invalid contract address or token not found for network: %s, contract address: %s", network, contract_address)
@@ -107,12 +174,101 @@ def process_contract_address(message):
         user_states[chat_id]['state'] = None
 
 
+@bot.message_handler(commands=['importwatchlist'])
+def handle_import_watchlist(message):
+    """
+    Initiates a bulk import of tokens into the watchlist.
+    """
+    chat_id = message.chat.id
+    bot.send_message(chat_id, "📥 Send the tokens to import, one per line as network and address "
+                              f"(networks: {', '.join(SUPPORTED_NETWORKS)}), e.g.\n"
+                              "eth 0x514910771AF9Ca656af840dff83E8264EcF986CA\n"
+                              f"You can also upload a CSV or JSON file. Up to {IMPORT_MAX_TOKENS} tokens.")
+    user_states[chat_id] = {'state': 'waiting_for_import'}
+
+@bot.message_handler(content_types=['text', 'document'],
+                     func=lambda message: user_states.get(message.chat.id, {}).get('state') == 'waiting_for_import')
+def process_import(message):
+    """
+    Imports the tokens sent as text or as a file: resolves them in batched
+    concurrent lookups, reports progress by editing a single message and adds
+    the found tokens to the watchlist in one write.
+    """
+    chat_id = message.chat.id
+    try:
+        if message.content_type == 'document':
+            if (message.document.file_size or 0) > IMPORT_MAX_FILE_SIZE:
+                bot.send_message(chat_id, f"❌ The file is too large. The limit is {IMPORT_MAX_FILE_SIZE // 1000} KB.")
+                return
+            text = bot.download_file(bot.get_file(message.document.file_id).file_path).decode('utf-8-sig')
+        else:
+            text = message.text or ''
+
+        try:
+            tokens, invalid = parse_import(text)
+        except ValueError as e:
+            bot.send_message(chat_id, f"❌ {e}")
+            return
+        total = len(tokens) + len(invalid)
+        existing = [token for token in tokens if store.find_token_by_address(token[1])]
+        tokens = [token for token in tokens if token not in existing]
+        if not tokens:
+            bot.send_message(chat_id, f"🛑 Nothing to import: {len(existing)} already in your watchlist, {len(invalid)} invalid.")
+            return
+
+        progress_message = bot.send_message(chat_id, f"⏳ Resolving {len(tokens)} tokens...")
+        last_edit = [time.monotonic()]
+
+        def progress(resolved):
+            if resolved < len(tokens) and time.monotonic() - last_edit[0] >= IMPORT_PROGRESS_INTERVAL:
+                last_edit[0] = time.monotonic()
+                try:
+                    bot.edit_message_text(f"⏳ Resolving tokens: {resolved}/{len(tokens)}", chat_id, progress_message.message_id)
+                except Exception as e:
+                    logging.warning("Failed to update import progress: %s", e)
+
+        results = resolve_tokens(tokens, progress=progress)
+
+        entries, not_found, conflicts = {}, [], []
+        for network, address in tokens:
+            crypto_id, symbol, name = results[(network, address)]
+            if not crypto_id:
+                not_found.append(address)
+                continue
+            if store.find_token_by_address(address):
+                # Added by someone else while the import was resolving
+                existing.append((network, address))
+                continue
+            key = watchlist_key(symbol)
+            if key in entries or store.find_symbol(key):
+                conflicts.append(f"{key} ({address})")
+                continue
+            entries[key] = {'symbol': key, 'network': network, 'address': address, 'chat_id': chat_id}
+        store.add_tokens(entries)
+        store.flush()
+        logging.info("Imported %s tokens for chat %s; %s not found, %s symbol conflicts, %s already watched, %s invalid.",
+                     len(entries), chat_id, len(not_found), len(conflicts), len(existing), len(invalid))
+
+        report = f"✅ Imported {len(entries)} of {total} tokens."
+        for label, items in (("Already in your watchlist", [address for _, address in existing]),
+                             ("Not found", not_found),
+                             ("Symbol already in use", conflicts),
+                             ("Invalid", invalid)):
+            if items:
+                shown = ', '.join(items[:10]) + (f" and {len(items) - 10} more" if len(items) > 10 else '')
+                report += f"\n{label} ({len(items)}): {shown}"
+        bot.edit_message_text(report, chat_id, progress_message.message_id)
+    except Exception as e:
+        logging.error("Error importing watchlist: %s", str(e))
+        bot.send_message(chat_id, "❌ An error occurred while importing the tokens. Please try again later.")
+    finally:
+        user_states[chat_id] = {'state': None}
+
 @bot.message_handler(commands=['addnotification'])
 def handle_add_notification(message):
     chat_id = message.chat.id
-    watchlist = load_json_file(WATCHLIST_FILE)
     
-    if not watchlist:
+    if not store.has_tokens():
         bot.send_message(chat_id, "🛑 Your watchlist is empty. Add tokens to your watchlist first.")
         return
 
@@ -122,19 +278,16 @@ def handle_add_notification(message):
 @bot.message_handler(func=lambda message: user_states.get(message.chat.id, {}).get('state') == 'waiting_for_symbol')
 def process_token_symbol(message):
     chat_id = message.chat.id
-    symbol = message.text.strip().upper()
-    watchlist = load_json_file(WATCHLIST_FILE)
-    
-    token = watchlist.get(symbol)
-    if token:
+    symbol = store.find_symbol(message.text)
+    if symbol:
         user_states[chat_id] = {
             'state': 'waiting_for_notification_details',
             'symbol': symbol
         }
-        bot.send_message(chat_id, f"📝 Enter the notification details for {symbol} (e.g., 'up 10%' or 'down 20%'):")
+        bot.send_message(chat_id, f"📝 Enter the notification details for {symbol} (e.g., 'up 10%' or 'down 20%'):\n{ALERT_FORMATS}")
     else:
         bot.send_message(chat_id, "❌ Token symbol not found in your watchlist.")
-        logging.error("Token symbol not found in watchlist: %s", symbol)
+        logging.error("Token symbol not found in watchlist: %s", message.text.strip())
 
 
 @bot.message_handler(func=lambda message: user_states.get(message.chat.id, {}).get('state') == 'waiting_for_notification_details')
@@ -147,62 +300,98 @@ def process_notification_details(message):
     details = message.text.strip().lower()
     symbol = user_states.get(chat_id, {}).get('symbol')
 
-    logging.info(f"Received notification details: {details} for symbol: {symbol}")
+    logging.info("Received notification details: %s for symbol: %s", details, symbol)
 
     if not symbol:
         bot.send_message(chat_id, "❌ There was an error retrieving your token details. Please try again.")
-        logging.error(f"Error retrieving token details for chat_id: {chat_id}")
+        logging.error("Error retrieving token details for chat_id: %s", chat_id)
+        user_states[chat_id]['state'] = None
+        return
+
+    try:
+        windowed = parse_windowed_alert(details)
+    except ValueError as e:
+        bot.send_message(chat_id, f"❌ That window is too long: alerts can look back at most {MAX_WINDOW_MINUTES} minutes "
+                                  f"({MAX_WINDOW_MINUTES - 1} for moving-average crossovers), e.g. 'up 10% in 60m'. "
+                                  f"Please enter the details again.\n{ALERT_FORMATS}")
+        logging.debug("Rejected windowed alert %r: %s", details, e)
         user_states[chat_id]['state'] = None
         return
 
-    if 'up' in details or 'down' in details:
+    if windowed:
+        notification = {'chat_id': chat_id, 'symbol': symbol, **windowed}
+        store.set_notification(notification_key(chat_id, symbol), notification)
+        bot.send_message(chat_id, f"🔔 Notification set: {symbol} will notify when {describe_alert(notification)}.")
+        logging.info("Windowed notification set for %s: %s", symbol, windowed)
+    elif 'up' in details or 'down' in details:
         parts = details.split()
         if len(parts) == 2 and parts[0] in ['up', 'down'] and parts[1].replace('%', '').isdigit():
             change_type = parts[0]
             threshold_percentage = float(parts[1].replace('%', ''))
 
-            notifications = load_json_file(NOTIFICATIONS_FILE)
-            logging.debug(f"Current notifications before update: {notifications}")
-            
-            notifications[symbol] = {
+            store.set_notification(notification_key(chat_id, symbol), {
                 'chat_id': chat_id,
                 'symbol': symbol,
                 'change_type': change_type,
                 'threshold_percentage': threshold_percentage,
-                'previous_price': get_crypto_price(symbol)
-            }
-
-            logging.debug(f"Updated notifications to be saved: {notifications}")
+                'previous_price': get_crypto_price(symbol),
+                'previous_price_at': time.time()
+            })
 
-            save_json_file(NOTIFICATIONS_FILE, notifications)
             bot.send_message(chat_id, f"🔔 Notification set: {symbol} will notify when price goes {change_type} by {threshold_percentage}%.")
-            logging.info(f"Notification set for {symbol}: {change_type} by {threshold_percentage}%")
+            logging.info("Notification set for %s: %s by %s%%", symbol, change_type, threshold_percentage)
         else:
             bot.send_message(chat_id, "❌ Invalid format. Please enter the details again (e.g., 'up 10%' or 'down 20%').")
-            logging.error(f"Invalid format received for notification details: {details}")
+            logging.error("Invalid format received for notification details: %s", details)
     else:
         bot.send_message(chat_id, "❌ Invalid format. Please enter the details again (e.g., 'up 10%' or 'down 20%').")
-        logging.error(f"Invalid format received for notification details: {details}")
+        logging.error("Invalid format received for notification details: %s", details)
 
     user_states[chat_id]['state'] = None
 
+ALERT_FORMATS = ("Windowed alerts:\n"
+                 "'up 10% in 60m' - change over the last 60 minutes\n"
+                 "'up sma 15m 1h' / 'down ema 15m 1h' - moving-average crossover\n"
+                 "'up breakout 2 60m' - price 2 standard deviations from its 60m mean")
 
+# Fetches the prices of the page after the one shown, so Next answers from the price cache
+page_prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
 
-def get_paginated_watchlist(watchlist, page):
+def prefetch_watchlist_page(pages, page):
     """
-    Returns a paginated list of watchlist items.
+    Warms the price cache for a page in the background. A page requested while its
+    prefetch is still running waits for the same request instead of sending another.
     """
-    start = (page - 1) * ITEMS_PER_PAGE
-    end = start + ITEMS_PER_PAGE
-    items = list(watchlist.items())[start:end]
-    return items
+    if 1 <= page <= len(pages):
+        page_prefetcher.submit(get_token_prices, [token for _, token in pages[page - 1]])
 
-def chunked_watchlist(watchlist, chunk_size):
+def watchlist_page_markup(pages, page):
     """
-    Yields chunks of the watchlist for pagination.
+    Builds the keyboard showing a page of the watchlist with its prices, and starts
+    prefetching the next page.
+
+    Args:
+        pages (tuple): The pages built by Store.watchlist_pages().
+        page (int): The 1-based page to show.
+
+    Returns:
+        types.InlineKeyboardMarkup: The token buttons followed by the navigation row.
     """
-    for i in range(0, len(watchlist), chunk_size):
-        yield dict(list(watchlist.items())[i:i + chunk_size])
+    items = pages[page - 1]
+    prices = get_token_prices(token for _, token in items)
+    prefetch_watchlist_page(pages, page + 1)
+
+    markup = types.InlineKeyboardMarkup()
+    for symbol, token in items:
+        price = prices[price_key(token['network'], token['address'])]
+        button = types.InlineKeyboardButton(f"{token['symbol']} ({token['network'].upper()}):{price}$", callback_data=f"watchlist_{symbol}")
+        markup.add(button)
+
+    next_button = types.InlineKeyboardButton("➡️ Next", callback_data='watchlist_next')
+    prev_button = types.InlineKeyboardButton("⬅️ Previous", callback_data='watchlist_prev')
+    page_button = types.InlineKeyboardButton(f"{page}/{len(pages)}", callback_data='watchlist_page')
+    markup.add(prev_button, page_button, next_button)
+    return markup
 
 @bot.message_handler(commands=['viewwatchlist'])
 def view_watchlist(message):
@@ -211,35 +400,15 @@ def view_watchlist(message):
     Displays the user's watchlist in a paginated manner.
     """
     chat_id = message.chat.id
-    watchlist = load_json_file(WATCHLIST_FILE)
 
-    if not watchlist:
+    if not store.has_tokens():
         bot.send_message(chat_id, "🛑 Your watchlist is empty. Add tokens to your watchlist first.")
         return
 
+    # Only the page number is kept per chat; the store splits the watchlist into
+    # pages once and again after it changes, so every chat sees the current one
     user_states[chat_id] = {'state': 'viewing_watchlist', 'page': 1}
-    show_watchlist_page(chat_id, 1)
-
-def show_watchlist_page(chat_id, page):
-    """
-    Shows a specific page of the watchlist.
-    """
-    watchlist = load_json_file(WATCHLIST_FILE)
-    items = get_paginated_watchlist(watchlist, page)
-    markup = types.InlineKeyboardMarkup()
-
-    if not items:
-        bot.send_message(chat_id, "📄 No more items in your watchlist.")
-        return
-
-    for symbol, token in items:
-        button = types.InlineKeyboardButton(f"{token['symbol']} ({token['network'].upper()}):{get_crypto_price(token['address'])}$", callback_data=f"watchlist_{symbol}")
-        markup.add(button)
-
-    next_button = types.InlineKeyboardButton("➡️ Next", callback_data='watchlist_next')
-    prev_button = types.InlineKeyboardButton("⬅️ Previous", callback_data='watchlist_prev')
-    markup.add(prev_button, next_button)
-    bot.send_message(chat_id, f"📋 Watchlist (Page {page}):", reply_markup=markup)
+    bot.send_message(chat_id, "📋 Watchlist:", reply_markup=watchlist_page_markup(store.watchlist_pages(ITEMS_PER_PAGE), 1))
 
 @bot.message_handler(commands=['viewnotifications'])
 def handle_view_notifications(message):
@@ -247,16 +416,8 @@ def handle_view_notifications(message):
     Sends the user a list of their current notifications.
     """
     chat_id = message.chat.id
-    notifications = load_json_file(NOTIFICATIONS_FILE)
-
-    user_notifications = []
-    for symbol, notif in notifications.items():
-        if notif.get('chat_id') == chat_id:
-            user_notifications.append({
-                'symbol': notif.get('symbol'),
-                'change_type': notif.get('change_type'),
-                'threshold_percentage': notif.get('threshold_percentage')
-            })
+
+    user_notifications = list(store.notifications_for_chat(chat_id).values())
 
     if not user_notifications:
         bot.send_message(chat_id, "🛑 You have no notifications set.")
@@ -264,7 +425,7 @@ def handle_view_notifications(message):
 
     response = "📩 Your Notifications:\n"
     for notif in user_notifications:
-        response += f"{notif['symbol']}: Notify when price goes {notif['change_type']} by {notif['threshold_percentage']}%\n"
+        response += f"{notif.get('symbol')}: Notify when {describe_alert(notif)}\n"
 
     bot.send_message(chat_id, response)
 
@@ -272,18 +433,36 @@ def handle_view_notifications(message):
 @bot.callback_query_handler(func=lambda call: call.data.startswith('watchlist_'))
 def handle_watchlist_navigation(call):
     """
-    Handles navigation through the watchlist pages.
+    Handles navigation through the watchlist pages, updating the keyboard of the
+    watchlist message in place.
     """
     chat_id = call.message.chat.id
     state = user_states.get(chat_id, {})
-    current_page = state.get('page', 1)
+    if 'page' not in state:
+        bot.answer_callback_query(call.id, "⌛ This watchlist view has expired. Use /viewwatchlist again.")
+        return
+    pages = store.watchlist_pages(ITEMS_PER_PAGE)
+    if not pages:
+        bot.answer_callback_query(call.id, "🛑 Your watchlist is empty.")
+        return
 
+    # The watchlist may have shrunk since the page was shown
+    current_page = min(state['page'], len(pages))
     if call.data == 'watchlist_next':
-        show_watchlist_page(chat_id, current_page + 1)
-        user_states[chat_id]['page'] = current_page + 1
-    elif call.data == 'watchlist_prev' and current_page > 1:
-        show_watchlist_page(chat_id, current_page - 1)
-        user_states[chat_id]['page'] = current_page - 1
+        page = current_page + 1
+    elif call.data == 'watchlist_prev':
+        page = current_page - 1
+    else:
+        bot.answer_callback_query(call.id)
+        return
+
+    if not 1 <= page <= len(pages):
+        bot.answer_callback_query(call.id, "📄 No more items in your watchlist.")
+        return
+
+    state['page'] = page
+    bot.answer_callback_query(call.id)
+    bot.edit_message_reply_markup(chat_id, call.message.message_id, reply_markup=watchlist_page_markup(pages, page))
 
 @bot.message_handler(commands=['removewatchlist'])
 def handle_remove_watchlist(message):
@@ -292,9 +471,8 @@ def handle_remove_watchlist(message):
     Prompts the user to enter the token symbol.
     """
     chat_id = message.chat.id
-    watchlist = load_json_file(WATCHLIST_FILE)
 
-    if not watchlist:
+    if not store.has_tokens():
         bot.send_message(chat_id, "🛑 Your watchlist is empty.")
         return
 
@@ -307,23 +485,18 @@ def process_removal_symbol(message):
     Processes the token symbol entered by the user for removal.
     """
     chat_id = message.chat.id
-    symbol = message.text.strip().upper()  # Ensure symbol is uppercase for consistency
-
-    watchlist = load_json_file(WATCHLIST_FILE)
-    notifications = load_json_file(NOTIFICATIONS_FILE)
-
-    if symbol in watchlist:
-        del watchlist[symbol]
-        save_json_file(WATCHLIST_FILE, watchlist)
-
-        # Remove associated notifications
-        to_remove = [key for key, val in notifications.items() if val['symbol'] == symbol]
-        for key in to_remove:
-            del notifications[key]
-        save_json_file(NOTIFICATIONS_FILE, notifications)
-
-        bot.send_message(chat_id, f"✅ {symbol} removed from watchlist and notifications.")
-        logging.info(f"Removed {symbol} from watchlist and notifications.")
+    symbol = store.find_symbol(message.text) or watchlist_key(message.text)
+
+    # Removing a token also removes this chat's notifications on it. The watchlist is
+    # shared, so the token stays in it while other chats still have notifications on it.
+    if store.remove_token(symbol, chat_id=chat_id):
+        if store.get_token(symbol):
+            bot.send_message(chat_id, f"✅ Your notifications for {symbol} were removed. "
+                                      "It stays in the watchlist because other chats still watch it.")
+            logging.info("Removed the notifications of chat %s for %s.", chat_id, symbol)
+        else:
+            bot.send_message(chat_id, f"✅ {symbol} removed from watchlist and notifications.")
+            logging.info("Removed %s from watchlist and notifications.", symbol)
     else:
         bot.send_message(chat_id, "❌ Token symbol not found in your watchlist.")
         logging.error("Token symbol not found in watchlist for removal: %s", symbol)
@@ -338,17 +511,16 @@ def handle_remove_notification(message):
     Shows a list of user notifications to choose from.
     """
     chat_id = message.chat.id
-    notifications = load_json_file(NOTIFICATIONS_FILE)
     
-    user_notifications = {symbol: notif for symbol, notif in notifications.items() if notif.get('chat_id') == chat_id}
+    user_notifications = store.notifications_for_chat(chat_id)
 
     if not user_notifications:
         bot.send_message(chat_id, "🛑 You have no notifications set.")
         return
 
     markup = types.InlineKeyboardMarkup()
-    for symbol, notif in user_notifications.items():
-        markup.add(types.InlineKeyboardButton(f"{notif['symbol']} 🚫", callback_data=f'remove_notification_{symbol}'))
+    for notif in user_notifications.values():
+        markup.add(types.InlineKeyboardButton(f"{notif['symbol']} 🚫", callback_data=f"remove_notification_{notif['symbol']}"))
 
     bot.send_message(chat_id, "📋 Select the notification to remove:", reply_markup=markup)
 
@@ -360,13 +532,11 @@ def handle_remove_notification_callback(call):
     chat_id = call.message.chat.id
     symbol = call.data.split('_')[2]
 
-    notifications = load_json_file(NOTIFICATIONS_FILE)
+    key = notification_key(chat_id, symbol)
     
-    if symbol in notifications and notifications[symbol]['chat_id'] == chat_id:
-        del notifications[symbol]
-        save_json_file(NOTIFICATIONS_FILE, notifications)
+    if store.remove_notification(key):
         bot.send_message(chat_id, f"✅ Notification for {symbol} removed.")
-        logging.info(f"Notification removed for {symbol}")
+        logging.info("Notification removed for %s", symbol)
 
     else:
         bot.send_message(chat_id, "❌ Invalid notification selection.")
@@ -374,94 +544,362 @@ def handle_remove_notification_callback(call):
 
     bot.answer_callback_query(call.id)
 
+# Count and time every handler registered above
+instrument_handlers(bot)
+
+def process_price_updates(prices_by_symbol):
+    """
+    Checks notifications against freshly polled prices and notifies users
+    whose threshold was crossed.
+
+    Crossed notifications are found through the trigger index, so the cost per
+    token does not grow with the number of notifications that did not fire.
+    The reference price of a notification is reset when it fires or once it is
+    POLL_INTERVAL seconds old, so tokens polled more often than that are still
+    compared against the price from roughly one interval ago.
+
+    Args:
+        prices_by_symbol (dict): Current prices in USD (or 'N/A') by watchlist symbol.
+    """
+    now = time.time()
+    for symbol, current_price in prices_by_symbol.items():
+        if current_price == 'N/A':
+            logging.error("Failed to fetch current price for %s.", symbol)
+            continue
+
+        try:
+            current_price = float(current_price)
+        except ValueError:
+            logging.error("Invalid current price for %s: %s", symbol, current_price)
+            continue
+
+        for key, notification, price_change in evaluate_threshold_alerts(
+                trigger_index, store, symbol, current_price, now, POLL_INTERVAL):
+            # Notify the user; the outbox sends it in the background
+            direction = "increased" if notification['change_type'] == 'up' else "decreased"
+            message = f"🔔 {symbol} price has {direction} by {abs(price_change):.2f}%.\nCurrent price: ${current_price:.4f}"
+            alert_sender.send(notification['chat_id'], message)
+            logging.info("Notification queued for %s: %s", symbol, message)
+
+def process_windowed_alerts(token_keys, prices_by_symbol):
+    """
+    Evaluates the windowed alerts (change over time, moving-average crossovers,
+    volatility breakouts) of the polled tokens in one vectorized pass over their
+    price history, and notifies the users whose alerts fired.
+
+    Args:
+        token_keys (dict): Price history keys by symbol of the polled tokens.
+        prices_by_symbol (dict): Current prices in USD (or 'N/A') by symbol.
+    """
+    now = time.time()
+    for key, notification, value in windowed_alerts.evaluate(price_history, token_keys, now):
+        symbol = notification['symbol']
+        detail = {'change': f"{value:+.2f}%", 'breakout': f"{value:+.1f}σ"}.get(notification['kind'])
+        message = f"🔔 {symbol}: {describe_alert(notification)}"
+        message += f" ({detail})." if detail else "."
+        try:
+            message += f"\nCurrent price: ${float(prices_by_symbol.get(symbol)):.4f}"
+        except (TypeError, ValueError):
+            pass
+        alert_sender.send(notification['chat_id'], message)
+        logging.info("Windowed notification queued for %s: %s", symbol, message)
+        store.update_notification(key, fired_at=now)
+
+def watched_tokens(all_shards=False):
+    """
+    Args:
+        all_shards (bool): Include the tokens of other shard workers.
+
+    Returns:
+        dict: (symbol, watchlist entry) by price_key() for every token with a notification.
+              A shard worker only gets the tokens it holds the lease of, unless `all_shards` is set.
+    """
+    # The alert indexes follow the store, so new notifications are picked up on every call
+    symbol_by_key = {}
+    for symbol in trigger_index.symbols() | windowed_alerts.symbols():
+        token = store.get_token(symbol)
+        if not token:
+            logging.warning("No token information found for symbol: %s", symbol)
+            continue
+        key = price_key(token['network'], token['address'])
+        if SHARD_MODE == 'worker' and not all_shards and not shard_coordinator.owns(key):
+            continue
+        symbol_by_key[key] = (symbol, token)
+    return symbol_by_key
+
+@instrumented
+def process_ticks(ticks):
+    """
+    Evaluates the notifications of the tokens in a batch of ticks from the price feed.
+
+    Args:
+        ticks (dict): Prices in USD (or 'N/A') by price_key().
+    """
+    if SHARD_MODE == 'worker':
+        reload_shared_store()
+    symbol_by_key = watched_tokens()
+    ticks = {key: price for key, price in ticks.items() if key in symbol_by_key}
+    price_history.record_many(ticks)
+
+    prices_by_symbol = {symbol_by_key[key][0]: price for key, price in ticks.items()}
+    process_price_updates(prices_by_symbol)
+    process_windowed_alerts({symbol_by_key[key][0]: key for key in ticks}, prices_by_symbol)
+    store.flush()
+    save_price_history()
+
+def trigger_distances(ticks):
+    """
+    Returns how far each polled token is from its nearest trigger, which the
+    polling feed uses together with the token's volatility to schedule its next poll.
+
+    Args:
+        ticks (dict): Prices in USD (or 'N/A') by price_key().
+
+    Returns:
+        dict: Distances (see nearest_trigger_distance()) by price_key().
+    """
+    symbol_by_key = watched_tokens()
+    windowed_symbols = windowed_alerts.symbols()
+    distances = {}
+    for key, price in ticks.items():
+        if key not in symbol_by_key:
+            continue
+        try:
+            price = float(price)
+        except ValueError:
+            continue
+        symbol = symbol_by_key[key][0]
+        if symbol in windowed_symbols:
+            # Windowed alerts need minute-level history, so treat the token as close to a trigger
+            distances[key] = 0.0
+        else:
+            distances[key] = nearest_trigger_distance(price, *trigger_index.nearest_triggers(symbol))
+    return distances
+
+def create_price_feed():
+    """
+    Creates the price feed selected by PRICE_FEED.
+    """
+    def tokens():
+        return {key: token for key, (_, token) in watched_tokens().items()}
+
+    if PRICE_FEED == 'stream':
+        if not PRICE_STREAM_URL:
+            raise ValueError("PRICE_FEED=stream requires PRICE_STREAM_URL to be set")
+        return StreamingFeed(tokens, process_ticks, PRICE_STREAM_URL, flush_interval=STREAM_FLUSH_INTERVAL)
+    # The poller ticks at the shortest interval; each tick polls only the tokens that are due
+    return PollingFeed(tokens, process_ticks, price_scheduler, trigger_distances,
+                       interval=POLL_MIN_INTERVAL, concurrency=POLL_CONCURRENCY)
+
+def reload_shared_store(force=False):
+    """
+    Picks up notification changes made by the sender and the other workers.
+
+    A shard worker writes its own changes and reloads the shared store every
+    SHARD_RELOAD_INTERVAL seconds, and right after acquiring token leases, so
+    that alerts taken over from another worker start from that worker's last state.
+    """
+    global store_reloaded_at
+    now = time.monotonic()
+    if force or shard_rebalanced.is_set() or now - store_reloaded_at >= SHARD_RELOAD_INTERVAL:
+        shard_rebalanced.clear()
+        store.flush()
+        store.reload()
+        store_reloaded_at = now
+
+def create_shard_coordinator():
+    """
+    Creates the shard coordinator for SHARD_MODE, or returns None when not sharded.
+    """
+    if not SHARD_MODE:
+        return None
+    if SHARD_MODE not in ('worker', 'sender'):
+        raise ValueError(f"Unknown SHARD_MODE: {SHARD_MODE}")
+    if STORAGE_BACKEND != 'sqlite':
+        raise ValueError("SHARD_MODE requires STORAGE_BACKEND=sqlite so all processes share one store")
+    return ShardCoordinator(SHARD_DB_FILE, worker_id=SHARD_WORKER_ID if SHARD_MODE == 'worker' else None,
+                            heartbeat_interval=SHARD_HEARTBEAT_INTERVAL, worker_ttl=SHARD_WORKER_TTL)
+
+def save_price_history(force=False):
+    """
+    Snapshots the price history to disk at most every HISTORY_SAVE_INTERVAL seconds.
+    """
+    global history_saved_at
+    now = time.monotonic()
+    if force or now - history_saved_at >= HISTORY_SAVE_INTERVAL:
+        price_history.save()
+        history_saved_at = now
+
+trigger_index = TriggerIndex()
+windowed_alerts = WindowedAlerts()
+history_saved_at = time.monotonic()
+outbox = MessageOutbox(bot.send_message, global_rate=OUTBOX_GLOBAL_RATE, chat_rate=OUTBOX_CHAT_RATE,
+                       chat_burst=OUTBOX_CHAT_BURST, merge_window=OUTBOX_MERGE_WINDOW)
+trigger_index_attached = threading.Event()
+shard_coordinator = create_shard_coordinator()
+shard_rebalanced = threading.Event()
+store_reloaded_at = time.monotonic()
+# Shard workers hand their alerts to the sender process instead of sending them
+alert_sender = shard_coordinator if SHARD_MODE == 'worker' else outbox
+price_scheduler = AdaptiveScheduler(base_interval=POLL_INTERVAL, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL)
+price_feed = create_price_feed()
+
+registry.gauge('pricetracker_http', "HTTP client counters, see get_http_stats().", get_http_stats, label='stat')
+registry.gauge('pricetracker_outbox', "Outgoing message counters, see MessageOutbox.stats().", outbox.stats, label='stat')
+registry.gauge('pricetracker_price_cache_entries', "Prices held by the price cache.", lambda: len(price_cache))
+registry.gauge('pricetracker_user_states', "Chats with a conversation state.", lambda: len(user_states))
+registry.gauge('pricetracker_dispatch_pending', "Updates waiting behind another update of their chat.", dispatcher.pending)
+
+def start_metrics():
+    """
+    Starts the metrics endpoint if METRICS_PORT is set and the profiler if PROFILE_FILE is set.
+
+    Returns:
+        tuple: The MetricsServer and the SamplingProfiler, each None when disabled.
+    """
+    server = profiler = None
+    if METRICS_PORT:
+        server = MetricsServer(host=METRICS_HOST, port=METRICS_PORT)
+        server.start()
+    if PROFILE_FILE:
+        profiler = SamplingProfiler()
+        profiler.start()
+    return server, profiler
+
+def stop_metrics(server, profiler):
+    """
+    Stops what start_metrics() started, writing the profile to PROFILE_FILE.
+    """
+    if profiler is not None:
+        profiler.stop()
+        profiler.dump(PROFILE_FILE)
+    if server is not None:
+        server.shutdown()
+
+def attach_alert_indexes():
+    """
+    Loads the alert indexes from the store and keeps them in step with every
+    notification change. Does nothing when they are already attached.
+    """
+    if not trigger_index_attached.is_set():
+        store.add_listener(trigger_index.update)
+        store.add_listener(windowed_alerts.update)
+        trigger_index_attached.set()
+
 def poll_prices():
     """
-    Periodically polls the prices of tokens in the watchlist and triggers notifications
-    if the price change exceeds the set threshold.
+    Receives the prices of tokens in the watchlist from the price feed and triggers
+    notifications if the price change exceeds the set threshold. Blocks until
+    price_feed.stop() is called.
     """
     logging.info("Starting price polling service.")
-    watchlist = load_json_file(WATCHLIST_FILE)
-    notifications = load_json_file(NOTIFICATIONS_FILE)
-    logging.debug(f"Initial watchlist: {watchlist}")
-    logging.debug(f"Initial notifications: {notifications}")
-
-    while True:
-        for symbol, notification in notifications.items():
-            try:
-                chat_id = notification['chat_id']
-                change_type = notification['change_type']
-                threshold_percentage = notification['threshold_percentage']
-                previous_price = notification.get('previous_price')
-
-                # Get current price using the token's address from the watchlist
-                token_info = watchlist.get(symbol)
-                if not token_info:
-                    logging.warning(f"No token information found for symbol: {symbol}")
-                    continue
-
-                current_price = get_crypto_price(token_info['address'])
-
-                if current_price == 'N/A':
-                    logging.error(f"Failed to fetch current price for {symbol}.")
-                    continue
-
-                try:
-                    current_price = float(current_price)
-                except ValueError:
-                    logging.error(f"Invalid current price for {symbol}: {current_price}")
-                    continue
-
-                try:
-                    previous_price = float(previous_price)
-                except (TypeError, ValueError):
-                    # Initialize previous price on first run
-                    previous_price = None
-
-                if previous_price is None:
-                    # Initializing previous_price if it's the first time polling
-                    notification['previous_price'] = current_price
-                    save_json_file(NOTIFICATIONS_FILE, notifications)
-                    continue
-
-                price_change = (current_price - previous_price) / previous_price * 100
-                logging.debug(f"Price change for {symbol}: {price_change:.2f}%")
-
-                if ((change_type == 'up' and price_change >= threshold_percentage) or
-                    (change_type == 'down' and price_change <= -threshold_percentage)):
-                    # Notify the user
-                    direction = "increased" if change_type == 'up' else "decreased"
-                    message = f"🔔 {symbol} price has {direction} by {abs(price_change):.2f}%.\nCurrent price: ${current_price:.4f}"
-                    bot.send_message(chat_id, message)
-                    logging.info(f"Notification sent for {symbol}: {message}")
-
-                # Update previous price
-                notification['previous_price'] = current_price
-
-            except Exception as e:
-                logging.error(f"Error processing notification for {symbol}: {e}")
-
-        save_json_file(NOTIFICATIONS_FILE, notifications)
-        time.sleep(300) # 5 minutes
+    attach_alert_indexes()
+    if SHARD_MODE != 'worker':
+        outbox.start()
+    price_feed.run()
+
+def run_worker():
+    """
+    Runs a shard worker: polls the tokens assigned to it until interrupted and
+    queues triggered alerts for the sender process.
+    """
+    logging.info("Starting shard worker %s.", SHARD_WORKER_ID)
+    # The first heartbeat takes its leases from the tokens the indexes know about
+    attach_alert_indexes()
+    shard_coordinator.start(keys=lambda: watched_tokens(all_shards=True),
+                            on_acquire=lambda keys: shard_rebalanced.set(),
+                            before_release=store.flush)
+    try:
+        poll_prices()
+    except KeyboardInterrupt:
+        logging.info("Shard worker stopped.")
+    finally:
+        # Persist the alert state before the leases are handed to other workers
+        price_feed.stop()
+        store.flush()
+        shard_coordinator.stop()
+        price_history.close()
+        save_warm_state(price_scheduler)
+
+def run_bot():
+    """
+    Receives updates in the configured BOT_MODE until stopped. Returns normally on
+    a clean stop and raises on errors.
+    """
+    if BOT_MODE == 'webhook':
+        server = WebhookServer(bot, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                               secret_token=WEBHOOK_SECRET)
+        if WEBHOOK_URL:
+            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+        try:
+            server.serve_forever()
+        finally:
+            server.shutdown()
+    else:
+        # Telegram refuses getUpdates while a webhook is set, e.g. after running in webhook mode
+        bot.remove_webhook()
+        bot.polling(none_stop=True)
 
 def main():
+    configure_logging()
+    metrics_server, profiler = start_metrics()
+    # Resume with the prices and polling schedule of the previous run
+    load_warm_state(price_scheduler)
+    if SHARD_MODE == 'worker':
+        run_worker()
+        stop_metrics(metrics_server, profiler)
+        return
+
     logging.info("Starting the bot and price polling service.")
     
-    # Start the poll_prices function in a separate thread
-    price_polling_thread = threading.Thread(target=poll_prices)
+    if SHARD_MODE == 'sender':
+        # Shard workers poll the prices; this process relays their alerts to Telegram
+        outbox.start()
+        price_polling_thread = threading.Thread(target=shard_coordinator.relay_messages, args=(outbox.send,))
+    else:
+        # Start the poll_prices function in a separate thread
+        price_polling_thread = threading.Thread(target=poll_prices)
     price_polling_thread.daemon = True
     price_polling_thread.start()
     
-    # Start the bot's polling
-    try:
-        bot.polling(none_stop=True)
-    except KeyboardInterrupt:
-        logging.info("Bot stopped.")
-    except ConnectionError as e:
-        logging.error(f"ConnectionError occurred: {e}. Restart in 15 seconds...")
-        time.sleep(15)
-        main()
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}.")
+    # Supervise the bot, restarting it after errors with an exponential backoff.
+    # Connection failures surface as requests or telebot exceptions, so anything
+    # but an explicit stop is retried.
+    delay = RESTART_DELAY
+    while True:
+        started = time.monotonic()
+        try:
+            run_bot()
+            break
+        except (KeyboardInterrupt, SystemExit):
+            logging.info("Bot stopped.")
+            break
+        except Exception as e:
+            if time.monotonic() - started > RESTART_MAX_DELAY:
+                # The bot ran fine for a while, so this is a new failure rather than a repeated one
+                delay = RESTART_DELAY
+            logging.error("Bot stopped with %s: %s. Restart in %s seconds...", type(e).__name__, e, delay)
+            try:
+                time.sleep(delay)
+            except KeyboardInterrupt:
+                logging.info("Bot stopped.")
+                break
+            delay = min(delay * 2, RESTART_MAX_DELAY)
+
+    # Finish the updates already received, stop the price feed gracefully,
+    # deliver queued alerts and persist any pending changes
+    dispatcher.shutdown(wait=True)
+    page_prefetcher.shutdown(wait=False)
+    if SHARD_MODE == 'sender':
+        shard_coordinator.stop()
+    else:
+        price_feed.stop()
+    price_polling_thread.join(timeout=30)
+    outbox.stop(timeout=30)
+    store.flush()
+    price_history.close()
+    save_warm_state(price_scheduler if SHARD_MODE != 'sender' else None)
+    stop_metrics(metrics_server, profiler)
 
 
 if __name__ == "__main__":
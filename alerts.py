@@ -0,0 +1,266 @@
+import heapq
+import bisect
+import logging
+import threading
+
+#===============================================
+#================= TRIGGER PRICES ==============
+#===============================================
+
+def trigger_price(change_type, threshold_percentage, reference_price):
+    """
+    Converts a relative alert into the absolute price that fires it.
+
+    Args:
+        change_type (str): 'up' or 'down'.
+        threshold_percentage (float): The alert threshold, e.g. 10.0 for 10%.
+        reference_price (float): The price the change is measured from.
+
+    Returns:
+        float: The trigger price, or None if the alert cannot be evaluated.
+    """
+    try:
+        reference_price = float(reference_price)
+        threshold = float(threshold_percentage) / 100
+    except (TypeError, ValueError):
+        return None
+    if reference_price <= 0:
+        return None
+    if change_type == 'up':
+        return reference_price * (1 + threshold)
+    if change_type == 'down':
+        return reference_price * (1 - threshold)
+    return None
+
+def is_triggered(change_type, threshold_percentage, reference_price, price):
+    """
+    Checks a single alert the naive way, by computing the percentage change.
+
+    Returns:
+        bool: True if the move from `reference_price` to `price` crosses the threshold.
+    """
+    price_change = (price - reference_price) / reference_price * 100
+    return ((change_type == 'up' and price_change >= threshold_percentage) or
+            (change_type == 'down' and price_change <= -threshold_percentage))
+
+#===============================================
+#================= TRIGGER INDEX ===============
+#===============================================
+
+class _SortedTriggers:
+    """
+    Trigger prices of one side ('up' or 'down') of one token, kept sorted.
+    """
+
+    def __init__(self):
+        self.prices = []
+        self.keys = []
+
+    def add(self, price, key):
+        index = bisect.bisect_right(self.prices, price)
+        self.prices.insert(index, price)
+        self.keys.insert(index, key)
+
+    def remove(self, price, key):
+        index = bisect.bisect_left(self.prices, price)
+        while index < len(self.prices) and self.prices[index] == price:
+            if self.keys[index] == key:
+                del self.prices[index]
+                del self.keys[index]
+                return
+            index += 1
+
+class TriggerIndex:
+    """
+    Index of alert trigger prices for fast evaluation of price updates.
+
+    Every alert is stored as an absolute trigger price in one of two sorted
+    lists per token: upper bounds for 'up' alerts and lower bounds for 'down'
+    alerts. A new price fires every upper bound at or below it and every lower
+    bound at or above it, both found with a single bisect, so evaluating a tick
+    costs O(log n) plus the number of alerts fired.
+
+    The index also tracks alerts that have no reference price yet and, with a
+    heap ordered by `previous_price_at`, alerts whose reference price is due to
+    be reset.
+    """
+
+    def __init__(self):
+        self._upper = {}          # symbol -> _SortedTriggers of 'up' alerts
+        self._lower = {}          # symbol -> _SortedTriggers of 'down' alerts
+        self._uninitialized = {}  # symbol -> set of alert keys without a reference price
+        self._reset_heaps = {}    # symbol -> heap of (previous_price_at, key)
+        self._alerts = {}         # key -> (symbol, side, trigger, previous_price_at)
+        self._counts = {}         # symbol -> number of alerts
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._alerts)
+
+    def symbols(self):
+        """
+        Returns:
+            set: The symbols that have at least one alert.
+        """
+        with self._lock:
+            return set(self._counts)
+
+    def _remove(self, key):
+        # Must be called with the lock held
+        entry = self._alerts.pop(key, None)
+        if entry is None:
+            return
+        symbol, side, trigger, _ = entry
+        self._counts[symbol] -= 1
+        if not self._counts[symbol]:
+            del self._counts[symbol]
+            self._reset_heaps.pop(symbol, None)
+        if side is None:
+            self._uninitialized[symbol].discard(key)
+            if not self._uninitialized[symbol]:
+                del self._uninitialized[symbol]
+        else:
+            sides = self._upper if side == 'up' else self._lower
+            sides[symbol].remove(trigger, key)
+            if not sides[symbol].prices:
+                del sides[symbol]
+        # Reset heap entries are dropped lazily once they no longer match _alerts
+
+    def update(self, key, notification):
+        """
+        Adds, replaces or (when `notification` is None) removes an alert.
+        Notifications of other kinds, such as windowed alerts, are not indexed.
+
+        Suitable as a Store listener.
+
+        Args:
+            key (str): The notification key.
+            notification (dict): The notification, or None if it was removed.
+        """
+        with self._lock:
+            self._remove(key)
+            if notification is None or notification.get('kind', 'threshold') != 'threshold':
+                return
+            symbol = notification['symbol']
+            self._counts[symbol] = self._counts.get(symbol, 0) + 1
+            change_type = notification.get('change_type')
+            trigger = trigger_price(change_type, notification.get('threshold_percentage'), notification.get('previous_price'))
+            reference_at = notification.get('previous_price_at', 0)
+
+            if trigger is None:
+                self._alerts[key] = (symbol, None, None, reference_at)
+                self._uninitialized.setdefault(symbol, set()).add(key)
+                return
+
+            sides = self._upper if change_type == 'up' else self._lower
+            sides.setdefault(symbol, _SortedTriggers()).add(trigger, key)
+            self._alerts[key] = (symbol, change_type, trigger, reference_at)
+            heapq.heappush(self._reset_heaps.setdefault(symbol, []), (reference_at, key))
+
+    def crossed(self, symbol, price):
+        """
+        Returns the alerts of `symbol` fired by `price`.
+
+        Args:
+            symbol (str): The token symbol.
+            price (float): The new price.
+
+        Returns:
+            list: The keys of every 'up' alert with a trigger at or below `price`
+                  and every 'down' alert with a trigger at or above it.
+        """
+        with self._lock:
+            fired = []
+            upper = self._upper.get(symbol)
+            if upper:
+                fired.extend(upper.keys[:bisect.bisect_right(upper.prices, price)])
+            lower = self._lower.get(symbol)
+            if lower:
+                fired.extend(lower.keys[bisect.bisect_left(lower.prices, price):])
+            return fired
+
+    def nearest_triggers(self, symbol):
+        """
+        Returns:
+            tuple: The lowest 'up' trigger and the highest 'down' trigger of `symbol`,
+                   each None if the token has no alert of that kind.
+        """
+        with self._lock:
+            upper = self._upper.get(symbol)
+            lower = self._lower.get(symbol)
+            return (upper.prices[0] if upper else None), (lower.prices[-1] if lower else None)
+
+    def uninitialized(self, symbol):
+        """
+        Returns:
+            list: Keys of the alerts of `symbol` that have no reference price yet.
+        """
+        with self._lock:
+            return list(self._uninitialized.get(symbol, ()))
+
+    def expired(self, symbol, cutoff):
+        """
+        Returns the alerts of `symbol` whose reference price was set before `cutoff`.
+
+        Args:
+            symbol (str): The token symbol.
+            cutoff (float): Timestamp; references older than this are expired.
+
+        Returns:
+            list: The expired alert keys. They are not reported again until
+                  their reference price is updated.
+        """
+        with self._lock:
+            heap = self._reset_heaps.get(symbol)
+            keys = {}
+            while heap and heap[0][0] < cutoff:
+                reference_at, key = heapq.heappop(heap)
+                entry = self._alerts.get(key)
+                if entry and entry[0] == symbol and entry[3] == reference_at:
+                    keys[key] = None
+            if heap is not None and not heap:
+                del self._reset_heaps[symbol]
+            return list(keys)
+
+#===============================================
+#================= EVALUATION ==================
+#===============================================
+
+def evaluate_threshold_alerts(index, store, symbol, price, now, reset_interval):
+    """
+    Applies a polled price to the threshold alerts of one token.
+
+    Alerts crossed by `price` fire and take it as their new reference price.
+    Alerts without a reference price yet, and those whose reference is older
+    than `reset_interval` seconds, are reset to it.
+
+    Args:
+        index (TriggerIndex): The index, kept in step with `store` by a listener.
+        store (Store): Holds the notifications.
+        symbol (str): The watchlist symbol of the token.
+        price (float): The polled price.
+        now (float): Timestamp of the poll.
+        reset_interval (float): Age in seconds after which a reference price is reset.
+
+    Returns:
+        list: (key, notification, price_change) of every alert that fired, with
+              the notification as it was before firing and the change in percent.
+    """
+    fired = []
+    for key in index.crossed(symbol, price):
+        try:
+            notification = store.get_notification(key)
+            if not notification:
+                continue
+            previous_price = float(notification['previous_price'])
+            price_change = (price - previous_price) / previous_price * 100
+            store.update_notification(key, previous_price=price, previous_price_at=now)
+        except Exception as e:
+            logging.error("Error processing notification %s: %s", key, e)
+            continue
+        fired.append((key, notification, price_change))
+
+    for key in index.uninitialized(symbol) + index.expired(symbol, now - reset_interval):
+        store.update_notification(key, previous_price=price, previous_price_at=now)
+    return fired
@@ -0,0 +1,286 @@
+"""
+Load test of the whole bot against local fakes of DEX Screener and Telegram
+(see fakes.py), to get a baseline for catching performance regressions.
+
+A synthetic dataset of watchlist tokens and alerts spread over many users is
+written to a temporary directory. The benchmark then measures:
+  - poll_prices() cycles polling every token: cycle time, DEX Screener
+    requests per cycle and alerts fired,
+  - get_token_info() on unknown and on already resolved addresses,
+  - the command handlers, /viewwatchlist paging included, driven by
+    synthetic users: p50/p99 latency per handler,
+  - throughput of updates through the dispatcher,
+and reports the peak RSS of the process.
+
+Usage:
+    python benchmarks/bench_bot.py [--tokens 10000] [--alerts 100000] [--users 1000]
+                                   [--latency 0.02] [--error-rate 0.01] [--pairs 3]
+                                   [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+from fakes import FakeDexScreener, FakeTelegram
+
+#===============================================
+#================= DATASET =====================
+#===============================================
+
+def token_address(i):
+    return f"0x{i:040x}"
+
+def write_dataset(directory, tokens, alerts, users, seed=42):
+    """
+    Writes watchlist.json and notifications.json with `tokens` tokens and `alerts`
+    threshold alerts spread over `users` chats, at most one per chat and token.
+    """
+    rng = random.Random(seed)
+    watchlist = {f"T{i}": {'symbol': f"T{i}", 'network': 'eth', 'address': token_address(i)} for i in range(tokens)}
+    alerts = min(alerts, tokens * users)
+    notifications = {}
+    while len(notifications) < alerts:
+        chat_id = 1000 + rng.randrange(users)
+        symbol = f"T{rng.randrange(tokens)}"
+        notifications[f"{chat_id}:{symbol}"] = {
+            'chat_id': chat_id,
+            'symbol': symbol,
+            'change_type': rng.choice(('up', 'down')),
+            'threshold_percentage': float(rng.randint(2, 30)),
+            'previous_price': 1.0,
+            'previous_price_at': time.time(),
+        }
+    for name, data in (('watchlist.json', watchlist), ('notifications.json', notifications)):
+        with open(os.path.join(directory, name), 'w') as f:
+            json.dump(data, f)
+    return watchlist, notifications
+
+#===============================================
+#================= MEASUREMENT =================
+#===============================================
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+def summarize(samples):
+    return {
+        'count': len(samples),
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': max(samples, default=0.0) * 1000,
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def timed(samples, function, *args):
+    started = time.perf_counter()
+    function(*args)
+    samples.append(time.perf_counter() - started)
+
+#===============================================
+#================= SCENARIOS ===================
+#===============================================
+
+def bench_poll_cycles(P, dex, cycles):
+    """
+    Runs poll_prices() for `cycles` cycles in which every token is due.
+    """
+    from feeds import PollingFeed
+    from scheduler import AdaptiveScheduler
+
+    # A clock jumping past the longest interval every cycle makes all tokens due each time
+    clock = [0.0]
+    scheduler = AdaptiveScheduler(base_interval=P.POLL_INTERVAL, min_interval=P.POLL_MIN_INTERVAL,
+                                  max_interval=P.POLL_MAX_INTERVAL, clock=lambda: clock[0])
+    feed = PollingFeed(lambda: {key: token for key, (_, token) in P.watched_tokens().items()},
+                       P.process_ticks, scheduler, P.trigger_distances,
+                       interval=0.01, concurrency=P.POLL_CONCURRENCY)
+    results = []
+    cycle = feed.poller.cycle
+
+    async def measured_cycle(poller):
+        requests, queued = dex.requests, P.outbox.stats()['queued']
+        started = time.perf_counter()
+        await cycle(poller)
+        results.append({
+            'seconds': time.perf_counter() - started,
+            'requests': dex.requests - requests,
+            'alerts': P.outbox.stats()['queued'] - queued,
+        })
+        clock[0] += P.POLL_MAX_INTERVAL + 1
+        if len(results) >= cycles:
+            feed.stop()
+
+    feed.poller.cycle = measured_cycle
+    P.price_feed = feed
+    P.poll_prices()
+    return results
+
+def bench_token_info(utils, dex, count, first):
+    """
+    Resolves `count` addresses unknown to the metadata cache, then the same ones again.
+    """
+    addresses = [token_address(first + i) for i in range(count)]
+    report = {}
+    for name in ('cold', 'warm'):
+        samples, requests = [], dex.requests
+        for address in addresses:
+            timed(samples, utils.get_token_info, address, 'eth')
+        report[name] = dict(summarize(samples), requests=dex.requests - requests)
+    return report
+
+def bench_handlers(P, telegram, users, watchlist):
+    """
+    Runs a session of commands for every user and measures each handler.
+    """
+    from telebot import types
+
+    def message(chat_id, text):
+        return types.Message.de_json({
+            'message_id': 1, 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'bench'},
+        })
+
+    def callback(chat_id, data, message_id):
+        return types.CallbackQuery.de_json({
+            'id': str(chat_id), 'data': data, 'chat_instance': str(chat_id),
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'bench'},
+            'message': {'message_id': message_id, 'date': int(time.time()),
+                        'chat': {'id': chat_id, 'type': 'private'}},
+        })
+
+    symbols = list(watchlist)
+    samples = {}
+    requests = telegram.requests
+    for chat_id in users:
+        symbol = random.Random(chat_id).choice(symbols)
+        session = [
+            ('start', P.start, message(chat_id, '/start')),
+            ('viewnotifications', P.handle_view_notifications, message(chat_id, '/viewnotifications')),
+            ('viewwatchlist', P.view_watchlist, message(chat_id, '/viewwatchlist')),
+            ('watchlist_next', P.handle_watchlist_navigation, callback(chat_id, 'watchlist_next', 1)),
+            ('watchlist_next', P.handle_watchlist_navigation, callback(chat_id, 'watchlist_next', 1)),
+            ('watchlist_prev', P.handle_watchlist_navigation, callback(chat_id, 'watchlist_prev', 1)),
+            ('addnotification', P.handle_add_notification, message(chat_id, '/addnotification')),
+            ('notification_symbol', P.process_token_symbol, message(chat_id, symbol)),
+            ('notification_details', P.process_notification_details, message(chat_id, 'up 10%')),
+        ]
+        for name, handler, update in session:
+            timed(samples.setdefault(name, []), handler, update)
+    report = {name: summarize(values) for name, values in samples.items()}
+    report['telegram_requests'] = telegram.requests - requests
+    return report
+
+def bench_dispatch(P, users, rounds=5):
+    """
+    Pushes /start updates of every user through the dispatcher and waits for them.
+    """
+    from telebot import types
+
+    updates = [types.Update.de_json({
+        'update_id': i,
+        'message': {'message_id': i, 'date': int(time.time()), 'text': '/start',
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': {'id': chat_id, 'is_bot': False, 'first_name': 'bench'}},
+    }) for i, chat_id in enumerate(chat_id for _ in range(rounds) for chat_id in users)]
+    started = time.perf_counter()
+    P.bot.process_new_updates(updates)
+    P.dispatcher.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+    return {'updates': len(updates), 'seconds': elapsed, 'updates_per_second': len(updates) / elapsed}
+
+#===============================================
+#================= MAIN ========================
+#===============================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tokens', type=int, default=10000, help="watchlist tokens")
+    parser.add_argument('--alerts', type=int, default=100000, help="threshold alerts")
+    parser.add_argument('--users', type=int, default=1000, help="chats owning the alerts")
+    parser.add_argument('--cycles', type=int, default=3, help="poll cycles to run")
+    parser.add_argument('--session-users', type=int, default=200, help="users running the handler session")
+    parser.add_argument('--lookups', type=int, default=200, help="addresses resolved by get_token_info")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds added to every fake API response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of DEX Screener requests failing with 503")
+    parser.add_argument('--pairs', type=int, default=3, help="pairs returned per token")
+    parser.add_argument('--json', help="also write the results to this file")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp(prefix='bench-bot-')
+    watchlist, notifications = write_dataset(directory, args.tokens, args.alerts, args.users)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    # The bot keeps its files in the working directory and reads its settings on import
+    os.chdir(directory)
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:bench')
+    os.environ.update(PRICE_FEED='polling', STORAGE_BACKEND='json', SHARD_MODE='')
+    dex = FakeDexScreener(latency=args.latency, error_rate=args.error_rate, pairs=args.pairs).start()
+    telegram = FakeTelegram(latency=args.latency).start()
+
+    import telebot
+    telebot.apihelper.API_URL = telegram.api_url
+    import utils
+    utils.DEXSCREENER_TOKENS_URL = dex.tokens_url
+    started = time.perf_counter()
+    import PriceTracker as P
+    import_seconds = time.perf_counter() - started
+
+    print(f"Dataset: {len(watchlist)} tokens, {len(notifications)} alerts, {args.users} users in {directory}")
+    results = {
+        'dataset': {'tokens': len(watchlist), 'alerts': len(notifications), 'users': args.users},
+        'import_seconds': import_seconds,
+    }
+
+    cycles = bench_poll_cycles(P, dex, args.cycles)
+    results['poll_cycles'] = cycles
+    for i, cycle in enumerate(cycles, 1):
+        print(f"poll cycle {i}: {cycle['seconds']:8.2f} s | {cycle['requests']:6} requests | {cycle['alerts']:6} alerts")
+
+    results['get_token_info'] = bench_token_info(utils, dex, args.lookups, first=args.tokens)
+    for name, report in results['get_token_info'].items():
+        print(f"get_token_info {name:>4}: p50 {report['p50_ms']:8.2f} ms | p99 {report['p99_ms']:8.2f} ms | {report['requests']} requests")
+
+    session_users = [1000 + i for i in range(min(args.session_users, args.users))]
+    results['handlers'] = bench_handlers(P, telegram, session_users, watchlist)
+    for name, report in results['handlers'].items():
+        if isinstance(report, dict):
+            print(f"{name:>22}: p50 {report['p50_ms']:8.2f} ms | p99 {report['p99_ms']:8.2f} ms | n={report['count']}")
+
+    results['dispatch'] = bench_dispatch(P, session_users)
+    print(f"dispatch: {results['dispatch']['updates']} updates at {results['dispatch']['updates_per_second']:.0f} updates/s")
+
+    P.outbox.stop(timeout=1)
+    P.store.flush()
+    results['dex_requests'] = dex.requests
+    results['dex_errors'] = dex.errors
+    results['telegram_methods'] = dict(telegram.methods)
+    results['peak_rss_mb'] = peak_rss_mb()
+    print(f"DEX Screener requests: {dex.requests} ({dex.errors} failed) | Telegram calls: {telegram.methods}")
+    print(f"peak RSS: {results['peak_rss_mb']:.1f} MB")
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    dex.stop()
+    telegram.stop()
+
+if __name__ == "__main__":
+    main()
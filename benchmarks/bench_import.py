@@ -0,0 +1,128 @@
+"""
+Checks that importing utils stays cheap and free of side effects, so tools and
+scripts using its helpers do not pay for the bot's startup.
+
+Every run imports utils in a fresh interpreter, in a working directory holding
+the data files of a running bot (watchlist, notifications, token metadata,
+price history and a .env file), and fails if the median import time exceeds the
+budget, if the Telegram client, the store or the price history was created,
+if logging was configured or the .env file loaded, if a data file was mapped,
+or if files were created or modified.
+
+Usage:
+    python benchmarks/bench_import.py [--budget 0.5] [--runs 5] [--module utils]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# Variable set by the .env file of the working directory
+ENV_MARKER = 'PRICETRACKER_IMPORT_CHECK'
+
+# Seconds; the import is dominated by requests and its dependencies
+IMPORT_BUDGET = 0.5
+
+CHILD = """
+import os, sys, json, time, logging
+started = time.perf_counter()
+module = __import__(sys.argv[1])
+seconds = time.perf_counter() - started
+print(json.dumps({
+    'seconds': seconds,
+    'bot_created': getattr(module, '_bot', None) is not None,
+    'telebot_imported': 'telebot' in sys.modules,
+    'logging_configured': bool(logging.getLogger().handlers),
+    'store_created': getattr(module, '_store', None) is not None,
+    'history_created': getattr(module, '_price_history', None) is not None,
+    'dotenv_loaded': sys.argv[2] in os.environ,
+    # Memory-mapped files of the working directory, where /proc is available
+    'mapped_files': sorted({line.split()[-1] for line in open('/proc/self/maps')
+                            if line.split()[-1].startswith(os.getcwd())})
+                    if os.path.exists('/proc/self/maps') else [],
+}))
+"""
+
+def write_data_files(directory):
+    """
+    Writes the files a running bot keeps in its working directory.
+    """
+    from history import PriceHistory
+
+    key = ('eth', '0x' + '1' * 40)
+    files = {
+        'watchlist.json': {'T': {'symbol': 'T', 'network': key[0], 'address': key[1]}},
+        'notifications.json': {'1:T': {'chat_id': 1, 'symbol': 'T', 'change_type': 'up',
+                                       'threshold_percentage': 10.0, 'previous_price': 1.0, 'previous_price_at': 0}},
+        'token_metadata.json': {},
+    }
+    for name, data in files.items():
+        with open(os.path.join(directory, name), 'w') as f:
+            json.dump(data, f)
+    with open(os.path.join(directory, '.env'), 'w') as f:
+        f.write(f"{ENV_MARKER}=1\n")
+    history = PriceHistory(os.path.join(directory, 'price_history.bin'))
+    history.record(key, 1.0)
+    history.save()
+    history.close()
+
+def file_states(directory):
+    return {name: (os.stat(os.path.join(directory, name)).st_mtime_ns, os.stat(os.path.join(directory, name)).st_size)
+            for name in sorted(os.listdir(directory))}
+
+
+def measure(module):
+    with tempfile.TemporaryDirectory() as directory:
+        write_data_files(directory)
+        before = file_states(directory)
+        env = dict(os.environ, PYTHONPATH=os.path.abspath(ROOT), PYTHONDONTWRITEBYTECODE='1')
+        env.pop(ENV_MARKER, None)
+        output = subprocess.run([sys.executable, '-c', CHILD, module, ENV_MARKER], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        after = file_states(directory)
+        result['files_created'] = sorted(set(after) - set(before))
+        result['files_modified'] = sorted(name for name in before if after.get(name) != before[name])
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET, help="maximum median import time in seconds")
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters to measure")
+    parser.add_argument('--module', default='utils', help="module to import")
+    args = parser.parse_args()
+
+    results = [measure(args.module) for _ in range(args.runs)]
+    times = sorted(result['seconds'] for result in results)
+    median = times[len(times) // 2]
+    print(f"import {args.module}: median {median * 1000:.1f} ms, min {times[0] * 1000:.1f} ms, "
+          f"max {times[-1] * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms)")
+
+    failures = []
+    if median > args.budget:
+        failures.append(f"median import time {median * 1000:.1f} ms exceeds the budget")
+    last = results[-1]
+    for flag, message in (('bot_created', "the Telegram bot was constructed"),
+                          ('telebot_imported', "telebot was imported"),
+                          ('logging_configured', "logging was configured"),
+                          ('store_created', "the store was created"),
+                          ('history_created', "the price history was created"),
+                          ('dotenv_loaded', "the .env file was loaded")):
+        if last[flag]:
+            failures.append(message)
+    for name, message in (('mapped_files', "files were mapped"), ('files_created', "files were created"),
+                          ('files_modified', "files were modified")):
+        if last[name]:
+            failures.append(f"{message}: {', '.join(last[name])}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Micro-benchmark of alert evaluation: the naive per-alert loop used before the
+trigger index versus TriggerIndex.crossed().
+
+Usage:
+    python benchmarks/bench_trigger_index.py [alert counts...]
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from alerts import TriggerIndex, is_triggered
+
+SYMBOL = 'BENCH'
+TICKS = 200
+
+def make_alerts(count, seed=42):
+    rng = random.Random(seed)
+    alerts = {}
+    for i in range(count):
+        alerts[f"{i}:{SYMBOL}"] = {
+            'chat_id': i,
+            'symbol': SYMBOL,
+            'change_type': rng.choice(('up', 'down')),
+            'threshold_percentage': float(rng.randint(1, 50)),
+            'previous_price': rng.uniform(0.9, 1.1),
+        }
+    return alerts
+
+def naive(alerts, price):
+    return [key for key, alert in alerts.items()
+            if is_triggered(alert['change_type'], alert['threshold_percentage'], alert['previous_price'], price)]
+
+def bench(count):
+    alerts = make_alerts(count)
+    prices = [random.Random(i).uniform(0.85, 1.15) for i in range(TICKS)]
+
+    started = time.perf_counter()
+    index = TriggerIndex()
+    for key, alert in alerts.items():
+        index.update(key, alert)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    naive_results = [naive(alerts, price) for price in prices]
+    naive_time = (time.perf_counter() - started) / TICKS
+
+    started = time.perf_counter()
+    index_results = [index.crossed(SYMBOL, price) for price in prices]
+    index_time = (time.perf_counter() - started) / TICKS
+
+    mismatches = sum(set(a) != set(b) for a, b in zip(naive_results, index_results))
+    fired = sum(len(result) for result in index_results) / TICKS
+    print(f"{count:>8} alerts | build {build * 1000:8.1f} ms | naive {naive_time * 1000:8.3f} ms/tick | "
+          f"index {index_time * 1000:8.3f} ms/tick | {naive_time / index_time:6.1f}x | "
+          f"{fired:8.0f} fired/tick | mismatched ticks: {mismatches}")
+
+if __name__ == "__main__":
+    for count in [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]:
+        bench(count)
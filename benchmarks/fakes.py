@@ -0,0 +1,305 @@
+"""
+Local stand-ins for the DEX Screener and Telegram Bot APIs, used by the
+benchmarks so they measure the bot rather than the network, and for a price
+stream, used by the tests of the streaming feed.
+
+The servers run in a background thread on 127.0.0.1 and count the requests
+they receive.
+"""
+import abc
+import json
+import time
+import queue
+import random
+import threading
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _FakeServer(abc.ABC):
+    def __init__(self):
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    @abc.abstractmethod
+    def _make_handler(self):
+        """
+        Returns:
+            type: The BaseHTTPRequestHandler subclass serving the requests.
+        """
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+#===============================================
+#================= DEX SCREENER ================
+#===============================================
+
+class FakeDexScreener(_FakeServer):
+    """
+    Serves GET /latest/dex/tokens/<address>,<address>,... like DEX Screener.
+
+    Every token gets `pairs` pairs with decreasing liquidity. Prices follow a
+    random walk around 1.0 that takes a step each time the token is requested,
+    so threshold alerts fire now and then. Addresses containing 'dead' resolve
+    to no pairs.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, pairs=1, volatility=0.02, seed=42):
+        """
+        Args:
+            latency (float): Seconds every response is delayed by.
+            error_rate (float): Fraction of requests answered with a 503.
+            pairs (int): Pairs returned per token.
+            volatility (float): Standard deviation of a price step, relative to the price.
+            seed (int): Seed of the random errors and price steps.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.pairs = pairs
+        self.volatility = volatility
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._prices = {}
+        super().__init__()
+
+    @property
+    def tokens_url(self):
+        # Value for utils.DEXSCREENER_TOKENS_URL
+        return f"{self.base_url}/latest/dex/tokens/"
+
+    def _pairs(self, address):
+        with self._lock:
+            price = self._prices.get(address, 1.0) * (1 + self._rng.gauss(0, self.volatility))
+            self._prices[address] = price
+        symbol = 'T' + address[-6:].upper()
+        return [{
+            'chainId': 'ethereum',
+            'dexId': 'fakeswap',
+            'pairAddress': f"0xpair{i}{address[6:]}",
+            'baseToken': {'address': address, 'name': f"Token {symbol}", 'symbol': symbol},
+            'quoteToken': {'address': '0x' + 'e' * 40, 'name': 'Wrapped Ether', 'symbol': 'WETH'},
+            'priceUsd': f"{price * (1 + 0.001 * i):.8f}",
+            'liquidity': {'usd': 1000000.0 / (i + 1)},
+        } for i in range(self.pairs)]
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                fake._count()
+                if fake.latency:
+                    time.sleep(fake.latency)
+                with fake._lock:
+                    failed = fake._rng.random() < fake.error_rate
+                    fake.errors += failed
+                if failed:
+                    self._reply(503, {'error': 'unavailable'})
+                    return
+                addresses = [a for a in urlsplit(self.path).path.rsplit('/', 1)[-1].split(',') if a]
+                pairs = [pair for address in addresses if 'dead' not in address for pair in fake._pairs(address)]
+                self._reply(200, {'schemaVersion': '1.0.0', 'pairs': pairs or None})
+
+            def _reply(self, status, body):
+                body = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+#===============================================
+#================= TELEGRAM ====================
+#===============================================
+
+class FakeTelegram(_FakeServer):
+    """
+    Answers Telegram Bot API calls with minimal successful results.
+
+    Point telebot at it with telebot.apihelper.API_URL = fake.api_url. Calls are
+    counted per method in `methods`.
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        Args:
+            latency (float): Seconds every response is delayed by.
+        """
+        self.latency = latency
+        self.methods = {}
+        self._message_id = 0
+        super().__init__()
+
+    @property
+    def api_url(self):
+        return f"{self.base_url}/bot{{0}}/{{1}}"
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                split = urlsplit(self.path)
+                method = split.path.rsplit('/', 1)[-1]
+                length = int(self.headers.get('Content-Length', 0))
+                params = parse_qs(split.query)
+                params.update(parse_qs(self.rfile.read(length).decode('utf-8')))
+                with fake._lock:
+                    fake.requests += 1
+                    fake.methods[method] = fake.methods.get(method, 0) + 1
+                    fake._message_id += 1
+                    message_id = fake._message_id
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                result = True
+                if method.startswith('send') or method.startswith('edit'):
+                    chat_id = int(params.get('chat_id', ['0'])[0])
+                    result = {
+                        'message_id': int(params.get('message_id', [message_id])[0]),
+                        'date': int(time.time()),
+                        'chat': {'id': chat_id, 'type': 'private'},
+                        'text': params.get('text', [''])[0],
+                    }
+                body = json.dumps({'ok': True, 'result': result}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+#===============================================
+#================= PRICE STREAM ================
+#===============================================
+
+class FakePriceStream(_FakeServer):
+    """
+    Serves the line-delimited JSON price stream read by feeds.StreamingFeed.
+
+    GET /stream?tokens=network:address,... opens a chunked response that stays
+    open until close_streams() or stop(). The token set of every request is
+    appended to `subscriptions`; ticks passed to send() are written to every
+    open stream, one JSON object per line.
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+        self._streams = []
+        super().__init__()
+
+    @property
+    def url(self):
+        # Value for utils.PRICE_STREAM_URL
+        return f"{self.base_url}/stream"
+
+    def send(self, *ticks):
+        """
+        Writes ticks to the open streams in a single chunk.
+
+        Args:
+            ticks (tuple): (network, address, price) of each tick.
+        """
+        data = ''.join(json.dumps({'network': network, 'address': address, 'price': price}) + '\n'
+                       for network, address, price in ticks).encode('utf-8')
+        with self._lock:
+            for stream in self._streams:
+                stream.put(data)
+
+    def close_streams(self):
+        """
+        Ends the open streams, as a server dropping its clients would.
+        """
+        with self._lock:
+            for stream in self._streams:
+                stream.put(None)
+
+    def wait_for_subscriptions(self, count, timeout=5):
+        """
+        Returns:
+            bool: True once `count` streams were opened, False after `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if len(self.subscriptions) >= count:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def stop(self):
+        self.close_streams()
+        super().stop()
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                fake._count()
+                tokens = parse_qs(urlsplit(self.path).query).get('tokens', [''])[0]
+                stream = queue.Queue()
+                with fake._lock:
+                    fake.subscriptions.append({tuple(token.split(':', 1)) for token in tokens.split(',') if token})
+                    fake._streams.append(stream)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    while True:
+                        data = stream.get()
+                        if data is None:
+                            break
+                        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                        self.wfile.flush()
+                    self.wfile.write(b'0\r\n\r\n')
+                except OSError:
+                    pass  # the client went away
+                finally:
+                    with fake._lock:
+                        fake._streams.remove(stream)
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,186 @@
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+#===============================================
+#================= CONVERSATION STATE ==========
+#===============================================
+
+class UserStates:
+    """
+    Thread-safe mapping of chat_id to conversation state with idle expiry.
+
+    Supports the dict operations the handlers use. Entries not read or written
+    for `ttl` seconds are dropped, so memory does not grow with every chat that
+    ever talked to the bot. Entries are kept in access order, which makes
+    expiry cost proportional to the number of entries expired.
+    """
+
+    def __init__(self, ttl=3600, clock=time.monotonic):
+        """
+        Args:
+            ttl (float): Seconds of inactivity after which a chat's state is dropped.
+            clock (callable): Monotonic time source, replaceable for testing.
+        """
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # chat_id -> (last access, state), least recently used first
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        # Must be called with the lock held
+        while self._entries:
+            chat_id, (touched, _) = next(iter(self._entries.items()))
+            if now - touched < self.ttl:
+                break
+            del self._entries[chat_id]
+
+    def _touch(self, chat_id, now):
+        # Must be called with the lock held. Returns the live state, or raises KeyError.
+        _, state = self._entries[chat_id]
+        self._entries[chat_id] = (now, state)
+        self._entries.move_to_end(chat_id)
+        return state
+
+    def __getitem__(self, chat_id):
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            return self._touch(chat_id, now)
+
+    def get(self, chat_id, default=None):
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            try:
+                return self._touch(chat_id, now)
+            except KeyError:
+                return default
+
+    def __setitem__(self, chat_id, state):
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            self._entries[chat_id] = (now, state)
+            self._entries.move_to_end(chat_id)
+
+    def pop(self, chat_id, default=None):
+        with self._lock:
+            entry = self._entries.pop(chat_id, None)
+            return default if entry is None else entry[1]
+
+    def __contains__(self, chat_id):
+        return self.get(chat_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._entries)
+
+#===============================================
+#================= UPDATE DISPATCHER ===========
+#===============================================
+
+def update_chat_id(update):
+    """
+    Returns the chat an update belongs to, or None if it has no chat.
+    """
+    for name in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        message = getattr(update, name, None)
+        if message is not None:
+            return message.chat.id
+    callback_query = getattr(update, 'callback_query', None)
+    if callback_query is not None:
+        if callback_query.message is not None:
+            return callback_query.message.chat.id
+        return callback_query.from_user.id
+    return None
+
+class ChatDispatcher:
+    """
+    Runs tasks on a worker pool while keeping the tasks of each chat in order.
+
+    A chat has at most one task running at a time; tasks submitted meanwhile
+    wait in the chat's queue and are handed to the pool one by one. Tasks of
+    different chats run concurrently, so a handler blocked on network I/O only
+    delays its own chat.
+    """
+
+    def __init__(self, workers=8):
+        """
+        Args:
+            workers (int): Number of threads running tasks.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dispatch')
+        self._queues = {}  # chat_id -> deque of waiting (function, args), present while a task of the chat runs
+        self._lock = threading.Lock()
+
+    def pending(self):
+        """
+        Returns:
+            int: The number of tasks waiting behind a running task of the same chat.
+        """
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, chat_id, function, *args):
+        """
+        Queues function(*args) behind the earlier tasks of `chat_id`. Returns immediately.
+        """
+        with self._lock:
+            queue = self._queues.get(chat_id)
+            if queue is not None:
+                queue.append((function, args))
+                return
+            self._queues[chat_id] = deque()
+        self._executor.submit(self._run, chat_id, function, args)
+
+    def _run(self, chat_id, function, args):
+        try:
+            function(*args)
+        except Exception as e:
+            logging.error("Error handling update for chat %s: %s", chat_id, e)
+        with self._lock:
+            queue = self._queues[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+                return
+            function, args = queue.popleft()
+        # Resubmit rather than loop, so a busy chat cannot hold on to a worker
+        self._executor.submit(self._run, chat_id, function, args)
+
+    def attach(self, bot):
+        """
+        Routes the updates of `bot` through the dispatcher.
+
+        The bot should be created with threaded=False, so its handlers run in
+        the dispatcher's workers rather than on telebot's own unordered pool.
+
+        Args:
+            bot (telebot.TeleBot): The bot whose updates are dispatched.
+        """
+        process_new_updates = bot.process_new_updates
+
+        def dispatch(updates):
+            for update in updates:
+                # telebot only advances the polling offset in process_new_updates, which may run
+                # much later; acknowledge the update now so getUpdates does not return it again
+                bot.last_update_id = max(bot.last_update_id, update.update_id)
+                self.submit(update_chat_id(update), process_new_updates, [update])
+
+        bot.process_new_updates = dispatch
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting work. With `wait`, returns once the tasks already queued have run.
+        """
+        if wait:
+            # Chats' waiting tasks are submitted by their running task, so wait for the queues to drain first
+            while True:
+                with self._lock:
+                    if not self._queues:
+                        break
+                time.sleep(0.05)
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,323 @@
+import abc
+import json
+import time
+import asyncio
+import socket
+import logging
+import threading
+import requests
+from poller import PricePoller
+from utils import (
+    get_http_session,
+    price_cache,
+    price_key,
+    DEXSCREENER_BATCH_SIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+)
+
+#===============================================
+#================= FEED INTERFACE ==============
+#===============================================
+
+class PriceFeed(abc.ABC):
+    """
+    Source of price ticks for the watched tokens.
+
+    A feed repeatedly asks `tokens()` which tokens to watch and delivers their
+    prices to `sink` as a dict of price_key(network, address) to price in USD
+    ('N/A' if a price could not be fetched). The sink is never called
+    concurrently with itself, so the rest of the bot does not depend on which
+    feed is active.
+    """
+
+    def __init__(self, tokens, sink):
+        """
+        Args:
+            tokens (callable): Returns the watchlist entries to watch, keyed by price_key().
+            sink (callable): Called with each batch of ticks.
+        """
+        self.tokens = tokens
+        self.sink = sink
+
+    @abc.abstractmethod
+    def run(self):
+        """
+        Delivers ticks in the calling thread until stop() is called.
+        """
+
+    @abc.abstractmethod
+    def stop(self):
+        """
+        Stops the feed. Safe to call from any thread.
+        """
+
+#===============================================
+#================= POLLING FEED ================
+#===============================================
+
+class PollingFeed(PriceFeed):
+    """
+    Feed that polls the DEX Screener REST API.
+
+    Every poller tick fetches the tokens the scheduler reports as due in batched
+    requests, delivers their prices and reschedules them from the distances
+    returned by `distances`.
+    """
+
+    def __init__(self, tokens, sink, scheduler, distances, interval=30, concurrency=8):
+        """
+        Args:
+            tokens (callable): See PriceFeed.
+            sink (callable): See PriceFeed.
+            scheduler (AdaptiveScheduler): Decides which tokens are due.
+            distances (callable): Called with the polled prices, returns the distance
+                                  of each token to its nearest trigger (see
+                                  nearest_trigger_distance()) keyed like the prices.
+            interval (float): Seconds between poller ticks.
+            concurrency (int): Maximum number of price requests in flight.
+        """
+        super().__init__(tokens, sink)
+        self.scheduler = scheduler
+        self.distances = distances
+        self.poller = PricePoller(self._cycle, interval=interval, concurrency=concurrency)
+
+    async def _cycle(self, poller):
+        tokens = self.tokens()
+        self.scheduler.sync(tokens)
+        due_keys = self.scheduler.pop_due(fill_to=DEXSCREENER_BATCH_SIZE, lookahead=self.scheduler.min_interval)
+        if not due_keys:
+            return
+
+        # pop_due() unschedules the keys, so every one of them must be recorded
+        # again, even when fetching or evaluating fails, or it is never polled again
+        pending = set(due_keys)
+        try:
+            # Fetch the due prices in concurrent batched requests.
+            # This also refreshes the price cache used by the interactive commands.
+            prices = await poller.fetch_prices(tokens[key] for key in due_keys)
+            ticks = {key: prices.get(key, 'N/A') for key in due_keys}
+            await asyncio.to_thread(self.sink, ticks)
+
+            distances = await asyncio.to_thread(self.distances, ticks)
+            for key, price in ticks.items():
+                try:
+                    price = float(price)
+                except ValueError:
+                    price = None
+                self.scheduler.record(key, price, distances.get(key))
+                pending.discard(key)
+        finally:
+            # Retried after the base interval, like a failed poll
+            for key in pending:
+                self.scheduler.record(key, None, None)
+
+    def run(self):
+        self.poller.run_forever()
+
+    def stop(self):
+        self.poller.stop()
+
+#===============================================
+#================= STREAMING FEED ==============
+#===============================================
+
+class TickCoalescer:
+    """
+    Buffer between a tick producer and a slower consumer.
+
+    Only the latest price per token is kept, so a burst of ticks for one token
+    becomes a single update and the buffer never holds more than one entry per
+    token. The producer never blocks; when the consumer falls behind,
+    intermediate ticks are dropped instead of queueing up.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._stats = {'received': 0, 'coalesced': 0, 'delivered': 0}
+
+    def put(self, key, price):
+        with self._condition:
+            self._stats['received'] += 1
+            self._stats['coalesced'] += key in self._pending
+            self._pending[key] = price
+            self._condition.notify()
+
+    def drain(self, timeout=None):
+        """
+        Waits up to `timeout` seconds for ticks and takes all pending ones.
+
+        Returns:
+            dict: The latest price per token; empty if nothing arrived in time.
+        """
+        with self._condition:
+            if not self._pending:
+                self._condition.wait(timeout)
+            pending, self._pending = self._pending, {}
+            self._stats['delivered'] += len(pending)
+            return pending
+
+    def wake(self):
+        # Interrupts a waiting drain()
+        with self._condition:
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Counters of ticks received, replaced by a newer tick before
+                  delivery, and delivered, plus the number pending.
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+class StreamingFeed(PriceFeed):
+    """
+    Feed receiving prices pushed by a line-delimited JSON stream.
+
+    The feed keeps a streaming GET request open to `url`, passing the watched
+    tokens as comma-separated network:address pairs in the `tokens` query
+    parameter. The server answers with one JSON object per line, e.g.
+        {"network": "eth", "address": "0x...", "price": 1.23}
+    and may send empty lines as keep-alives. A reader thread consumes the
+    stream into a TickCoalescer and the calling thread hands the coalesced
+    ticks to the sink at most once every `flush_interval` seconds.
+
+    The request is reopened with backoff when the stream fails, and with a new
+    subscription when the watched tokens change.
+    """
+
+    def __init__(self, tokens, sink, url, flush_interval=0.5, resubscribe_interval=5, read_timeout=60):
+        """
+        Args:
+            tokens (callable): See PriceFeed.
+            sink (callable): See PriceFeed.
+            url (str): The stream endpoint.
+            flush_interval (float): Minimum seconds between two sink calls.
+            resubscribe_interval (float): Seconds between checks of the watched tokens.
+            read_timeout (float): Seconds without data, keep-alives included, after
+                                  which the stream is reopened.
+        """
+        super().__init__(tokens, sink)
+        self.url = url
+        self.flush_interval = flush_interval
+        self.resubscribe_interval = resubscribe_interval
+        self.read_timeout = read_timeout
+        self.coalescer = TickCoalescer()
+        self._subscribed = frozenset()
+        self._subscription_changed = threading.Event()
+        self._stopping = threading.Event()
+        self._response = None
+
+    def _subscription(self):
+        # Returns the watched keys and reopens the stream when they changed
+        keys = frozenset(self.tokens())
+        if keys != self._subscribed:
+            self._subscribed = keys
+            self._subscription_changed.set()
+            self._close_response()
+        return keys
+
+    def _close_response(self):
+        # Ends the open stream from another thread. Closing the response would
+        # wait for the reader's blocked read to return, up to read_timeout;
+        # shutting the socket down makes that read return at once, and the
+        # reader closes the response itself.
+        response = self._response
+        if response is None:
+            return
+        sock = getattr(getattr(response.raw, 'connection', None), 'sock', None)
+        if sock is None:
+            response.close()
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
+
+    def _handle_line(self, line, subscribed):
+        try:
+            tick = json.loads(line)
+            key = price_key(tick['network'], tick['address'])
+            price = float(tick['price'])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.warning("Ignoring malformed stream line %r: %s", line[:200], e)
+            return
+        if key in subscribed:
+            self.coalescer.put(key, price)
+
+    def _read(self, subscribed):
+        # Streams ticks for one subscription until it changes, the feed stops or the stream fails
+        params = {'tokens': ','.join(f"{network}:{address}" for network, address in sorted(subscribed))}
+        with get_http_session().get(self.url, params=params, stream=True,
+                                    timeout=(HTTP_CONNECT_TIMEOUT, self.read_timeout)) as response:
+            response.raise_for_status()
+            self._response = response
+            try:
+                logging.info("Price stream connected with %s tokens.", len(subscribed))
+                for line in response.iter_lines():
+                    if self._stopping.is_set() or self._subscribed is not subscribed:
+                        return
+                    if line:
+                        self._handle_line(line, subscribed)
+            finally:
+                self._response = None
+        if not self._stopping.is_set() and self._subscribed is subscribed:
+            raise requests.ConnectionError("price stream closed by the server")
+
+    def _read_forever(self):
+        attempt = 0
+        while not self._stopping.is_set():
+            subscribed = self._subscribed
+            self._subscription_changed.clear()
+            if not subscribed:
+                self._subscription_changed.wait(self.resubscribe_interval)
+                continue
+            started = time.monotonic()
+            try:
+                self._read(subscribed)
+            except Exception as e:
+                if self._stopping.is_set() or self._subscribed is not subscribed:
+                    continue  # closed on purpose
+                # A stream that stayed up for a while resets the backoff
+                attempt = 0 if time.monotonic() - started > self.read_timeout else attempt + 1
+                delay = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt))
+                logging.warning("Price stream failed: %s. Reconnecting in %.1fs...", e, delay)
+                self._stopping.wait(delay)
+
+    def run(self):
+        self._stopping.clear()
+        self._subscription()
+        reader = threading.Thread(target=self._read_forever, name='price-stream', daemon=True)
+        reader.start()
+        checked = time.monotonic()
+        try:
+            while not self._stopping.is_set():
+                if time.monotonic() - checked >= self.resubscribe_interval:
+                    self._subscription()
+                    checked = time.monotonic()
+                ticks = self.coalescer.drain(self.resubscribe_interval)
+                if not ticks:
+                    continue
+                started = time.monotonic()
+                price_cache.set_many(ticks)
+                try:
+                    self.sink(ticks)
+                except Exception as e:
+                    logging.error("Error processing streamed prices: %s", e)
+                # Ticks arriving meanwhile are coalesced into the next batch
+                self._stopping.wait(max(0.0, self.flush_interval - (time.monotonic() - started)))
+        finally:
+            self._stopping.set()
+            self._close_response()
+            reader.join(timeout=5)
+            logging.info("Price stream stopped.")
+
+    def stop(self):
+        self._stopping.set()
+        self._close_response()
+        self.coalescer.wake()
@@ -0,0 +1,415 @@
+import os
+import mmap
+import time
+import struct
+import logging
+import threading
+from array import array
+
+#===============================================
+#================= CONFIGURATION ===============
+#===============================================
+
+# (resolution in seconds, capacity) of each tier, finest first. Resolution 0 is
+# the raw tier holding every recorded tick; the others keep one min/max/last
+# bucket per resolution period.
+DEFAULT_TIERS = (
+    (0, 256),       # raw ticks
+    (60, 240),      # 1 minute buckets, 4 hours
+    (3600, 168),    # 1 hour buckets, 7 days
+    (86400, 365),   # 1 day buckets, 1 year
+)
+
+_MAGIC = b'PTHIST01'
+_HEADER = struct.Struct('<8sII')   # magic, number of tiers, number of tokens
+_TIER = struct.Struct('<II')       # resolution, capacity
+_ENTRY = struct.Struct('<HQ')      # key length, offset of the token block in bytes
+_DOUBLE = 8
+
+def _slot_width(resolution):
+    # Raw slots hold (timestamp, price); bucket slots hold (start, min, max, last)
+    return 2 if resolution == 0 else 4
+
+def _block_length(tiers):
+    # Every ring starts with two doubles: the number of slots used and the write position
+    return sum(2 + capacity * _slot_width(resolution) for resolution, capacity in tiers)
+
+def _encode_key(key):
+    return ':'.join(key).encode('utf-8')
+
+def _decode_key(raw):
+    network, _, address = raw.decode('utf-8').partition(':')
+    return network, address
+
+#===============================================
+#================= RING BUFFERS ================
+#===============================================
+
+class _Ring:
+    """
+    Fixed-capacity ring of time-ordered slots stored in a flat buffer of doubles.
+
+    The buffer is either an array('d') or a memoryview over the memory-mapped
+    history file, so slots never become Python objects unless they are read.
+    """
+
+    __slots__ = ('buffer', 'base', 'capacity', 'width', 'resolution', 'min_offset', 'max_offset', 'last_offset')
+
+    def __init__(self, buffer, base, resolution, capacity):
+        self.buffer = buffer
+        self.base = base
+        self.resolution = resolution
+        self.capacity = capacity
+        self.width = _slot_width(resolution)
+        if resolution == 0:
+            self.min_offset = self.max_offset = self.last_offset = 1
+        else:
+            self.min_offset, self.max_offset, self.last_offset = 1, 2, 3
+
+    def __len__(self):
+        return int(self.buffer[self.base])
+
+    def _position(self, index):
+        # Buffer position of the slot at logical index (0 is the oldest)
+        count = int(self.buffer[self.base])
+        head = int(self.buffer[self.base + 1])
+        return self.base + 2 + ((head - count + index) % self.capacity) * self.width
+
+    def time_at(self, index):
+        return self.buffer[self._position(index)]
+
+    def append(self, values):
+        buffer = self.buffer
+        head = int(buffer[self.base + 1])
+        position = self.base + 2 + head * self.width
+        for offset, value in enumerate(values):
+            buffer[position + offset] = value
+        buffer[self.base + 1] = (head + 1) % self.capacity
+        buffer[self.base] = min(self.capacity, int(buffer[self.base]) + 1)
+
+    def last_position(self):
+        return self._position(len(self) - 1) if len(self) else None
+
+    def bisect(self, timestamp):
+        """
+        Returns the logical index of the first slot at or after `timestamp`.
+        """
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.time_at(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _segments(self, start, stop):
+        # Contiguous (first, last) buffer positions covering logical slots [start, stop)
+        if start >= stop:
+            return []
+        first = self._position(start)
+        end = self._position(stop - 1) + self.width
+        if end > first:
+            return [(first, end)]
+        ring_end = self.base + 2 + self.capacity * self.width
+        return [(first, ring_end), (self.base + 2, end)]
+
+    def aggregate(self, start_time, stop_time):
+        """
+        Returns (min, max, last, last_time) over the slots starting in
+        [start_time, stop_time), or None if there are none.
+        """
+        start, stop = self.bisect(start_time), self.bisect(stop_time)
+        if start >= stop:
+            return None
+        buffer, width = self.buffer, self.width
+        low = high = None
+        for first, end in self._segments(start, stop):
+            segment_low = min(buffer[first + self.min_offset:end:width])
+            segment_high = max(buffer[first + self.max_offset:end:width])
+            low = segment_low if low is None else min(low, segment_low)
+            high = segment_high if high is None else max(high, segment_high)
+        position = self._position(stop - 1)
+        return low, high, buffer[position + self.last_offset], buffer[position]
+
+    def series(self, start_time, stop_time):
+        """
+        Returns (timestamps, prices) arrays of the slots in [start_time, stop_time),
+        using the last price of each bucket.
+        """
+        start, stop = self.bisect(start_time), self.bisect(stop_time)
+        timestamps, prices = array('d'), array('d')
+        for first, end in self._segments(start, stop):
+            timestamps.extend(self.buffer[first:end:self.width])
+            prices.extend(self.buffer[first + self.last_offset:end:self.width])
+        return timestamps, prices
+
+#===============================================
+#================= HISTORY STORE ===============
+#===============================================
+
+class PriceHistory:
+    """
+    Per-token price history kept in fixed-size ring buffers.
+
+    Each token has a raw tier with its latest ticks and coarser 1m/1h/1d tiers
+    holding min/max/last per bucket, all updated as ticks are recorded. Window
+    queries combine the finest tier that still covers each part of the window.
+
+    Histories are saved to a compact binary file. On startup the file is
+    memory-mapped and the rings operate on the mapping directly, so loading
+    only reads the token directory, and recorded ticks for known tokens are
+    written straight into the file.
+    """
+
+    def __init__(self, path=None, tiers=DEFAULT_TIERS):
+        """
+        Args:
+            path (str): History file, loaded if it exists. None keeps history in memory only.
+            tiers (tuple): (resolution, capacity) pairs, see DEFAULT_TIERS.
+        """
+        self.path = path
+        self.tiers = tuple(tiers)
+        self._block_length = _block_length(self.tiers)
+        self._tokens = {}     # key -> list of _Ring
+        self._buffers = {}    # key -> array('d') or memoryview backing the rings
+        self._mmap = None
+        self._file = None
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tokens)
+
+    def keys(self):
+        with self._lock:
+            return list(self._tokens)
+
+    def _rings(self, buffer, offset=0):
+        rings = []
+        for resolution, capacity in self.tiers:
+            rings.append(_Ring(buffer, offset, resolution, capacity))
+            offset += 2 + capacity * _slot_width(resolution)
+        return rings
+
+    #================= recording ================
+
+    def record(self, key, price, timestamp=None):
+        """
+        Records a price tick.
+
+        Args:
+            key (tuple): The token key, see price_key().
+            price (float): The price in USD.
+            timestamp (float): Unix time of the tick; defaults to now. Ticks older
+                               than the latest recorded one are ignored.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            rings = self._tokens.get(key)
+            if rings is None:
+                buffer = array('d', bytes(self._block_length * _DOUBLE))
+                rings = self._tokens[key] = self._rings(buffer)
+                self._buffers[key] = buffer
+
+            raw = rings[0]
+            last = raw.last_position()
+            if last is not None and timestamp < raw.buffer[last]:
+                return
+            raw.append((timestamp, price))
+
+            for ring in rings[1:]:
+                bucket = timestamp - timestamp % ring.resolution
+                position = ring.last_position()
+                buffer = ring.buffer
+                if position is not None and buffer[position] == bucket:
+                    buffer[position + 1] = min(buffer[position + 1], price)
+                    buffer[position + 2] = max(buffer[position + 2], price)
+                    buffer[position + 3] = price
+                else:
+                    ring.append((bucket, price, price, price))
+
+    def record_many(self, prices, timestamp=None):
+        """
+        Records one tick per token.
+
+        Args:
+            prices (dict): Prices by token key. Non-numeric prices such as 'N/A' are skipped.
+            timestamp (float): Unix time of the ticks; defaults to now.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for key, price in prices.items():
+            try:
+                price = float(price)
+            except (TypeError, ValueError):
+                continue
+            self.record(key, price, timestamp)
+
+    #================= queries ==================
+
+    def window(self, key, seconds, now=None):
+        """
+        Returns price statistics over the last `seconds`.
+
+        Args:
+            key (tuple): The token key.
+            seconds (float): Length of the window.
+            now (float): End of the window; defaults to the current time.
+
+        Returns:
+            dict: 'min', 'max' and 'last' price in the window and 'last_time', the
+                  time of the last tick, or None if nothing was recorded in it.
+        """
+        now = time.time() if now is None else now
+        start = now - seconds
+        with self._lock:
+            rings = self._tokens.get(key)
+            if rings is None:
+                return None
+            result = None
+            covered_from = now + 1
+            for ring in rings:
+                if not len(ring) or covered_from <= start:
+                    continue
+                low = max(start, ring.time_at(0))
+                if low >= covered_from:
+                    continue
+                stats = ring.aggregate(low, covered_from)
+                covered_from = low
+                if stats is None:
+                    continue
+                if result is None:
+                    result = {'min': stats[0], 'max': stats[1], 'last': stats[2], 'last_time': stats[3]}
+                else:
+                    # Coarser tiers only cover older data, so 'last' stays with the finer one
+                    result['min'] = min(result['min'], stats[0])
+                    result['max'] = max(result['max'], stats[1])
+            return result
+
+    def series(self, key, seconds, now=None, resolution=0):
+        """
+        Returns the recorded prices of one tier over the last `seconds`.
+
+        Args:
+            key (tuple): The token key.
+            seconds (float): Length of the window.
+            now (float): End of the window; defaults to the current time.
+            resolution (int): The tier to read, 0 for raw ticks.
+
+        Returns:
+            tuple: (timestamps, prices) as array('d'), oldest first; empty if unknown.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rings = self._tokens.get(key)
+            for ring in rings or ():
+                if ring.resolution == resolution:
+                    return ring.series(now - seconds, now + 1)
+            return array('d'), array('d')
+
+    #================= persistence ==============
+
+    def _load(self):
+        # Maps the history file and builds rings on top of the mapping
+        self._file = open(self.path, 'r+b')
+        view = None
+        buffers = {}
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0)
+            magic, tier_count, token_count = _HEADER.unpack_from(self._mmap, 0)
+            offset = _HEADER.size
+            tiers = tuple(_TIER.unpack_from(self._mmap, offset + i * _TIER.size) for i in range(tier_count))
+            offset += tier_count * _TIER.size
+            if magic != _MAGIC or tiers != self.tiers:
+                raise ValueError("history file format or tiers do not match")
+            view = memoryview(self._mmap)
+            block_size = self._block_length * _DOUBLE
+            for _ in range(token_count):
+                key_length, block_offset = _ENTRY.unpack_from(self._mmap, offset)
+                offset += _ENTRY.size
+                key = _decode_key(bytes(self._mmap[offset:offset + key_length]))
+                offset += key_length
+                if block_offset + block_size > len(self._mmap):
+                    raise ValueError("history file is truncated")
+                buffers[key] = view[block_offset:block_offset + block_size].cast('d')
+        except (ValueError, struct.error) as e:
+            logging.error("Ignoring unreadable price history file %s: %s", self.path, e)
+            for buffer in buffers.values():
+                buffer.release()
+            if view is not None:
+                view.release()
+            self._release()
+            return
+        view.release()
+        for key, buffer in buffers.items():
+            self._buffers[key] = buffer
+            self._tokens[key] = self._rings(buffer)
+        logging.info("Loaded price history for %s tokens from %s.", token_count, self.path)
+
+    def _release(self):
+        # Drops the rings backed by the mapping, then unmaps the file
+        for key, buffer in list(self._buffers.items()):
+            if isinstance(buffer, memoryview):
+                buffer.release()
+                del self._buffers[key]
+                del self._tokens[key]
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def save(self):
+        """
+        Writes every history to the file atomically and maps the new file.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            keys = list(self._tokens)
+            encoded = [_encode_key(key) for key in keys]
+            data_offset = _HEADER.size + len(self.tiers) * _TIER.size + sum(_ENTRY.size + len(raw) for raw in encoded)
+            data_offset += -data_offset % _DOUBLE
+            block_size = self._block_length * _DOUBLE
+
+            temp_path = f"{self.path}.tmp"
+            try:
+                with open(temp_path, 'wb') as file:
+                    file.write(_HEADER.pack(_MAGIC, len(self.tiers), len(keys)))
+                    for tier in self.tiers:
+                        file.write(_TIER.pack(*tier))
+                    for index, raw in enumerate(encoded):
+                        file.write(_ENTRY.pack(len(raw), data_offset + index * block_size))
+                        file.write(raw)
+                    file.write(bytes(data_offset - file.tell()))
+                    for key in keys:
+                        file.write(self._buffers[key].tobytes())
+                    file.flush()
+                    os.fsync(file.fileno())
+                # Keep private copies in case the new file cannot be mapped
+                copies = {key: array('d', self._buffers[key].tobytes()) for key in keys}
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logging.error("Error saving price history to %s: %s", self.path, e)
+                return
+
+            self._release()
+            self._buffers.clear()
+            self._tokens.clear()
+            self._load()
+            for key, buffer in copies.items():
+                if key not in self._tokens:
+                    self._buffers[key] = buffer
+                    self._tokens[key] = self._rings(buffer)
+            logging.debug("Saved price history for %d tokens to %s.", len(keys), self.path)
+
+    def close(self):
+        """
+        Saves the histories and unmaps the file.
+        """
+        self.save()
+        with self._lock:
+            self._release()
@@ -0,0 +1,350 @@
+import re
+import threading
+import numpy as np
+from history import DEFAULT_TIERS
+
+#===============================================
+#================= ALERT KINDS =================
+#===============================================
+
+# Windowed alerts are evaluated on the 1-minute tier of the price history
+RESOLUTION = 60
+# Minutes of 1-minute buckets the price history keeps
+HISTORY_MINUTES = dict(DEFAULT_TIERS)[RESOLUTION]
+# Longest window that can be requested, in minutes. Evaluating a window also
+# needs the current minute, so it must be shorter than the history.
+MAX_WINDOW_MINUTES = HISTORY_MINUTES - 1
+
+_KINDS = ('change', 'sma_cross', 'ema_cross', 'breakout')
+
+_DURATION = re.compile(r'^(\d+)(m|min|h)$')
+
+def _minutes(text):
+    match = _DURATION.match(text)
+    if not match:
+        return None
+    minutes = int(match.group(1)) * (60 if match.group(2) == 'h' else 1)
+    return minutes if minutes > 0 else None
+
+def _number(text, suffixes=()):
+    for suffix in suffixes:
+        if text.endswith(suffix):
+            text = text[:-len(suffix)]
+            break
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+def parse_windowed_alert(details):
+    """
+    Parses the notification details of a windowed alert.
+
+    Supported formats, all starting with the direction 'up' or 'down':
+        'up 10% in 60m'        price changed by 10% over the last 60 minutes
+        'up sma 15m 1h'        15-minute SMA crossed above the 1-hour SMA
+        'down ema 15m 1h'      15-minute EMA crossed below the 1-hour EMA
+        'up breakout 2 60m'    price moved 2 standard deviations above its 60-minute mean
+
+    Args:
+        details (str): The lowercased details entered by the user.
+
+    Returns:
+        dict: The alert fields to store in the notification, or None if the
+              details are not a windowed alert.
+
+    Raises:
+        ValueError: If the alert needs more price history than is kept, so it could never fire.
+    """
+    alert = _parse_windowed_alert(details)
+    if alert is not None and _longest_window(alert) > _max_window(alert['kind']):
+        raise ValueError(f"Windows can be at most {_max_window(alert['kind'])} minutes long.")
+    return alert
+
+def _longest_window(alert):
+    return alert['slow_minutes'] if alert['kind'] in ('sma_cross', 'ema_cross') else alert['window_minutes']
+
+def _max_window(kind):
+    # A crossover also compares with the averages of the previous minute
+    return MAX_WINDOW_MINUTES - 1 if kind in ('sma_cross', 'ema_cross') else MAX_WINDOW_MINUTES
+
+def _parse_windowed_alert(details):
+    parts = details.split()
+    if len(parts) != 4 or parts[0] not in ('up', 'down'):
+        return None
+    change_type = parts[0]
+
+    if parts[2] == 'in':
+        threshold = _number(parts[1], ('%',))
+        window = _minutes(parts[3])
+        if threshold is None or window is None:
+            return None
+        return {'kind': 'change', 'change_type': change_type, 'threshold_percentage': threshold,
+                'window_minutes': window}
+
+    if parts[1] in ('sma', 'ema'):
+        fast, slow = _minutes(parts[2]), _minutes(parts[3])
+        if fast is None or slow is None or fast >= slow:
+            return None
+        return {'kind': f"{parts[1]}_cross", 'change_type': change_type, 'fast_minutes': fast, 'slow_minutes': slow}
+
+    if parts[1] == 'breakout':
+        sigma = _number(parts[2], ('x', 'σ', 'sd'))
+        window = _minutes(parts[3])
+        if sigma is None or window is None or window < 2:
+            return None
+        return {'kind': 'breakout', 'change_type': change_type, 'threshold_sigma': sigma, 'window_minutes': window}
+
+    return None
+
+def describe_alert(notification):
+    """
+    Returns:
+        str: A short description of the condition of a notification.
+    """
+    kind = notification.get('kind')
+    direction = notification.get('change_type')
+    if kind == 'change':
+        return f"price goes {direction} by {notification['threshold_percentage']}% within {notification['window_minutes']}m"
+    if kind in ('sma_cross', 'ema_cross'):
+        side = 'above' if direction == 'up' else 'below'
+        average = kind.split('_')[0].upper()
+        return f"{notification['fast_minutes']}m {average} crosses {side} the {notification['slow_minutes']}m {average}"
+    if kind == 'breakout':
+        return (f"price breaks {direction} by {notification['threshold_sigma']} standard deviations "
+                f"from its {notification['window_minutes']}m mean")
+    return f"price goes {direction} by {notification.get('threshold_percentage')}%"
+
+def is_windowed(notification):
+    """
+    Returns:
+        bool: True if the notification is a windowed alert rather than a threshold alert.
+    """
+    return notification is not None and notification.get('kind') in _KINDS
+
+def _span(notification):
+    # Minutes of history an alert looks back over
+    if notification['kind'] in ('sma_cross', 'ema_cross'):
+        return notification['slow_minutes'] + 1
+    return notification['window_minutes']
+
+def _cooldown(notification):
+    # Seconds during which a fired alert is not reported again
+    if notification['kind'] in ('sma_cross', 'ema_cross'):
+        return RESOLUTION
+    return notification['window_minutes'] * RESOLUTION
+
+#===============================================
+#================= PRICE MATRIX ================
+#===============================================
+
+def price_matrix(history, keys, minutes, now):
+    """
+    Builds a (tokens x minutes) matrix of prices on a 1-minute grid.
+
+    Each cell holds the last price of that minute, carried forward over minutes
+    without a tick. The last column is the current minute. The first column
+    also carries forward the last price of the preceding `minutes`; cells
+    before the first known price are NaN.
+
+    Args:
+        history (PriceHistory): The price history.
+        keys (list): Token keys, one row each.
+        minutes (int): Number of columns.
+        now (float): Unix time of the current minute.
+
+    Returns:
+        numpy.ndarray: The price matrix.
+    """
+    matrix = np.full((len(keys), minutes), np.nan)
+    first_bucket = (now - now % RESOLUTION) - (minutes - 1) * RESOLUTION
+    for row, key in enumerate(keys):
+        timestamps, prices = history.series(key, now - first_bucket + minutes * RESOLUTION, now, resolution=RESOLUTION)
+        if not timestamps:
+            continue
+        # Older buckets land in the first column, where the most recent one is written last
+        columns = ((np.frombuffer(timestamps) - first_bucket) // RESOLUTION).astype(np.int64)
+        matrix[row, np.clip(columns, 0, minutes - 1)] = np.frombuffer(prices)
+
+    # Carry the last known price forward over empty minutes
+    indices = np.where(np.isnan(matrix), 0, np.arange(minutes))
+    np.maximum.accumulate(indices, axis=1, out=indices)
+    return matrix[np.arange(len(keys))[:, None], indices]
+
+def _window_sums(values, windows, end):
+    """
+    Sums of `windows[i]` consecutive values of each row ending at column `end`
+    (inclusive), and how many of them are not NaN.
+    """
+    finite = ~np.isnan(values)
+    totals = np.concatenate([np.zeros((len(values), 1)), np.cumsum(np.where(finite, values, 0), axis=1)], axis=1)
+    counts = np.concatenate([np.zeros((len(values), 1)), np.cumsum(finite, axis=1)], axis=1)
+    rows = np.arange(len(values))
+    start = end + 1 - windows
+    return totals[rows, end + 1] - totals[rows, start], counts[rows, end + 1] - counts[rows, start]
+
+#===============================================
+#================= EVALUATION ==================
+#===============================================
+
+def _evaluate_change(prices, alerts):
+    columns = prices.shape[1]
+    windows = np.array([alert['window_minutes'] for alert in alerts])
+    thresholds = np.array([alert['threshold_percentage'] for alert in alerts])
+    up = np.array([alert['change_type'] == 'up' for alert in alerts])
+    current = prices[:, -1]
+    past = prices[np.arange(len(prices)), columns - 1 - windows]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = (current - past) / past * 100
+    fired = np.where(up, change >= thresholds, change <= -thresholds) & (past > 0)
+    return fired, change
+
+def _evaluate_sma_cross(prices, alerts):
+    columns = prices.shape[1]
+    fast = np.array([alert['fast_minutes'] for alert in alerts])
+    slow = np.array([alert['slow_minutes'] for alert in alerts])
+    up = np.array([alert['change_type'] == 'up' for alert in alerts])
+    averages = {}
+    for name, windows in (('fast', fast), ('slow', slow)):
+        for end in (columns - 2, columns - 1):
+            sums, counts = _window_sums(prices, windows, end)
+            averages[name, end] = np.where(counts == windows, sums / windows, np.nan)
+    before = averages['fast', columns - 2] - averages['slow', columns - 2]
+    after = averages['fast', columns - 1] - averages['slow', columns - 1]
+    fired = np.where(up, (before <= 0) & (after > 0), (before >= 0) & (after < 0))
+    return fired, after
+
+def _evaluate_ema_cross(prices, alerts):
+    columns = prices.shape[1]
+    fast = np.array([alert['fast_minutes'] for alert in alerts])
+    slow = np.array([alert['slow_minutes'] for alert in alerts])
+    up = np.array([alert['change_type'] == 'up' for alert in alerts])
+    fast_alpha, slow_alpha = 2 / (fast + 1), 2 / (slow + 1)
+
+    # One vectorized step per minute across every alert
+    fast_ema = np.full(len(prices), np.nan)
+    slow_ema = np.full(len(prices), np.nan)
+    before = None
+    for column in range(columns):
+        value = prices[:, column]
+        present = ~np.isnan(value)
+        fast_ema = np.where(present, np.where(np.isnan(fast_ema), value, fast_alpha * value + (1 - fast_alpha) * fast_ema), fast_ema)
+        slow_ema = np.where(present, np.where(np.isnan(slow_ema), value, slow_alpha * value + (1 - slow_alpha) * slow_ema), slow_ema)
+        if column == columns - 2:
+            before = fast_ema - slow_ema
+    after = fast_ema - slow_ema
+
+    # Require a full slow period of history so the averages have settled
+    _, counts = _window_sums(prices, slow, columns - 1)
+    settled = counts == slow
+    fired = settled & np.where(up, (before <= 0) & (after > 0), (before >= 0) & (after < 0))
+    return fired, after
+
+def _evaluate_breakout(prices, alerts):
+    columns = prices.shape[1]
+    windows = np.array([alert['window_minutes'] for alert in alerts])
+    sigmas = np.array([alert['threshold_sigma'] for alert in alerts])
+    up = np.array([alert['change_type'] == 'up' for alert in alerts])
+    current = prices[:, -1]
+
+    # Statistics of the window before the current minute, relative to the current price
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = prices / current[:, None]
+    sums, counts = _window_sums(relative, windows, columns - 2)
+    squares, _ = _window_sums(relative * relative, windows, columns - 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sums / windows
+        deviation = np.sqrt(np.maximum(squares / windows - mean * mean, 0))
+        score = (1 - mean) / deviation
+    valid = (counts == windows) & (deviation > 0) & (current > 0)
+    fired = valid & np.where(up, score >= sigmas, score <= -sigmas)
+    return fired, score
+
+_EVALUATORS = {
+    'change': _evaluate_change,
+    'sma_cross': _evaluate_sma_cross,
+    'ema_cross': _evaluate_ema_cross,
+    'breakout': _evaluate_breakout,
+}
+
+class WindowedAlerts:
+    """
+    Registry of windowed alerts, evaluated in bulk with NumPy.
+
+    Unlike threshold alerts, windowed alerts look at how a token's price moved
+    over the last minutes rather than at a single reference price. Every
+    evaluation builds one price matrix for all tokens involved, and each alert
+    kind is evaluated for all of its alerts with whole-array operations.
+    """
+
+    def __init__(self):
+        self._alerts = {}     # key -> notification
+        self._symbols = {}    # symbol -> set of keys
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._alerts)
+
+    def update(self, key, notification):
+        """
+        Adds, replaces or (when `notification` is None or not windowed) removes
+        an alert. Suitable as a Store listener.
+        """
+        with self._lock:
+            previous = self._alerts.pop(key, None)
+            if previous is not None:
+                keys = self._symbols[previous['symbol']]
+                keys.discard(key)
+                if not keys:
+                    del self._symbols[previous['symbol']]
+            if is_windowed(notification):
+                self._alerts[key] = dict(notification)
+                self._symbols.setdefault(notification['symbol'], set()).add(key)
+
+    def symbols(self):
+        """
+        Returns:
+            set: The symbols that have at least one windowed alert.
+        """
+        with self._lock:
+            return set(self._symbols)
+
+    def evaluate(self, history, token_keys, now):
+        """
+        Evaluates the windowed alerts of the given tokens.
+
+        Args:
+            history (PriceHistory): The price history the windows are read from.
+            token_keys (dict): History keys (see price_key()) by symbol, for the tokens to evaluate.
+            now (float): The current Unix time.
+
+        Returns:
+            list: (notification key, notification, value) for every alert that fired,
+                  where value is the measured change, average gap or deviation score.
+                  Alerts that fired within their cooldown are left out.
+        """
+        with self._lock:
+            alerts = [(key, alert) for symbol in token_keys for key, alert in
+                      ((key, self._alerts[key]) for key in self._symbols.get(symbol, ()))]
+        if not alerts:
+            return []
+
+        symbols = sorted({alert['symbol'] for _, alert in alerts})
+        rows = {symbol: row for row, symbol in enumerate(symbols)}
+        columns = max(_span(alert) for _, alert in alerts) + 1
+        matrix = price_matrix(history, [token_keys[symbol] for symbol in symbols], columns, now)
+
+        fired = []
+        for kind, evaluator in _EVALUATORS.items():
+            group = [(key, alert) for key, alert in alerts if alert['kind'] == kind]
+            if not group:
+                continue
+            prices = matrix[[rows[alert['symbol']] for _, alert in group]]
+            hits, values = evaluator(prices, [alert for _, alert in group])
+            for index in np.flatnonzero(hits):
+                key, alert = group[index]
+                if now - alert.get('fired_at', 0) >= _cooldown(alert):
+                    fired.append((key, alert, float(values[index])))
+        return fired
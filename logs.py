@@ -0,0 +1,195 @@
+import os
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+#===============================================
+#================= FORMATTING ==================
+#===============================================
+
+TEXT_FORMAT = '%(asctime)s:%(levelname)s:%(message)s'
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats records as compact JSON objects, one per line.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+#===============================================
+#================= SUPPRESSION =================
+#===============================================
+
+class DuplicateFilter(logging.Filter):
+    """
+    Drops repeats of the same warning or error within `interval` seconds.
+
+    The first occurrence of a message passes. Repeats are counted and dropped
+    until the interval has passed, and the next occurrence after that is
+    passed with the number of suppressed repeats appended. Messages below
+    WARNING are never suppressed.
+    """
+
+    def __init__(self, interval=300, max_messages=10000, clock=time.monotonic):
+        """
+        Args:
+            interval (float): Seconds during which repeats of a message are dropped.
+            max_messages (int): Distinct messages tracked; the least recent are forgotten.
+            clock (callable): Monotonic time source, replaceable for testing.
+        """
+        super().__init__()
+        self.interval = interval
+        self.max_messages = max_messages
+        self._clock = clock
+        self._seen = OrderedDict()  # (level, message) -> [passed_at, suppressed count]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.levelno, record.getMessage())
+        now = self._clock()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and now - seen[0] < self.interval:
+                seen[1] += 1
+                return False
+            suppressed = seen[1] if seen is not None else 0
+            self._seen[key] = [now, 0]
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_messages:
+                self._seen.popitem(last=False)
+        if suppressed:
+            record.msg = f"{record.getMessage()} (repeated {suppressed} more times in the last {now - seen[0]:.0f}s)"
+            record.args = None
+        return True
+
+#===============================================
+#================= ROTATION ====================
+#===============================================
+
+class RotatingLogFileHandler(RotatingFileHandler):
+    """
+    File handler rotating when the file reaches `max_bytes` or is `interval`
+    seconds old, whichever comes first, keeping `backup_count` numbered backups.
+    """
+
+    def __init__(self, filename, max_bytes=10000000, backup_count=5, interval=86400):
+        """
+        Args:
+            filename (str): The log file.
+            max_bytes (int): Size at which the file is rotated; 0 disables size rotation.
+            backup_count (int): Rotated files kept, as filename.1 (newest) to filename.N.
+            interval (float): Seconds after which the file is rotated; 0 disables time rotation.
+        """
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.interval = interval
+        try:
+            started = os.path.getmtime(filename)
+        except OSError:
+            started = time.time()
+        self.rollover_at = started + interval if interval else None
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+#===============================================
+#================= PIPELINE ====================
+#===============================================
+
+class _DeferredQueueHandler(QueueHandler):
+    # Merges the arguments into the message before the record is queued, as
+    # callers pass live objects that may change before the listener gets to
+    # them; the formatting into a line is left to the listener thread. The
+    # records stay in this process, so exc_info need not be made picklable.
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_listener = None
+_queue_handler = None
+_listener_lock = threading.Lock()
+
+def start_logging(filename, level=logging.INFO, json_lines=False, max_bytes=10000000, backup_count=5,
+                  interval=86400, suppress_interval=300):
+    """
+    Routes the root logger through a queue to a background thread writing a rotated file.
+
+    Logging calls only put the record on an in-memory queue, so the threads
+    handling updates and polling prices never wait for the disk. Repeated
+    warnings and errors are suppressed before they are queued.
+
+    Args:
+        filename (str): The log file.
+        level (int): Minimum level logged.
+        json_lines (bool): Write JSON lines instead of text, see JsonLinesFormatter.
+        max_bytes (int): See RotatingLogFileHandler.
+        backup_count (int): See RotatingLogFileHandler.
+        interval (float): See RotatingLogFileHandler.
+        suppress_interval (float): See DuplicateFilter; 0 disables suppression.
+    """
+    global _listener, _queue_handler
+    with _listener_lock:
+        if _listener is not None:
+            return
+        file_handler = RotatingLogFileHandler(filename, max_bytes=max_bytes, backup_count=backup_count, interval=interval)
+        file_handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(TEXT_FORMAT))
+
+        records = queue.SimpleQueue()
+        queue_handler = _DeferredQueueHandler(records)
+        if suppress_interval:
+            queue_handler.addFilter(DuplicateFilter(interval=suppress_interval))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _queue_handler = queue_handler
+        _listener = QueueListener(records, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+def stop_logging():
+    """
+    Writes the queued records and stops the background thread. Records logged
+    afterwards are written directly. Safe to call more than once.
+    """
+    global _listener, _queue_handler
+    with _listener_lock:
+        listener, _listener = _listener, None
+        queue_handler, _queue_handler = _queue_handler, None
+        if listener is None:
+            return
+        listener.stop()
+        root = logging.getLogger()
+        root.removeHandler(queue_handler)
+        for handler in listener.handlers:
+            handler.filters = queue_handler.filters
+            root.addHandler(handler)
@@ -0,0 +1,398 @@
+import sys
+import time
+import logging
+import threading
+import functools
+from collections import Counter as _StackCounter
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#===============================================
+#================= METRICS =====================
+#===============================================
+
+# Latency buckets in seconds, from a cached lookup to a slow API call with retries
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in sorted(values.items())]
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets, optionally split by labels.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        samples = []
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), values):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", _format_labels(self.labels, key, [('le', _format_value(bound))]), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labels, key), values[-1]))
+            samples.append((f"{self.name}_count", _format_labels(self.labels, key), cumulative))
+        return samples
+
+class Gauge:
+    """
+    Value read from a callback when the metrics are collected. The callback
+    returns a number, or a dict of numbers by the value of the single label.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, callback, label=None):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.label = label
+
+    def samples(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            logging.error("Failed to collect metric %s: %s", self.name, e)
+            return []
+        if self.label is None:
+            return [(self.name, '', value)]
+        return [(self.name, _format_labels((self.label,), (key,)), item) for key, item in sorted(value.items())]
+
+class Registry:
+    """
+    Set of metrics rendered together in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} is already registered as a {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, callback, label=None):
+        """
+        Registers a gauge, replacing any gauge registered under the same name.
+        """
+        with self._lock:
+            self._metrics[name] = Gauge(name, help, callback, label)
+
+    def render(self):
+        """
+        Returns:
+            str: All metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+CALLS = registry.counter('pricetracker_calls_total',
+                         "Calls of instrumented functions by outcome ('ok' or 'error').",
+                         labels=('function', 'outcome'))
+CALL_DURATION = registry.histogram('pricetracker_call_duration_seconds',
+                                   "Duration of calls of instrumented functions.",
+                                   labels=('function',))
+
+def observe_call(name, seconds, failed=False):
+    """
+    Records one call of an instrumented function or block.
+    """
+    CALLS.inc(function=name, outcome='error' if failed else 'ok')
+    CALL_DURATION.observe(seconds, function=name)
+
+def instrumented(function=None, name=None):
+    """
+    Decorator counting the calls of a function and recording their duration.
+
+    Usable bare (@instrumented) or with a metric label (@instrumented(name='...'));
+    the label defaults to the function's name.
+    """
+    if function is None:
+        return functools.partial(instrumented, name=name)
+    label = name or function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            observe_call(label, time.perf_counter() - started, failed)
+    return wrapper
+
+def instrument_handlers(bot):
+    """
+    Instruments every message and callback query handler registered on the bot so
+    far, labelling each with the name of its function.
+
+    Args:
+        bot (telebot.TeleBot): The bot whose handlers are instrumented.
+    """
+    for handlers in (bot.message_handlers, bot.callback_query_handlers):
+        for handler in handlers:
+            function = handler['function']
+            if not getattr(function, '_instrumented', False):
+                handler['function'] = instrumented(function, name=f"handler:{function.__name__}")
+                handler['function']._instrumented = True
+
+#===============================================
+#================= PROFILER ====================
+#===============================================
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the stacks of all threads at a fixed interval.
+
+    Stacks are counted in the collapsed format used by flame graph tools: one
+    line per distinct stack, frames root first separated by ';', followed by
+    the number of samples. Sampling from a background thread costs little
+    compared to a tracing profiler, so it can run in production.
+    """
+
+    def __init__(self, interval=0.01):
+        """
+        Args:
+            interval (float): Seconds between two samples.
+        """
+        self.interval = interval
+        self.samples = 0
+        self._stacks = _StackCounter()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            stacks.append(';'.join(reversed(frames)))
+        with self._lock:
+            self.samples += 1
+            self._stacks.update(stacks)
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+            logging.info("Sampling profiler started, one sample every %.0f ms.", self.interval * 1000)
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def hot_stacks(self, limit=None):
+        """
+        Returns:
+            list: (stack, samples) pairs, most sampled first.
+        """
+        with self._lock:
+            return self._stacks.most_common(limit)
+
+    def collapsed(self, limit=None):
+        """
+        Returns:
+            str: The sampled stacks in the collapsed format, most sampled first.
+        """
+        return ''.join(f"{stack} {count}\n" for stack, count in self.hot_stacks(limit))
+
+    def dump(self, path):
+        """
+        Writes the sampled stacks to a file in the collapsed format.
+        """
+        with open(path, 'w') as file:
+            file.write(self.collapsed())
+        logging.info("Wrote %s profiler samples to %s.", self.samples, path)
+
+#===============================================
+#================= HTTP ENDPOINT ===============
+#===============================================
+
+class MetricsServer:
+    """
+    Local HTTP endpoint exposing the metrics and an on-demand profile.
+
+    GET /metrics returns the registry in the Prometheus text format.
+    GET /debug/profile?seconds=N samples all threads for N seconds (at most 60)
+    and returns the hot stacks in the collapsed format. The endpoint is meant
+    to be reachable from the host only; it is not authenticated.
+    """
+
+    MAX_PROFILE_SECONDS = 60
+
+    def __init__(self, host='127.0.0.1', port=9100, registry=registry):
+        """
+        Args:
+            host (str): Interface to listen on.
+            port (int): Port to listen on; 0 picks a free port.
+            registry (Registry): The metrics to expose.
+        """
+        self.registry = registry
+        self._profile_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def profile(self, seconds):
+        """
+        Samples all threads for `seconds` seconds, one profile at a time.
+
+        Returns:
+            str: The hot stacks in the collapsed format.
+        """
+        with self._profile_lock:
+            profiler = SamplingProfiler()
+            profiler.start()
+            time.sleep(seconds)
+            profiler.stop()
+            return profiler.collapsed()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == '/metrics':
+                    self._reply(server.registry.render(), 'text/plain; version=0.0.4')
+                elif url.path == '/debug/profile':
+                    try:
+                        seconds = float(parse_qs(url.query).get('seconds', ['10'])[0])
+                    except ValueError:
+                        self.send_error(400)
+                        return
+                    seconds = min(max(seconds, 0.1), server.MAX_PROFILE_SECONDS)
+                    self._reply(server.profile(seconds), 'text/plain')
+                else:
+                    self.send_error(404)
+
+            def _reply(self, text, content_type):
+                body = text.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+        """
+        thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        thread.start()
+        logging.info("Metrics server listening on %s:%s/metrics", self._server.server_address[0], self.port)
+        return thread
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
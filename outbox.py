@@ -0,0 +1,275 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+
+#===============================================
+#================= RATE LIMITING ===============
+#===============================================
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: allows `rate` events per second on average with
+    bursts of up to `capacity` events.
+    """
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available_at(self, now):
+        """
+        Returns:
+            float: The earliest time at which a token can be taken.
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+#===============================================
+#================= OUTBOX ======================
+#===============================================
+
+class _Batch:
+    """
+    Text parts queued for one chat that will be sent as a single message.
+    """
+
+    def __init__(self, ready_at):
+        self.parts = []
+        self.length = 0
+        self.ready_at = ready_at
+        self.attempts = 0
+
+    def text(self):
+        return "\n\n".join(self.parts)
+
+class MessageOutbox:
+    """
+    Queues outgoing Telegram messages and sends them from a background thread.
+
+    Messages for the same chat queued within `merge_window` seconds are merged
+    into one message (up to Telegram's length limit). Sending respects a
+    per-chat and a global token bucket, and a 429 response delays that chat by
+    the retry_after the server returned. Callers never wait on Telegram I/O.
+    """
+
+    MAX_MESSAGE_LENGTH = 4096
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, send, global_rate=25, chat_rate=1, chat_burst=3, merge_window=1.0, clock=time.monotonic):
+        """
+        Args:
+            send (callable): Sends one message, called as send(chat_id, text), e.g. bot.send_message.
+            global_rate (float): Messages per second across all chats.
+            chat_rate (float): Messages per second to a single chat.
+            chat_burst (int): Messages a single chat may receive in a burst.
+            merge_window (float): Seconds to wait for more messages to the same chat before sending.
+            clock (callable): Monotonic time source, replaceable for testing.
+        """
+        self._send = send
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.merge_window = merge_window
+        self._clock = clock
+        self._global_bucket = TokenBucket(global_rate, global_rate, clock())
+        self._chat_buckets = {}
+        self._blocked_until = {}      # chat_id -> time before which nothing is sent after a 429
+        self._pending = {}            # chat_id -> deque of _Batch
+        self._heap = []               # (time, seq, chat_id) candidates for the next send
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._stats = {'queued': 0, 'sent': 0, 'merged': 0, 'rate_limited': 0, 'failed': 0}
+
+    def stats(self):
+        """
+        Returns:
+            dict: Counters of messages queued, sent, merged into another message,
+                  rate limited by Telegram (429) and dropped after failures,
+                  plus the number of chats with pending messages.
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['pending_chats'] = len(self._pending)
+        return stats
+
+    def send(self, chat_id, text):
+        """
+        Queues a message. Returns immediately.
+
+        Args:
+            chat_id (int): The destination chat.
+            text (str): The message text.
+        """
+        with self._condition:
+            now = self._clock()
+            self._stats['queued'] += 1
+            batches = self._pending.setdefault(chat_id, deque())
+            batch = batches[-1] if batches else None
+            separator = 2 if batch and batch.parts else 0
+            if batch is None or batch.attempts or batch.length + separator + len(text) > self.MAX_MESSAGE_LENGTH:
+                batch = _Batch(now + self.merge_window)
+                batches.append(batch)
+                separator = 0
+                if len(batches) == 1:
+                    heapq.heappush(self._heap, (batch.ready_at, next(self._seq), chat_id))
+            else:
+                self._stats['merged'] += bool(batch.parts)
+            batch.parts.append(text)
+            batch.length += separator + len(text)
+            self._condition.notify()
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _send_time(self, chat_id, now):
+        # Must be called with the lock held. The earliest time the head batch of the chat may go out.
+        batch = self._pending[chat_id][0]
+        return max(0 if self._stopping else batch.ready_at,
+                   self._blocked_until.get(chat_id, 0),
+                   self._chat_bucket(chat_id, now).available_at(now))
+
+    def _next_batch(self):
+        # Waits until a batch may be sent and returns (chat_id, batch), or None once stopped and drained
+        with self._condition:
+            while True:
+                now = self._clock()
+                if not self._heap:
+                    if self._stopping:
+                        return None
+                    self._condition.wait()
+                    continue
+                when, _, chat_id = self._heap[0]
+                if chat_id not in self._pending:
+                    heapq.heappop(self._heap)
+                    continue
+                actual = self._send_time(chat_id, now)
+                if actual > now:
+                    # Allow for rounding in the token bucket arithmetic
+                    if actual > when + 1e-6:
+                        # Not sendable as early as queued; move it back and look at the next chat
+                        heapq.heapreplace(self._heap, (actual, next(self._seq), chat_id))
+                    else:
+                        self._condition.wait(actual - now)
+                    continue
+                wait = self._global_bucket.available_at(now) - now
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                batches = self._pending[chat_id]
+                batch = batches.popleft()
+                if batches:
+                    heapq.heappush(self._heap, (batches[0].ready_at, next(self._seq), chat_id))
+                else:
+                    del self._pending[chat_id]
+                self._global_bucket.take(now)
+                self._chat_bucket(chat_id, now).take(now)
+                return chat_id, batch
+
+    def _requeue(self, chat_id, batch, delay=0.0, stat=None):
+        # Puts a batch back at the head of its chat's queue
+        with self._condition:
+            if stat:
+                self._stats[stat] += 1
+            now = self._clock()
+            batches = self._pending.setdefault(chat_id, deque())
+            batches.appendleft(batch)
+            if delay:
+                self._blocked_until[chat_id] = now + delay
+            heapq.heappush(self._heap, (now + delay, next(self._seq), chat_id))
+            self._condition.notify()
+
+    def _finish(self, chat_id, stat, count):
+        with self._condition:
+            self._stats[stat] += count
+            now = self._clock()
+            # Forget chats that are idle and fully recovered
+            if chat_id not in self._pending:
+                if self._blocked_until.get(chat_id, now) <= now:
+                    self._blocked_until.pop(chat_id, None)
+                bucket = self._chat_buckets.get(chat_id)
+                if bucket and bucket.is_full(now):
+                    del self._chat_buckets[chat_id]
+
+    def _run(self):
+        while True:
+            item = self._next_batch()
+            if item is None:
+                return
+            chat_id, batch = item
+            batch.attempts += 1
+            try:
+                self._send(chat_id, batch.text())
+                self._finish(chat_id, 'sent', len(batch.parts))
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    logging.warning("Telegram rate limit hit for chat %s; retrying in %ss", chat_id, retry_after)
+                    batch.attempts -= 1  # rate limiting is not a failed attempt
+                    self._requeue(chat_id, batch, retry_after, stat='rate_limited')
+                elif batch.attempts < self.MAX_ATTEMPTS:
+                    logging.warning("Failed to send message to chat %s (attempt %s): %s", chat_id, batch.attempts, e)
+                    self._requeue(chat_id, batch, 2 ** batch.attempts)
+                else:
+                    logging.error("Dropping message to chat %s after %s attempts: %s", chat_id, batch.attempts, e)
+                    self._finish(chat_id, 'failed', len(batch.parts))
+
+    def start(self):
+        """
+        Starts the sender thread.
+        """
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='outbox', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Sends what is still queued without waiting for merge windows, then stops
+        the sender thread.
+
+        Args:
+            timeout (float): Maximum seconds to wait for the queue to drain.
+        """
+        with self._condition:
+            thread = self._thread
+            self._stopping = True
+            self._condition.notify()
+        if thread is not None:
+            thread.join(timeout)
+        with self._condition:
+            self._thread = None
+
+def _retry_after(exception):
+    """
+    Returns the retry_after of a Telegram 429 error, or None for any other exception.
+    """
+    if getattr(exception, 'error_code', None) != 429:
+        return None
+    parameters = (getattr(exception, 'result_json', None) or {}).get('parameters') or {}
+    return parameters.get('retry_after', 1)
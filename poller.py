@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import observe_call
+from utils import refresh_token_prices, price_key, DEXSCREENER_BATCH_SIZE
+
+#===============================================
+#================= POLLING ENGINE ==============
+#===============================================
+
+class PricePoller:
+    """
+    Runs price polling cycles on a fixed cadence in a dedicated asyncio event loop.
+
+    Cycles start every `interval` seconds measured on the loop's monotonic clock,
+    so the period does not drift with the time a cycle takes. Price fetches within
+    a cycle run concurrently, at most `concurrency` batched requests at a time.
+    """
+
+    def __init__(self, cycle, interval=300, concurrency=8, clock=None, sleep=asyncio.sleep):
+        """
+        Args:
+            cycle (callable): Coroutine function called with the poller once per cycle.
+            interval (float): Seconds between the start of two cycles.
+            concurrency (int): Maximum number of price requests in flight.
+            clock (callable): Monotonic time source, replaceable for testing.
+                              Defaults to the event loop's clock.
+            sleep (callable): Coroutine function waiting the given seconds, replaceable for testing.
+        """
+        self.cycle = cycle
+        self.interval = interval
+        self.concurrency = concurrency
+        self._clock = clock
+        self._sleep = sleep
+        self._loop = None
+        self._task = None
+        self._semaphore = None
+        self._stop_requested = threading.Event()
+
+    async def fetch_prices(self, tokens):
+        """
+        Fetches fresh prices for watchlist tokens in concurrent batches.
+
+        Args:
+            tokens (iterable): Watchlist entries with 'network' and 'address' keys.
+
+        Returns:
+            dict: A mapping of price_key(network, address) to price in USD, or 'N/A'.
+        """
+        unique = {price_key(token['network'], token['address']): token for token in tokens}
+        tokens = list(unique.values())
+        batches = [tokens[i:i + DEXSCREENER_BATCH_SIZE] for i in range(0, len(tokens), DEXSCREENER_BATCH_SIZE)]
+
+        async def fetch(batch):
+            async with self._semaphore:
+                return await asyncio.to_thread(refresh_token_prices, batch)
+
+        prices = {}
+        for result in await asyncio.gather(*(fetch(batch) for batch in batches)):
+            prices.update(result)
+        return prices
+
+    async def run(self):
+        """
+        Runs cycles until cancelled.
+        """
+        clock = self._clock or asyncio.get_running_loop().time
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        next_run = clock()
+
+        while True:
+            started = clock()
+            failed = False
+            try:
+                await self.cycle(self)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failed = True
+                logging.error("Polling cycle failed: %s", e)
+            observe_call('poll_cycle', clock() - started, failed)
+            logging.info("Polling cycle finished in %.2fs", clock() - started)
+
+            next_run += self.interval
+            if next_run < clock():
+                # The cycle overran one or more periods; skip them instead of bursting
+                missed = int((clock() - next_run) // self.interval) + 1
+                logging.warning("Polling cycle overran its interval; skipping %s cycle(s).", missed)
+                next_run += missed * self.interval
+            await self._sleep(next_run - clock())
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop.set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='poller'))
+        self._task = asyncio.current_task()
+        if self._stop_requested.is_set():
+            return
+        try:
+            await self.run()
+        except asyncio.CancelledError:
+            logging.info("Price polling service stopped.")
+
+    def run_forever(self):
+        """
+        Runs the poller in the calling thread until stop() is called.
+        """
+        try:
+            asyncio.run(self._main())
+        finally:
+            self._loop = None
+            self._task = None
+            self._stop_requested.clear()
+
+    def stop(self):
+        """
+        Cancels the running cycle and stops the poller. Safe to call from any thread.
+        """
+        self._stop_requested.set()
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # The loop already closed
+                pass
@@ -0,0 +1,221 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+#===============================================
+#================= PRICE CACHE =================
+#===============================================
+
+def price_key(network, address):
+    """
+    Builds the cache key for a token.
+
+    Args:
+        network (str): The network the token is deployed on (e.g. 'eth').
+        address (str): The token contract address.
+
+    Returns:
+        tuple: A (network, address) pair normalised to lowercase.
+    """
+    return (network or '').lower(), address.lower()
+
+class _Flight:
+    """
+    A lookup in progress. Other threads missing on the same key wait on it
+    instead of issuing their own request.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+class PriceCache:
+    """
+    Thread-safe TTL cache of token prices with LRU eviction.
+
+    Entries older than `ttl` seconds are treated as misses. When the cache holds
+    more than `max_size` entries the least recently used ones are dropped.
+    Concurrent misses for the same key are de-duplicated so only one caller
+    runs the loader while the others wait for its result.
+    """
+
+    def __init__(self, ttl=300, max_size=10000, clock=time.monotonic):
+        """
+        Args:
+            ttl (float): Seconds an entry stays fresh.
+            max_size (int): Maximum number of entries kept.
+            clock (callable): Monotonic time source, replaceable for testing.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _fresh_value(self, key, max_age):
+        # Must be called with the lock held
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self._clock() - stored_at > max_age:
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key, value):
+        # Must be called with the lock held
+        self._entries[key] = (self._clock(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, key, max_age=None):
+        """
+        Returns the cached value for `key` if it is fresh.
+
+        Args:
+            key (tuple): The cache key, see price_key().
+            max_age (float): Optional freshness bound overriding the cache TTL.
+
+        Returns:
+            The cached value, or None on a miss or stale entry.
+        """
+        with self._lock:
+            return self._fresh_value(key, self.ttl if max_age is None else max_age)
+
+    def set(self, key, value):
+        """
+        Stores a value, replacing any previous entry for `key`.
+        """
+        with self._lock:
+            self._store(key, value)
+
+    def set_many(self, values):
+        """
+        Stores several values at once.
+
+        Args:
+            values (dict): A mapping of cache key to value.
+        """
+        with self._lock:
+            for key, value in values.items():
+                self._store(key, value)
+
+    def invalidate(self, key):
+        """
+        Drops the entry for `key`, if any.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Drops every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        """
+        Returns:
+            list: (key, value, age in seconds) for every entry, least recently used first.
+        """
+        with self._lock:
+            now = self._clock()
+            return [(key, value, now - stored_at) for key, (stored_at, value) in self._entries.items()]
+
+    def restore(self, entries, elapsed=0.0):
+        """
+        Loads entries from a snapshot() taken `elapsed` seconds ago, keeping their
+        age so they expire when they would have. Stale entries are skipped and
+        entries already cached are kept.
+
+        Args:
+            entries (iterable): (key, value, age) triples as returned by snapshot().
+            elapsed (float): Seconds since the snapshot was taken.
+
+        Returns:
+            int: The number of entries restored.
+        """
+        restored = 0
+        with self._lock:
+            now = self._clock()
+            # Restored entries are older than anything cached since startup, so they go
+            # in front, keeping their order among themselves
+            for key, value, age in reversed(list(entries)):
+                age += elapsed
+                if age > self.ttl or key in self._entries:
+                    continue
+                self._entries[key] = (now - age, value)
+                self._entries.move_to_end(key, last=False)
+                restored += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return restored
+
+    def get_many(self, keys, loader, max_age=None):
+        """
+        Returns values for `keys`, loading the missing ones with a single loader call.
+
+        Keys that another thread is already loading are not passed to `loader`;
+        this call waits for that thread's result instead.
+
+        Args:
+            keys (iterable): The cache keys wanted.
+            loader (callable): Called with the list of keys to load. It must return
+                               a dict of key to value for the keys it could resolve;
+                               keys it leaves out are not cached.
+            max_age (float): Optional freshness bound overriding the cache TTL.
+
+        Returns:
+            dict: A mapping of key to value for every key that is cached or was loaded.
+        """
+        max_age = self.ttl if max_age is None else max_age
+        results = {}
+        owned = {}
+        waiting = {}
+
+        with self._lock:
+            for key in keys:
+                if key in results or key in owned or key in waiting:
+                    continue
+                value = self._fresh_value(key, max_age)
+                if value is not None:
+                    results[key] = value
+                elif key in self._inflight:
+                    waiting[key] = self._inflight[key]
+                else:
+                    flight = _Flight()
+                    self._inflight[key] = flight
+                    owned[key] = flight
+
+        if owned:
+            loaded = {}
+            try:
+                loaded = loader(list(owned)) or {}
+            except Exception as e:
+                logging.error("Price cache loader failed for %s keys: %s", len(owned), e)
+            finally:
+                with self._lock:
+                    for key, flight in owned.items():
+                        value = loaded.get(key)
+                        if value is not None:
+                            self._store(key, value)
+                            results[key] = value
+                        flight.value = value
+                        del self._inflight[key]
+                        flight.event.set()
+
+        for key, flight in waiting.items():
+            flight.event.wait()
+            if flight.value is not None:
+                results[key] = flight.value
+
+        return results
@@ -0,0 +1,500 @@
+"""
+Offline replay of recorded price series through the threshold alert rules, to
+see how noisy an 'up N%' or 'down N%' alert would have been before rolling it out.
+
+The series are sampled at a fixed polling interval and evaluated with the same
+semantics as alerts.evaluate_threshold_alerts(), which process_price_updates()
+runs on every poll: an alert fires when the polled price
+crosses the trigger computed from its reference price, and the reference is
+reset to the polled price when the alert fires, on the first poll, and once it
+is older than POLL_INTERVAL. For every rule the replay reports how often it
+fired, how long after the price first crossed the trigger the poll noticed it,
+crossings missed because the price reverted between two polls, and the number
+of messages the users owning the rule would have received.
+
+Usage:
+    python replay.py prices.csv [more series...] [--rule "up 10%" ...] [--interval 30 --interval 300]
+                     [--reset-interval 300] [--save-binary prices.bin] [--json results.json]
+"""
+import csv
+import json
+import mmap
+import time
+import struct
+import argparse
+from array import array
+from datetime import datetime, timezone
+import numpy as np
+
+#===============================================
+#================= SERIES FILES ================
+#===============================================
+
+# Binary series file: a header, then for every series its entry, the UTF-8
+# symbol padded to 8 bytes, and the timestamps and prices as little-endian doubles
+_MAGIC = b'PTREPL01'
+_HEADER = struct.Struct('<8sQ')    # magic, number of series
+_ENTRY = struct.Struct('<HQ')      # symbol length, number of ticks
+_DOUBLE = 8
+
+def _padding(offset):
+    return -offset % _DOUBLE
+
+def _timestamp(text):
+    try:
+        return float(text)
+    except ValueError:
+        moment = datetime.fromisoformat(text.strip().replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+
+def _clean(times, prices):
+    # Drops unusable ticks, like the bot skips 'N/A' prices, and orders the rest by time
+    valid = np.isfinite(times) & np.isfinite(prices) & (prices > 0)
+    times, prices = times[valid], prices[valid]
+    if len(times) > 1 and np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind='stable')
+        times, prices = times[order], prices[order]
+    return times, prices
+
+def load_csv(path):
+    """
+    Reads price series from a CSV file of timestamp,symbol,price rows.
+
+    Timestamps are Unix seconds or ISO 8601 dates (UTC unless they carry an
+    offset). A header row and lines starting with '#' are skipped.
+
+    Args:
+        path (str): The CSV file.
+
+    Returns:
+        dict: (timestamps, prices) as float64 arrays sorted by time, by symbol.
+    """
+    columns = {}
+    with open(path, newline='') as f:
+        for line, row in enumerate(csv.reader(f), 1):
+            if not row or row[0].startswith('#'):
+                continue
+            if len(row) != 3:
+                raise ValueError(f"{path}:{line}: expected timestamp,symbol,price")
+            try:
+                timestamp, price = _timestamp(row[0]), float(row[2])
+            except ValueError:
+                if line == 1:
+                    continue
+                raise ValueError(f"{path}:{line}: invalid timestamp or price") from None
+            times, prices = columns.setdefault(row[1].strip(), (array('d'), array('d')))
+            times.append(timestamp)
+            prices.append(price)
+    return {symbol: _clean(np.frombuffer(times), np.frombuffer(prices)) for symbol, (times, prices) in columns.items()}
+
+def save_binary(series, path):
+    """
+    Writes price series to a binary series file, which loads without parsing.
+
+    Args:
+        series (dict): (timestamps, prices) arrays by symbol.
+        path (str): The file to write.
+    """
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(series)))
+        offset = _HEADER.size
+        for symbol, (times, prices) in series.items():
+            raw = symbol.encode('utf-8')
+            offset += _ENTRY.size + len(raw)
+            f.write(_ENTRY.pack(len(raw), len(times)) + raw + b'\0' * _padding(offset))
+            offset += _padding(offset)
+            for values in (times, prices):
+                data = np.ascontiguousarray(values, dtype='<f8').tobytes()
+                f.write(data)
+                offset += len(data)
+
+def load_binary(path):
+    """
+    Maps a binary series file written by save_binary().
+
+    Returns:
+        dict: (timestamps, prices) arrays by symbol, backed by the mapped file.
+    """
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, count = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError(f"{path} is not a price series file")
+    series = {}
+    offset = _HEADER.size
+    for _ in range(count):
+        length, ticks = _ENTRY.unpack_from(data, offset)
+        offset += _ENTRY.size
+        symbol = data[offset:offset + length].decode('utf-8')
+        offset += length
+        offset += _padding(offset)
+        times = np.frombuffer(data, dtype='<f8', count=ticks, offset=offset)
+        prices = np.frombuffer(data, dtype='<f8', count=ticks, offset=offset + ticks * _DOUBLE)
+        offset += 2 * ticks * _DOUBLE
+        series[symbol] = (times, prices)
+    return series
+
+def load_series(paths):
+    """
+    Loads and merges price series from CSV and binary series files.
+
+    Args:
+        paths (list): The files; binary files are recognized by their header.
+
+    Returns:
+        dict: (timestamps, prices) arrays sorted by time, by symbol.
+    """
+    series = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            binary = f.read(len(_MAGIC)) == _MAGIC
+        for symbol, (times, prices) in (load_binary(path) if binary else load_csv(path)).items():
+            if symbol in series:
+                times, prices = _clean(np.concatenate((series[symbol][0], times)),
+                                       np.concatenate((series[symbol][1], prices)))
+            series[symbol] = (times, prices)
+    return series
+
+#===============================================
+#================= POLLING =====================
+#===============================================
+
+class PolledSeries:
+    """
+    A price series as seen by a poller running every `interval` seconds.
+
+    Poll k sees the last tick at or before its time. Polls before the first
+    tick or after the last one are dropped, as the bot skips tokens it gets no
+    price for. Interval k covers the ticks after poll k-1 up to poll k; their
+    highest and lowest price tell whether a trigger was crossed in between.
+    """
+
+    def __init__(self, times, prices, start, end, interval):
+        """
+        Args:
+            times (numpy.ndarray): Tick timestamps, sorted.
+            prices (numpy.ndarray): Tick prices.
+            start (float): Time of the first poll.
+            end (float): Time after which no poll happens.
+            interval (float): Seconds between two polls.
+        """
+        self.tick_times = times
+        self.tick_prices = prices
+        grid = start + interval * np.arange(int((end - start) // interval) + 1)
+        last = np.searchsorted(times, grid, side='right') - 1
+        valid = (last >= 0) & (grid <= times[-1]) if len(times) else np.zeros(len(grid), dtype=bool)
+        self.times = grid[valid]
+        self.last = last[valid]
+        self.prices = prices[self.last]
+
+        first = np.empty_like(self.last)
+        if len(first):
+            first[0] = self.last[0]
+            first[1:] = self.last[:-1] + 1
+        self.first = first
+        self.highs = self.prices.copy()
+        self.lows = self.prices.copy()
+        nonempty = self.last >= first
+        if nonempty.any():
+            # Intervals with ticks are contiguous, so one reduceat covers all of them
+            ticks = prices[:self.last[-1] + 1]
+            self.highs[nonempty] = np.maximum.reduceat(ticks, first[nonempty])
+            self.lows[nonempty] = np.minimum.reduceat(ticks, first[nonempty])
+
+    def __len__(self):
+        return len(self.times)
+
+#===============================================
+#================= EVALUATION ==================
+#===============================================
+
+# Cells of the (thresholds x polls) matrices evaluated at once, bounding memory
+_CHUNK_CELLS = 1 << 22
+
+def _first_crossings(values, triggers, reset_at, up):
+    # For every reference poll j, the first poll k in (j, reset_at[j]] whose value
+    # crosses the trigger set at j, or len(values) if there is none
+    count, n = triggers.shape
+    first = np.full((count, n), n, dtype=np.int64)
+    steps = np.arange(n)
+    span = int((reset_at - steps).max()) if n else 0
+    for d in range(1, min(span, n - 1) + 1):
+        head = triggers[:, :n - d]
+        crossed = values[d:] >= head if up else values[d:] <= head
+        crossed &= (steps[:n - d] + d <= reset_at[:n - d])
+        crossed &= first[:, :n - d] == n
+        first[:, :n - d][crossed] = (steps[:n - d] + d)[np.nonzero(crossed)[1]]
+    return first
+
+def _crossing_times(polls, intervals, triggers, up):
+    # Time of the first tick crossing each trigger within the given intervals
+    lows = polls.first[intervals]
+    counts = polls.last[intervals] - lows + 1
+    starts = np.cumsum(counts) - counts
+    ticks = np.arange(counts.sum()) - np.repeat(starts - lows, counts)
+    values = polls.tick_prices[ticks]
+    bounds = np.repeat(triggers, counts)
+    positions = np.flatnonzero(values >= bounds if up else values <= bounds)
+    return polls.tick_times[ticks[positions[np.searchsorted(positions, starts)]]]
+
+def simulate(polls, change_type, thresholds, reset_interval):
+    """
+    Replays threshold alerts of one token and direction over its polled series.
+
+    The evaluation follows alerts.evaluate_threshold_alerts(): the first poll
+    sets the reference price; a poll whose price is at or beyond the trigger
+    price (see alerts.trigger_price()) fires the alert; and the reference is
+    reset to the polled price when the alert fires or when it is older than
+    `reset_interval`. tests/test_replay.py checks that both fire the same alerts.
+    As the reference is always a polled price, the next event after every
+    possible reference poll is found with vectorized comparisons, leaving only
+    the chain of events actually taken to be walked per threshold.
+
+    Args:
+        polls (PolledSeries): The polled prices.
+        change_type (str): 'up' or 'down'.
+        thresholds (list): Thresholds in percent, e.g. [5.0, 10.0].
+        reset_interval (float): Age in seconds after which a reference price is reset.
+
+    Returns:
+        list: For every threshold, a dict with 'fired_at' (poll times of the
+              alerts), 'latency' (seconds from the first tick crossing the
+              trigger to the poll that fired) and 'missed' (crossings that
+              reverted before a poll saw them).
+    """
+    up = change_type == 'up'
+    n = len(polls)
+    if n == 0:
+        return [{'fired_at': np.empty(0), 'latency': np.empty(0), 'missed': 0} for _ in thresholds]
+    # First poll at which the reference set at each poll has expired, compared like TriggerIndex.expired()
+    reset_at = np.searchsorted(polls.times - reset_interval, polls.times, side='right')
+    factors = 1 + np.asarray(thresholds, dtype=np.float64) / 100 * (1 if up else -1)
+
+    results = []
+    chunk = max(1, _CHUNK_CELLS // n)
+    for offset in range(0, len(factors), chunk):
+        triggers = factors[offset:offset + chunk, None] * polls.prices[None, :]
+        fire_at = _first_crossings(polls.prices, triggers, reset_at, up)
+        seen_at = _first_crossings(polls.highs if up else polls.lows, triggers, reset_at, up)
+        for row in range(len(triggers)):
+            fired = fire_at[row] < n
+            following = np.where(fired, fire_at[row], reset_at).tolist()
+            # Walk the references actually taken, starting with the first poll
+            references = []
+            j = 0
+            while j < n:
+                references.append(j)
+                j = following[j]
+            references = np.asarray(references)
+            fires = references[fired[references]]
+            missed = int(np.count_nonzero(~fired[references] & (seen_at[row][references] < n)))
+            crossed_at = _crossing_times(polls, seen_at[row][fires], triggers[row][fires], up)
+            fired_at = polls.times[fire_at[row][fires]]
+            results.append({'fired_at': fired_at, 'latency': fired_at - crossed_at, 'missed': missed})
+    return results
+
+#===============================================
+#================= RULES =======================
+#===============================================
+
+def parse_rule(details):
+    """
+    Parses a threshold rule in the format of /addnotification, e.g. 'up 10%'.
+
+    Returns:
+        tuple: (change_type, threshold_percentage), or None if the format is invalid.
+    """
+    parts = details.strip().lower().split()
+    if len(parts) != 2 or parts[0] not in ('up', 'down'):
+        return None
+    try:
+        threshold = float(parts[1].rstrip('%'))
+    except ValueError:
+        return None
+    return (parts[0], threshold) if threshold > 0 else None
+
+def rule_label(change_type, threshold):
+    return f"{change_type} {threshold:g}%"
+
+def rules_from_notifications(notifications, symbols):
+    """
+    Groups the stored threshold notifications of the replayed tokens into rules.
+
+    Args:
+        notifications (list): (key, notification) pairs, see Store.list_notifications().
+        symbols (set): The symbols that have a price series.
+
+    Returns:
+        tuple: Alert counts by (symbol, change_type, threshold), and the number
+               of notifications that could not be replayed.
+    """
+    rules = {}
+    skipped = 0
+    for _, notification in notifications:
+        rule = (notification.get('change_type'), notification.get('threshold_percentage'))
+        if (notification.get('kind', 'threshold') != 'threshold' or notification.get('symbol') not in symbols
+                or rule[0] not in ('up', 'down') or not isinstance(rule[1], (int, float)) or rule[1] <= 0):
+            skipped += 1
+            continue
+        key = (notification['symbol'], rule[0], float(rule[1]))
+        rules[key] = rules.get(key, 0) + 1
+    return rules, skipped
+
+def replay(series, rules, interval, reset_interval):
+    """
+    Replays rules over price series polled every `interval` seconds.
+
+    Args:
+        series (dict): (timestamps, prices) arrays by symbol.
+        rules (dict): Alert counts by (symbol, change_type, threshold); every
+                      fire sends one message per alert.
+        interval (float): Seconds between two polls.
+        reset_interval (float): Age in seconds after which a reference price is reset.
+
+    Returns:
+        dict: Totals and per-rule statistics, see report().
+    """
+    started = time.perf_counter()
+    starts = [times[0] for times, _ in series.values() if len(times)]
+    ends = [times[-1] for times, _ in series.values() if len(times)]
+    start, end = (min(starts), max(ends)) if starts else (0.0, 0.0)
+
+    by_token = {}
+    for (symbol, change_type, threshold), alerts in rules.items():
+        by_token.setdefault((symbol, change_type), []).append((threshold, alerts))
+
+    outcomes = []
+    polled = {}
+    for (symbol, change_type), thresholds in sorted(by_token.items()):
+        if symbol not in polled:
+            polled[symbol] = PolledSeries(*series[symbol], start, end, interval)
+        results = simulate(polled[symbol], change_type, [threshold for threshold, _ in thresholds], reset_interval)
+        for (threshold, alerts), result in zip(thresholds, results):
+            outcomes.append((rule_label(change_type, threshold), symbol, alerts, result))
+    ticks = sum(len(series[symbol][0]) for symbol in polled)
+    return report(outcomes, interval, start, end, ticks, sum(len(polls) for polls in polled.values()),
+                  time.perf_counter() - started)
+
+def report(outcomes, interval, start, end, ticks, polls, seconds):
+    """
+    Aggregates replay outcomes by rule.
+
+    Returns:
+        dict: 'rules' maps every rule label to its tokens, alerts, fires, missed
+              crossings, latency percentiles in seconds and messages; 'messages'
+              has the total, the daily average and the busiest minute over all rules.
+    """
+    days = max(end - start, 1.0) / 86400
+    rules = {}
+    sent_at, weights = [], []
+    for label, _, alerts, result in outcomes:
+        rule = rules.setdefault(label, {'tokens': 0, 'alerts': 0, 'fires': 0, 'missed': 0, 'messages': 0, 'latency': []})
+        rule['tokens'] += 1
+        rule['alerts'] += alerts
+        rule['fires'] += len(result['fired_at'])
+        rule['missed'] += result['missed']
+        rule['messages'] += len(result['fired_at']) * alerts
+        rule['latency'].append(result['latency'])
+        sent_at.append(result['fired_at'])
+        weights.append(np.full(len(result['fired_at']), alerts))
+
+    for rule in rules.values():
+        latency = np.concatenate(rule.pop('latency'))
+        rule['fires_per_token_day'] = rule['fires'] / rule['tokens'] / days
+        for name, q in (('latency_p50', 50), ('latency_p95', 95), ('latency_max', 100)):
+            rule[name] = float(np.percentile(latency, q)) if len(latency) else None
+
+    sent_at = np.concatenate(sent_at) if sent_at else np.empty(0)
+    weights = np.concatenate(weights) if weights else np.empty(0)
+    per_minute = np.bincount(((sent_at - start) // 60).astype(np.int64), weights=weights) if len(sent_at) else np.zeros(1)
+    return {
+        'interval': interval,
+        'days': days,
+        'ticks': ticks,
+        'polls': polls,
+        'seconds': seconds,
+        'ticks_per_second': ticks / seconds if seconds else 0.0,
+        'rules': rules,
+        'messages': {
+            'total': int(weights.sum()),
+            'per_day': float(weights.sum()) / days,
+            'peak_per_minute': int(per_minute.max()),
+        },
+    }
+
+#===============================================
+#================= MAIN ========================
+#===============================================
+
+def format_seconds(value):
+    return '-' if value is None else f"{value:.0f}"
+
+def print_report(result):
+    print(f"\ninterval {result['interval']:g}s: {result['ticks']:,} ticks, {result['polls']:,} polls over "
+          f"{result['days']:.1f} days, replayed in {result['seconds']:.2f} s "
+          f"({result['ticks_per_second'] / 1e6:.1f} M ticks/s)")
+    print(f"{'rule':<14}{'tokens':>7}{'alerts':>8}{'fires':>8}{'/day':>7}{'missed':>8}"
+          f"{'latency p50/p95/max s':>24}{'messages':>10}")
+    for label, rule in sorted(result['rules'].items(), key=lambda item: (item[0].split()[0], float(item[0].split()[1][:-1]))):
+        latency = '/'.join(format_seconds(rule[name]) for name in ('latency_p50', 'latency_p95', 'latency_max'))
+        print(f"{label:<14}{rule['tokens']:>7}{rule['alerts']:>8}{rule['fires']:>8}{rule['fires_per_token_day']:>7.1f}"
+              f"{rule['missed']:>8}{latency:>24}{rule['messages']:>10}")
+    messages = result['messages']
+    print(f"messages: {messages['total']} total, {messages['per_day']:.1f} per day, peak {messages['peak_per_minute']} in a minute")
+
+def main():
+    from dotenv import load_dotenv
+    # The settings, such as STORAGE_BACKEND, are read when utils is imported
+    load_dotenv()
+    import utils
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('series', nargs='+', help="CSV (timestamp,symbol,price) or binary series files")
+    parser.add_argument('--rule', action='append', default=[],
+                        help="rule replayed on every series, e.g. 'up 10%%'; defaults to the stored notifications")
+    parser.add_argument('--interval', action='append', type=float,
+                        help=f"polling interval in seconds, repeatable (default: {utils.POLL_MIN_INTERVAL}, "
+                             f"{utils.POLL_INTERVAL} and {utils.POLL_MAX_INTERVAL})")
+    parser.add_argument('--reset-interval', type=float, default=utils.POLL_INTERVAL,
+                        help="age in seconds after which a reference price is reset (default: POLL_INTERVAL)")
+    parser.add_argument('--save-binary', help="also write the loaded series to this binary series file")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    intervals = args.interval or [utils.POLL_MIN_INTERVAL, utils.POLL_INTERVAL, utils.POLL_MAX_INTERVAL]
+    if any(interval <= 0 for interval in intervals) or args.reset_interval < 0:
+        parser.error("intervals must be positive")
+
+    started = time.perf_counter()
+    try:
+        series = load_series(args.series)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    ticks = sum(len(times) for times, _ in series.values())
+    print(f"Loaded {ticks:,} ticks of {len(series)} tokens in {time.perf_counter() - started:.2f} s")
+    if args.save_binary:
+        save_binary(series, args.save_binary)
+
+    if args.rule:
+        parsed = [parse_rule(rule) for rule in args.rule]
+        if None in parsed:
+            parser.error(f"invalid rule {args.rule[parsed.index(None)]!r}, expected e.g. 'up 10%'")
+        rules = {(symbol, change_type, threshold): 1 for symbol in series for change_type, threshold in parsed}
+    else:
+        rules, skipped = rules_from_notifications(utils.get_store().list_notifications(), set(series))
+        print(f"Replaying {sum(rules.values())} stored notifications"
+              + (f" ({skipped} skipped: windowed, invalid or without a series)" if skipped else ''))
+    if not rules:
+        parser.error("no rules to replay; pass --rule or store notifications for the replayed symbols")
+
+    results = [replay(series, rules, interval, args.reset_interval) for interval in intervals]
+    for result in results:
+        print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'reset_interval': args.reset_interval, 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import time
+import heapq
+import threading
+
+#===============================================
+#================= TRIGGER DISTANCE ============
+#===============================================
+
+def nearest_trigger_distance(price, upper=None, lower=None):
+    """
+    Returns how far the price must move to fire the closest alert.
+
+    Args:
+        price (float): The token's current price.
+        upper (float): The lowest 'up' trigger price of the token, if any.
+        lower (float): The highest 'down' trigger price of the token, if any.
+
+    Returns:
+        float: The smallest relative move (0.05 for 5%) needed to cross a trigger,
+               0.0 if one is already crossed, or None if there is no trigger.
+    """
+    if not price or price <= 0:
+        return None
+    distances = []
+    if upper is not None:
+        distances.append((upper - price) / price)
+    if lower is not None:
+        distances.append((price - lower) / price)
+    return max(0.0, min(distances)) if distances else None
+
+#===============================================
+#================= SCHEDULER ===================
+#===============================================
+
+class AdaptiveScheduler:
+    """
+    Decides when each token is polled next.
+
+    Tokens are kept in a heap ordered by their next due time. After every poll the
+    token's interval is derived from how far the price is from its nearest alert
+    trigger and how fast the price has been moving recently: a token that would
+    reach its trigger soon at its recent speed is polled often, while a quiet token
+    far from any trigger backs off towards `max_interval`.
+    """
+
+    # Fraction of the expected time-to-trigger used as the polling interval
+    SAFETY_FACTOR = 0.25
+    # Weight of the newest sample in the volatility moving average
+    VOLATILITY_ALPHA = 0.3
+
+    def __init__(self, base_interval=300, min_interval=30, max_interval=900, clock=time.monotonic):
+        """
+        Args:
+            base_interval (float): Interval used while too little is known about a token.
+            min_interval (float): Shortest allowed interval.
+            max_interval (float): Longest allowed interval.
+            clock (callable): Monotonic time source, replaceable for testing.
+        """
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._clock = clock
+        self._keys = set()     # tokens currently scheduled
+        self._heap = []        # (due, key)
+        self._due = {}         # key -> due time of its live heap entry, absent while being polled
+        self._state = {}       # key -> {'price', 'time', 'rate'}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+    def sync(self, keys):
+        """
+        Makes the schedule match the set of tokens that have notifications.
+
+        New tokens are due immediately; tokens no longer present are dropped.
+
+        Args:
+            keys (iterable): The token keys to schedule.
+        """
+        keys = set(keys)
+        now = self._clock()
+        with self._lock:
+            for key in keys - self._keys:
+                self._due[key] = now
+                heapq.heappush(self._heap, (now, key))
+            for key in self._keys - keys:
+                # Heap entries of removed tokens are skipped lazily in pop_due
+                self._due.pop(key, None)
+                self._state.pop(key, None)
+            self._keys = keys
+
+    def pop_due(self, fill_to=1, lookahead=0.0):
+        """
+        Removes and returns the tokens that are due.
+
+        When batching requests, free slots in the last batch cost nothing, so the
+        result is topped up to a multiple of `fill_to` with tokens that would become
+        due within `lookahead` seconds.
+
+        Args:
+            fill_to (int): Batch size to round the result up to.
+            lookahead (float): How far ahead tokens may be pulled in to fill a batch.
+
+        Returns:
+            list: The keys to poll now, earliest due first.
+        """
+        now = self._clock()
+        due = []
+        with self._lock:
+            while self._heap:
+                when, key = self._heap[0]
+                if self._due.get(key) != when:
+                    heapq.heappop(self._heap)  # stale entry
+                    continue
+                if when > now and (len(due) % fill_to == 0 or when > now + lookahead):
+                    break
+                heapq.heappop(self._heap)
+                del self._due[key]
+                due.append(key)
+        return due
+
+    def next_due(self):
+        """
+        Returns:
+            float: The clock time at which the next token is due, or None if nothing is scheduled.
+        """
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: By key of every scheduled token, the seconds until it is due ('due_in',
+                  None while it is being polled) and its last polled price ('price'),
+                  that price's age in seconds ('age') and its volatility ('rate').
+        """
+        now = self._clock()
+        with self._lock:
+            snapshot = {}
+            for key in self._keys:
+                due = self._due.get(key)
+                state = self._state.get(key) or {}
+                snapshot[key] = {
+                    'due_in': None if due is None else due - now,
+                    'price': state.get('price'),
+                    'age': now - state['time'] if state else None,
+                    'rate': state.get('rate'),
+                }
+            return snapshot
+
+    def restore(self, snapshot, elapsed=0.0):
+        """
+        Schedules tokens from a snapshot() taken `elapsed` seconds ago, so a restarted
+        poller resumes where it stopped instead of polling every token at once.
+        Tokens already scheduled are left alone; tokens that fell due meanwhile are
+        due immediately.
+
+        Args:
+            snapshot (dict): As returned by snapshot().
+            elapsed (float): Seconds since the snapshot was taken.
+        """
+        now = self._clock()
+        with self._lock:
+            for key, entry in snapshot.items():
+                if key in self._keys:
+                    continue
+                due_in = entry.get('due_in')
+                due = now if due_in is None else now + max(0.0, due_in - elapsed)
+                self._keys.add(key)
+                self._due[key] = due
+                heapq.heappush(self._heap, (due, key))
+                if entry.get('price') is not None and entry.get('age') is not None:
+                    self._state[key] = {'price': entry['price'], 'time': now - entry['age'] - elapsed, 'rate': entry.get('rate')}
+
+    def _update_volatility(self, key, price, now):
+        # Must be called with the lock held. Tracks an exponential moving average of
+        # the relative price change per second.
+        state = self._state.get(key)
+        if state is None:
+            self._state[key] = {'price': price, 'time': now, 'rate': None}
+            return None
+        elapsed = now - state['time']
+        if elapsed > 0 and state['price'] > 0:
+            sample = abs(price - state['price']) / state['price'] / elapsed
+            if state['rate'] is None:
+                state['rate'] = sample
+            else:
+                state['rate'] = self.VOLATILITY_ALPHA * sample + (1 - self.VOLATILITY_ALPHA) * state['rate']
+        state['price'] = price
+        state['time'] = now
+        return state['rate']
+
+    def interval_for(self, distance, rate):
+        """
+        Computes a polling interval.
+
+        Args:
+            distance (float): Relative move needed to reach the nearest trigger, or None.
+            rate (float): Recent relative price change per second, or None.
+
+        Returns:
+            float: Seconds until the token should be polled again.
+        """
+        if distance is None or rate is None:
+            interval = self.base_interval
+        elif rate == 0:
+            interval = self.max_interval
+        else:
+            interval = distance / rate * self.SAFETY_FACTOR
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def record(self, key, price, distance):
+        """
+        Records a poll result and schedules the token's next poll.
+
+        Args:
+            key: The token key.
+            price (float): The polled price, or None if the poll failed.
+            distance (float): See nearest_trigger_distance().
+
+        Returns:
+            float: The interval chosen, in seconds.
+        """
+        now = self._clock()
+        with self._lock:
+            if price is None:
+                interval = self.base_interval
+            else:
+                interval = self.interval_for(distance, self._update_volatility(key, price, now))
+            if key in self._keys:
+                due = now + interval
+                self._due[key] = due
+                heapq.heappush(self._heap, (due, key))
+        return interval
@@ -0,0 +1,297 @@
+import time
+import bisect
+import sqlite3
+import hashlib
+import logging
+import threading
+
+#===============================================
+#================= CONSISTENT HASHING ==========
+#===============================================
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """
+    Consistent hash ring assigning tokens to workers.
+
+    Every worker is placed on the ring at `replicas` pseudo-random points and a
+    token belongs to the first worker point at or after the token's hash. When
+    a worker joins or leaves, only the tokens between its points and their
+    neighbours move, about 1/n of them.
+    """
+
+    def __init__(self, workers=(), replicas=64):
+        """
+        Args:
+            workers (iterable): The worker ids.
+            replicas (int): Points per worker; more points spread tokens more evenly.
+        """
+        self.workers = frozenset(workers)
+        points = sorted((_hash(f"{worker}#{i}"), worker) for worker in self.workers for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [worker for _, worker in points]
+
+    def owner(self, key):
+        """
+        Returns the worker owning a token.
+
+        Args:
+            key (tuple): The token key, see price_key().
+
+        Returns:
+            str: The worker id, or None if the ring is empty.
+        """
+        if not self._hashes:
+            return None
+        index = bisect.bisect_left(self._hashes, _hash(':'.join(key)))
+        return self._owners[index % len(self._owners)]
+
+#===============================================
+#================= COORDINATION ================
+#===============================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    token TEXT PRIMARY KEY,
+    worker_id TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leases_worker ON leases (worker_id);
+CREATE TABLE IF NOT EXISTS outgoing_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    worker_id TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+class ShardCoordinator:
+    """
+    Coordinates poller workers through a shared SQLite database.
+
+    Workers register and heartbeat in the `workers` table; the ones whose
+    heartbeat is younger than `worker_ttl` form the hash ring that decides
+    which worker should poll each token. To guarantee that a token is polled
+    by exactly one worker while the ring changes, a worker only polls the
+    tokens it holds a lease on. Leases are renewed on every heartbeat, released
+    once the ring assigns the token elsewhere, and can only be taken over when
+    released or expired, i.e. when the previous owner left or died.
+
+    Alert messages produced by the workers are queued in `outgoing_messages`
+    for the single process that talks to Telegram.
+    """
+
+    def __init__(self, db_file, worker_id=None, heartbeat_interval=5, worker_ttl=15, clock=time.time):
+        """
+        Args:
+            db_file (str): Path of the shared database, on a filesystem all workers can lock.
+            worker_id (str): This worker's id; None for the sender, which does not poll.
+            heartbeat_interval (float): Seconds between heartbeats.
+            worker_ttl (float): Seconds after the last heartbeat a worker is considered dead.
+            clock (callable): Wall clock shared by all hosts, replaceable for testing.
+        """
+        self.db_file = db_file
+        self.worker_id = worker_id
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_ttl = worker_ttl
+        self._clock = clock
+        self._ring = HashRing()
+        self._owned = frozenset()
+        self._local = threading.local()
+        self._stopping = threading.Event()
+        self._thread = None
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; WAL lets the sender read while workers write
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    #================= membership ===============
+
+    def _refresh_ring(self, connection, now):
+        if self.worker_id is not None:
+            connection.execute(
+                "INSERT INTO workers (worker_id, heartbeat) VALUES (?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (self.worker_id, now)
+            )
+        # Forget workers that have been dead for a while
+        connection.execute("DELETE FROM workers WHERE heartbeat < ?", (now - 10 * self.worker_ttl,))
+        live = {row[0] for row in connection.execute(
+            "SELECT worker_id FROM workers WHERE heartbeat >= ?", (now - self.worker_ttl,)
+        )}
+        if live != self._ring.workers:
+            logging.info("Shard workers changed: %s -> %s", sorted(self._ring.workers), sorted(live))
+            self._ring = HashRing(live)
+
+    def heartbeat(self, keys=(), before_release=None):
+        """
+        Records that this worker is alive, refreshes the ring from the live
+        workers and renews, releases and acquires token leases accordingly.
+
+        Args:
+            keys (iterable): Every token that needs polling, across all workers.
+            before_release (callable): Called without arguments before leases are
+                                       released, to persist the state of their tokens.
+
+        Returns:
+            set: The tokens whose lease was acquired by this heartbeat.
+        """
+        now = self._clock()
+        connection = self._connection()
+        self._refresh_ring(connection, now)
+        if self.worker_id is None:
+            return set()
+
+        assigned = {':'.join(key): key for key in keys if self._ring.owner(key) == self.worker_id}
+        released = [token for token in (':'.join(key) for key in self._owned) if token not in assigned]
+        if released:
+            if before_release:
+                before_release()
+            connection.executemany("DELETE FROM leases WHERE token = ? AND worker_id = ?",
+                                   [(token, self.worker_id) for token in released])
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO leases (token, worker_id, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(token) DO UPDATE SET worker_id = excluded.worker_id, expires = excluded.expires "
+                "WHERE leases.worker_id = excluded.worker_id OR leases.expires < ?",
+                [(token, self.worker_id, now + self.worker_ttl, now) for token in assigned]
+            )
+            held = {row[0] for row in connection.execute("SELECT token FROM leases WHERE worker_id = ?", (self.worker_id,))}
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+        owned = frozenset(key for token, key in assigned.items() if token in held)
+        acquired = owned - self._owned
+        self._owned = owned
+        return acquired
+
+    def leave(self):
+        """
+        Deregisters this worker and releases its leases so its tokens move to the
+        others immediately.
+        """
+        if self.worker_id is not None:
+            connection = self._connection()
+            connection.execute("DELETE FROM leases WHERE worker_id = ?", (self.worker_id,))
+            connection.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+            self._owned = frozenset()
+
+    def workers(self):
+        """
+        Returns:
+            frozenset: The live workers as of the last heartbeat.
+        """
+        return self._ring.workers
+
+    def owns(self, key):
+        """
+        Returns:
+            bool: True if this worker holds the lease of the token and should poll it.
+        """
+        return key in self._owned
+
+    def start(self, keys=None, on_acquire=None, before_release=None):
+        """
+        Heartbeats in a background thread until stop() is called. The first
+        heartbeat runs before returning, so the worker's leases are known.
+
+        Args:
+            keys (callable): Returns every token that needs polling, across all workers.
+            on_acquire (callable): Called with the set of tokens whenever leases are acquired.
+            before_release (callable): See heartbeat().
+        """
+        def beat():
+            acquired = self.heartbeat(keys() if keys else (), before_release)
+            if acquired and on_acquire:
+                on_acquire(acquired)
+
+        def run():
+            while not self._stopping.wait(self.heartbeat_interval):
+                try:
+                    beat()
+                except sqlite3.Error as e:
+                    logging.error("Shard heartbeat failed: %s", e)
+
+        self._stopping.clear()
+        beat()
+        self._thread = threading.Thread(target=run, name='shard-heartbeat', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.leave()
+
+    #================= messages =================
+
+    def send(self, chat_id, text):
+        """
+        Queues a message for the sender. Has the same signature as MessageOutbox.send,
+        so a worker can use the coordinator in place of its outbox.
+        """
+        self._connection().execute(
+            "INSERT INTO outgoing_messages (chat_id, text, worker_id, created_at) VALUES (?, ?, ?, ?)",
+            (chat_id, text, self.worker_id, self._clock())
+        )
+
+    def take_messages(self, limit=500):
+        """
+        Removes and returns the oldest queued messages.
+
+        Returns:
+            list: (chat_id, text) pairs in the order they were queued.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, chat_id, text FROM outgoing_messages ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            if rows:
+                connection.execute("DELETE FROM outgoing_messages WHERE id <= ?", (rows[-1][0],))
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        return [(chat_id, text) for _, chat_id, text in rows]
+
+    def relay_messages(self, send, interval=1.0):
+        """
+        Forwards queued messages to `send` until stop() is called. Run by the
+        process that owns the Telegram outbox.
+
+        Args:
+            send (callable): Called as send(chat_id, text), e.g. MessageOutbox.send.
+            interval (float): Seconds to wait when the queue is empty.
+        """
+        self._stopping.clear()
+        while not self._stopping.is_set():
+            try:
+                messages = self.take_messages()
+            except sqlite3.Error as e:
+                logging.error("Failed to read shard messages: %s", e)
+                messages = []
+            for chat_id, text in messages:
+                send(chat_id, text)
+            if not messages:
+                self._stopping.wait(interval)
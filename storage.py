@@ -0,0 +1,795 @@
+import os
+import json
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+
+#===============================================
+#================= KEYS ========================
+#===============================================
+
+def notification_key(chat_id, symbol):
+    """
+    Builds the key a notification is stored under.
+
+    Notifications are scoped per chat so two users alerting on the same token
+    do not overwrite each other.
+
+    Args:
+        chat_id (int): The Telegram chat that owns the notification.
+        symbol (str): The watchlist symbol the notification is for.
+
+    Returns:
+        str: The key, e.g. '298161516:CSIX'.
+    """
+    return f"{chat_id}:{symbol}"
+
+def watchlist_key(symbol):
+    """
+    Builds the key a token is stored under in the watchlist.
+
+    Every path adding a token or looking one up by a symbol the user typed
+    goes through this, so 'link', 'Link' and 'LINK' are the same entry.
+
+    Args:
+        symbol (str): The token symbol, e.g. as returned by DEX Screener.
+
+    Returns:
+        str: The key, e.g. 'LINK'.
+    """
+    return symbol.strip().upper()
+
+#===============================================
+#================= BACKENDS ====================
+#===============================================
+
+class JsonBackend:
+    """
+    Persists the watchlist and notifications as two JSON files.
+    """
+
+    def __init__(self, watchlist_file, notifications_file, load, save):
+        """
+        Args:
+            watchlist_file (str): Path of the watchlist JSON file.
+            notifications_file (str): Path of the notifications JSON file.
+            load (callable): Reads a JSON file, see utils.load_json_file.
+            save (callable): Writes a JSON file, see utils.save_json_file.
+        """
+        self.watchlist_file = watchlist_file
+        self.notifications_file = notifications_file
+        self._load = load
+        self._save = save
+
+    def load(self):
+        """
+        Returns:
+            tuple: The (watchlist, notifications) dictionaries.
+        """
+        return self._load(self.watchlist_file), self._load(self.notifications_file)
+
+    def commit(self, watchlist, notifications, dirty_tokens, dirty_notifications, new_notifications=None):
+        """
+        Writes the files whose contents changed.
+
+        Args:
+            watchlist (dict): The full watchlist.
+            notifications (dict): The full notifications.
+            dirty_tokens (set): Watchlist keys added, changed or removed since the last commit.
+            dirty_notifications (set): Notification keys added, changed or removed since the last commit.
+            new_notifications (set): The dirty notification keys that were added rather than
+                updated; None treats every one as added. Unused, the files are rewritten whole.
+        """
+        if dirty_tokens and not self._save(self.watchlist_file, watchlist):
+            raise OSError(f"could not write {self.watchlist_file}")
+        if dirty_notifications and not self._save(self.notifications_file, notifications):
+            raise OSError(f"could not write {self.notifications_file}")
+
+class WriteAheadLog:
+    """
+    Makes a snapshot backend durable and cheap to update with an append-only log.
+
+    Every commit appends one JSON line per changed watchlist entry or
+    notification, holding its new value (or null once removed), and fsyncs the
+    log once. The snapshot files are only rewritten when the log grows past
+    `compact_bytes`, after which the log is truncated. Loading reads the
+    snapshot and replays the log over it; records are full values, so
+    replaying a record already contained in the snapshot is harmless. A record
+    torn by a crash mid-append is detected and dropped.
+    """
+
+    def __init__(self, backend, log_file, compact_bytes=1000000):
+        """
+        Args:
+            backend: The snapshot backend, e.g. JsonBackend.
+            log_file (str): Path of the log.
+            compact_bytes (int): Log size in bytes that triggers a compaction.
+        """
+        self.backend = backend
+        self.log_file = log_file
+        self.compact_bytes = compact_bytes
+        # Keys changed since the last compaction, i.e. not in the snapshot yet
+        self._pending_tokens = set()
+        self._pending_notifications = set()
+        self._log_size = 0
+
+    def _replay(self, watchlist, notifications):
+        if not os.path.exists(self.log_file):
+            return 0
+        with open(self.log_file, 'rb') as file:
+            data = file.read()
+        records = valid_size = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError("incomplete record")
+                record = json.loads(line)
+                section = watchlist if record['s'] == 'w' else notifications
+                pending = self._pending_tokens if record['s'] == 'w' else self._pending_notifications
+            except (ValueError, KeyError, TypeError) as e:
+                logging.warning("Discarding the tail of %s from byte %s: %s", self.log_file, valid_size, e)
+                break
+            if record['v'] is None:
+                section.pop(record['k'], None)
+            else:
+                section[record['k']] = record['v']
+            pending.add(record['k'])
+            records += 1
+            valid_size += len(line)
+        if valid_size < len(data):
+            # Cut the torn record off so new records are appended after valid data
+            with open(self.log_file, 'r+b') as file:
+                file.truncate(valid_size)
+        self._log_size = valid_size
+        return records
+
+    def load(self):
+        """
+        Returns:
+            tuple: The (watchlist, notifications) of the snapshot with the log applied.
+        """
+        watchlist, notifications = self.backend.load()
+        watchlist, notifications = dict(watchlist or {}), dict(notifications or {})
+        self._pending_tokens.clear()
+        self._pending_notifications.clear()
+        self._log_size = 0
+        records = self._replay(watchlist, notifications)
+        if records:
+            logging.info("Replayed %s records from %s.", records, self.log_file)
+        return watchlist, notifications
+
+    def commit(self, watchlist, notifications, dirty_tokens, dirty_notifications, new_notifications=None):
+        """
+        Appends the changed entries to the log, compacting it when it grew too large.
+
+        Args:
+            See JsonBackend.commit().
+        """
+        lines = []
+        for section, items, keys in (('w', watchlist, dirty_tokens), ('n', notifications, dirty_notifications)):
+            for key in keys:
+                lines.append(json.dumps({'s': section, 'k': key, 'v': items.get(key)}) + '\n')
+        if not lines:
+            return
+        data = ''.join(lines).encode('utf-8')
+        with open(self.log_file, 'ab') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        self._log_size += len(data)
+        self._pending_tokens |= dirty_tokens
+        self._pending_notifications |= dirty_notifications
+
+        if self._log_size >= self.compact_bytes:
+            try:
+                self.compact(watchlist, notifications)
+            except Exception as e:
+                # The records are safe in the log; compaction is retried on the next commit
+                logging.error("Failed to compact %s: %s", self.log_file, e)
+
+    def compact(self, watchlist, notifications):
+        """
+        Writes the current state to the snapshot and empties the log.
+        """
+        self.backend.commit(watchlist, notifications, self._pending_tokens, self._pending_notifications)
+        with open(self.log_file, 'wb') as file:
+            file.flush()
+            os.fsync(file.fileno())
+        logging.info("Compacted %s bytes of %s into the snapshot.", self._log_size, self.log_file)
+        self._log_size = 0
+        self._pending_tokens.clear()
+        self._pending_notifications.clear()
+
+# Notification fields with their own column in the alerts table. Anything else
+# is kept in the JSON 'extra' column.
+_ALERT_COLUMNS = ('chat_id', 'symbol', 'change_type', 'threshold_percentage', 'previous_price')
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    chat_id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    id INTEGER PRIMARY KEY,
+    chain TEXT NOT NULL,
+    address TEXT NOT NULL,
+    symbol TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tokens_chain_address ON tokens (chain, address COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS watchlist_entries (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL UNIQUE,
+    token_id INTEGER NOT NULL REFERENCES tokens (id),
+    chat_id INTEGER REFERENCES users (chat_id),
+    token_symbol TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_watchlist_entries_chat_id ON watchlist_entries (chat_id);
+CREATE TABLE IF NOT EXISTS alerts (
+    key TEXT PRIMARY KEY,
+    chat_id INTEGER NOT NULL REFERENCES users (chat_id),
+    symbol TEXT NOT NULL,
+    change_type TEXT,
+    threshold_percentage REAL,
+    previous_price REAL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_chat_id ON alerts (chat_id);
+CREATE INDEX IF NOT EXISTS idx_alerts_symbol ON alerts (symbol);
+"""
+
+class SqliteBackend:
+    """
+    Persists the watchlist and notifications in a SQLite database.
+
+    Only the rows that changed are written on each commit. The database runs in
+    WAL mode so readers are never blocked by the writer.
+    """
+
+    def __init__(self, db_file):
+        """
+        Args:
+            db_file (str): Path of the SQLite database, created if missing.
+        """
+        self.db_file = db_file
+        self._connection = sqlite3.connect(db_file, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(_SQLITE_SCHEMA)
+        columns = {row['name'] for row in self._connection.execute("PRAGMA table_info(watchlist_entries)")}
+        if 'token_symbol' not in columns:
+            # Databases created before entries kept their own symbol; those fall back to the token's
+            self._connection.execute("ALTER TABLE watchlist_entries ADD COLUMN token_symbol TEXT")
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def is_empty(self):
+        """
+        Returns:
+            bool: True if the database holds no watchlist entries and no alerts.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT (SELECT COUNT(*) FROM watchlist_entries) + (SELECT COUNT(*) FROM alerts)"
+            ).fetchone()
+        return row[0] == 0
+
+    def load(self):
+        """
+        Returns:
+            tuple: The (watchlist, notifications) dictionaries, shaped like the JSON files.
+        """
+        with self._lock:
+            token_rows = self._connection.execute(
+                "SELECT w.symbol AS key, w.chat_id, t.chain, t.address, COALESCE(w.token_symbol, t.symbol) AS symbol "
+                "FROM watchlist_entries w JOIN tokens t ON t.id = w.token_id ORDER BY w.id"
+            ).fetchall()
+            alert_rows = self._connection.execute("SELECT * FROM alerts ORDER BY rowid").fetchall()
+
+        watchlist = {}
+        for row in token_rows:
+            token = {'symbol': row['symbol'], 'network': row['chain'], 'address': row['address']}
+            if row['chat_id'] is not None:
+                token['chat_id'] = row['chat_id']
+            watchlist[row['key']] = token
+
+        notifications = {}
+        for row in alert_rows:
+            notification = {column: row[column] for column in _ALERT_COLUMNS}
+            if row['extra']:
+                notification.update(json.loads(row['extra']))
+            notifications[row['key']] = notification
+        return watchlist, notifications
+
+    def _ensure_user(self, chat_id):
+        if chat_id is not None:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO users (chat_id, created_at) VALUES (?, ?)", (chat_id, time.time())
+            )
+
+    def _upsert_token(self, key, token):
+        self._ensure_user(token.get('chat_id'))
+        self._connection.execute(
+            "INSERT INTO tokens (chain, address, symbol) VALUES (?, ?, ?) "
+            "ON CONFLICT (chain, address COLLATE NOCASE) DO UPDATE SET symbol = excluded.symbol",
+            (token['network'], token['address'], token['symbol'])
+        )
+        token_id = self._connection.execute(
+            "SELECT id FROM tokens WHERE chain = ? AND address = ? COLLATE NOCASE",
+            (token['network'], token['address'])
+        ).fetchone()[0]
+        self._connection.execute(
+            "INSERT INTO watchlist_entries (symbol, token_id, chat_id, token_symbol) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (symbol) DO UPDATE SET token_id = excluded.token_id, chat_id = excluded.chat_id, "
+            "token_symbol = excluded.token_symbol",
+            (key, token_id, token.get('chat_id'), token['symbol'])
+        )
+
+    def _alert_values(self, notification):
+        extra = {name: value for name, value in notification.items() if name not in _ALERT_COLUMNS}
+        return (*(notification.get(column) for column in _ALERT_COLUMNS), json.dumps(extra) if extra else None)
+
+    def _insert_alert(self, key, notification):
+        self._ensure_user(notification['chat_id'])
+        self._connection.execute(
+            "INSERT OR REPLACE INTO alerts (key, chat_id, symbol, change_type, threshold_percentage, previous_price, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, *self._alert_values(notification))
+        )
+
+    def _update_alert(self, key, notification):
+        # Another process sharing the database may have deleted the alert since
+        # this one loaded it; an update must not bring the row back.
+        cursor = self._connection.execute(
+            "UPDATE alerts SET chat_id = ?, symbol = ?, change_type = ?, threshold_percentage = ?, "
+            "previous_price = ?, extra = ? WHERE key = ?",
+            (*self._alert_values(notification), key)
+        )
+        if cursor.rowcount == 0:
+            logging.debug("Not updating alert %s: it was removed from %s.", key, self.db_file)
+
+    def commit(self, watchlist, notifications, dirty_tokens, dirty_notifications, new_notifications=None):
+        """
+        Upserts or deletes the changed rows in a single transaction.
+
+        Notifications in `new_notifications` are inserted; the other dirty ones
+        only update an existing row, so an alert deleted by another process is
+        not recreated from a stale copy.
+
+        Args:
+            watchlist (dict): The full watchlist.
+            notifications (dict): The full notifications.
+            dirty_tokens (set): Watchlist keys added, changed or removed since the last commit.
+            dirty_notifications (set): Notification keys added, changed or removed since the last commit.
+            new_notifications (set): The dirty notification keys that were added rather than
+                updated; None treats every one as added.
+        """
+        with self._lock, self._connection:
+            for key in dirty_tokens:
+                if key in watchlist:
+                    self._upsert_token(key, watchlist[key])
+                else:
+                    self._connection.execute("DELETE FROM watchlist_entries WHERE symbol = ?", (key,))
+            for key in dirty_notifications:
+                if key not in notifications:
+                    self._connection.execute("DELETE FROM alerts WHERE key = ?", (key,))
+                elif new_notifications is None or key in new_notifications:
+                    self._insert_alert(key, notifications[key])
+                else:
+                    self._update_alert(key, notifications[key])
+
+def migrate_json_to_sqlite(json_backend, sqlite_backend):
+    """
+    Copies the contents of the JSON files into an SQLite database.
+
+    Legacy notifications keyed by symbol alone are re-keyed per chat on the way.
+
+    Args:
+        json_backend (JsonBackend or WriteAheadLog): The source files.
+        sqlite_backend (SqliteBackend): The destination database.
+
+    Returns:
+        tuple: The number of (watchlist entries, notifications) migrated.
+    """
+    watchlist, notifications = json_backend.load()
+    notifications = {
+        notification_key(notification['chat_id'], notification.get('symbol', key)): notification
+        for key, notification in notifications.items()
+    }
+    sqlite_backend.commit(watchlist, notifications, set(watchlist), set(notifications))
+    logging.info("Migrated %s tokens and %s notifications to %s.", len(watchlist), len(notifications), sqlite_backend.db_file)
+    return len(watchlist), len(notifications)
+
+#===============================================
+#================= STORE =======================
+#===============================================
+
+class Store:
+    """
+    In-memory view of the watchlist and notifications.
+
+    The watchlist is shared by every chat of the bot: entries are keyed by
+    symbol alone and their 'chat_id' only records who added them.
+    Notifications are owned by a chat, see notification_key(), and a chat
+    removing a token only removes its own, see remove_token().
+
+    Data is loaded from the backend on first use and served from memory afterwards.
+    Secondary indexes answer address and chat lookups without scanning, and the
+    watchlist split into pages is kept until the watchlist changes. Changes
+    are written back by a background timer, so a burst of updates within
+    `flush_delay` seconds costs a single write.
+    """
+
+    def __init__(self, backend, flush_delay=1.0):
+        """
+        Args:
+            backend: Object providing load() and commit(), e.g. JsonBackend.
+            flush_delay (float): Seconds to wait after a change before writing it out.
+        """
+        self.backend = backend
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._watchlist = {}
+        self._notifications = {}
+        self._symbol_by_address = {}
+        self._symbol_by_key = {}  # watchlist_key() -> watchlist key, for entries stored under other keys
+        self._keys_by_chat = {}
+        self._pages = None  # (page size, pages) built by watchlist_pages()
+        self._dirty_tokens = set()
+        self._dirty_notifications = set()
+        # Dirty notifications that were added, not just updated; see SqliteBackend.commit()
+        self._new_notifications = set()
+        self._flush_timer = None
+        self._listeners = []
+        atexit.register(self.flush)
+
+    def add_listener(self, callback):
+        """
+        Registers a callback for notification changes.
+
+        The callback is called as callback(key, notification) for every existing
+        notification right away, then again whenever one is added or updated, and
+        with notification=None when one is removed. It runs with the store locked
+        and must not call back into the store.
+
+        Args:
+            callback (callable): The function to call.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            self._listeners.append(callback)
+            for key, notification in self._notifications.items():
+                callback(key, dict(notification))
+
+    def _notify(self, key, notification):
+        # Must be called with the lock held
+        for callback in self._listeners:
+            try:
+                callback(key, dict(notification) if notification is not None else None)
+            except Exception as e:
+                logging.error("Store listener failed for %s: %s", key, e)
+
+    #================= loading & indexes ========
+
+    def _ensure_loaded(self):
+        # Must be called with the lock held
+        if self._loaded:
+            return
+        watchlist, notifications = self.backend.load()
+        self._watchlist = watchlist or {}
+        self._notifications = {}
+        for key, notification in (notifications or {}).items():
+            # Re-key legacy notifications stored under the symbol alone
+            new_key = notification_key(notification.get('chat_id'), notification.get('symbol', key))
+            if new_key != key:
+                self._dirty_notifications.update((key, new_key))
+                self._new_notifications.add(new_key)
+            self._notifications[new_key] = notification
+        self._symbol_by_address = {
+            token['address'].lower(): symbol for symbol, token in self._watchlist.items()
+        }
+        self._symbol_by_key = {watchlist_key(symbol): symbol for symbol in self._watchlist}
+        self._pages = None
+        self._keys_by_chat = {}
+        for key, notification in self._notifications.items():
+            self._keys_by_chat.setdefault(notification.get('chat_id'), set()).add(key)
+        self._loaded = True
+        if self._dirty_notifications:
+            self._schedule_flush()
+        logging.info("Store loaded %s tokens and %s notifications.", len(self._watchlist), len(self._notifications))
+
+    def reload(self):
+        """
+        Discards unsaved changes and reloads everything from the backend.
+        """
+        with self._lock:
+            for key in self._notifications:
+                self._notify(key, None)
+            self._loaded = False
+            self._dirty_tokens.clear()
+            self._dirty_notifications.clear()
+            self._new_notifications.clear()
+            self._ensure_loaded()
+            for key, notification in self._notifications.items():
+                self._notify(key, notification)
+
+    def _index_notification(self, key, notification):
+        self._keys_by_chat.setdefault(notification.get('chat_id'), set()).add(key)
+
+    def _unindex_notification(self, key, notification):
+        keys = self._keys_by_chat.get(notification.get('chat_id'))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_chat[notification.get('chat_id')]
+
+    #================= watchlist ================
+
+    def get_token(self, symbol):
+        """
+        Returns:
+            dict: A copy of the watchlist entry for `symbol`, or None.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            token = self._watchlist.get(symbol)
+            return dict(token) if token else None
+
+    def find_symbol(self, symbol):
+        """
+        Looks up the key of a watchlist entry by symbol, ignoring case, so
+        entries stored before keys were normalised are found too.
+
+        Returns:
+            str: The watchlist key of the matching entry, or None.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return self._symbol_by_key.get(watchlist_key(symbol))
+
+    def find_token_by_address(self, address):
+        """
+        Looks up a watchlist entry by contract address, ignoring case.
+
+        Returns:
+            dict: A copy of the matching watchlist entry, or None.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            symbol = self._symbol_by_address.get(address.lower())
+            return dict(self._watchlist[symbol]) if symbol else None
+
+    def list_tokens(self):
+        """
+        Returns:
+            list: (symbol, entry) pairs for every watchlist token, in insertion order.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return [(symbol, dict(token)) for symbol, token in self._watchlist.items()]
+
+    def watchlist_pages(self, page_size):
+        """
+        Splits the watchlist into pages of at most `page_size` tokens.
+
+        The pages are built once and shared by every caller until the watchlist
+        changes, so they must not be modified.
+
+        Returns:
+            tuple: The pages, each a tuple of (symbol, entry) pairs in insertion order.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if self._pages is None or self._pages[0] != page_size:
+                items = [(symbol, dict(token)) for symbol, token in self._watchlist.items()]
+                self._pages = (page_size, tuple(tuple(items[i:i + page_size])
+                                                for i in range(0, len(items), page_size)))
+            return self._pages[1]
+
+    def has_tokens(self):
+        with self._lock:
+            self._ensure_loaded()
+            return bool(self._watchlist)
+
+    def add_token(self, symbol, token):
+        """
+        Adds or replaces a watchlist entry.
+
+        Args:
+            symbol (str): The watchlist key.
+            token (dict): The entry, with at least 'symbol', 'network' and 'address'.
+        """
+        self.add_tokens({symbol: token})
+
+    def add_tokens(self, tokens):
+        """
+        Adds or replaces several watchlist entries at once, so they are written
+        out together by a single flush.
+
+        Args:
+            tokens (dict): Entries by watchlist key, see add_token().
+        """
+        with self._lock:
+            self._ensure_loaded()
+            for symbol, token in tokens.items():
+                previous = self._watchlist.get(symbol)
+                if previous:
+                    self._symbol_by_address.pop(previous['address'].lower(), None)
+                self._watchlist[symbol] = dict(token)
+                self._symbol_by_address[token['address'].lower()] = symbol
+                self._symbol_by_key[watchlist_key(symbol)] = symbol
+                self._dirty_tokens.add(symbol)
+            if tokens:
+                self._pages = None
+                self._schedule_flush()
+
+    def remove_token(self, symbol, chat_id=None):
+        """
+        Removes a token's notifications and, once no chat has one left, the token
+        itself from the watchlist.
+
+        Args:
+            symbol (str): The watchlist key.
+            chat_id (int): Only remove the notifications of this chat. The token
+                           stays in the watchlist while other chats still have a
+                           notification on it. None removes every notification.
+
+        Returns:
+            bool: True if the token was in the watchlist.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            token = self._watchlist.get(symbol)
+            if token is None:
+                return False
+            for key in [key for key, val in self._notifications.items()
+                        if val['symbol'] == symbol and chat_id in (None, val.get('chat_id'))]:
+                self._unindex_notification(key, self._notifications.pop(key))
+                self._dirty_notifications.add(key)
+                self._new_notifications.discard(key)
+                self._notify(key, None)
+            if not any(val['symbol'] == symbol for val in self._notifications.values()):
+                del self._watchlist[symbol]
+                self._symbol_by_address.pop(token['address'].lower(), None)
+                if self._symbol_by_key.get(watchlist_key(symbol)) == symbol:
+                    del self._symbol_by_key[watchlist_key(symbol)]
+                self._dirty_tokens.add(symbol)
+                self._pages = None
+            self._schedule_flush()
+            return True
+
+    #================= notifications ============
+
+    def get_notification(self, key):
+        """
+        Returns:
+            dict: A copy of the notification stored under `key`, or None.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            notification = self._notifications.get(key)
+            return dict(notification) if notification else None
+
+    def list_notifications(self):
+        """
+        Returns:
+            list: (key, notification) pairs for every notification.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return [(key, dict(notification)) for key, notification in self._notifications.items()]
+
+    def notifications_for_chat(self, chat_id):
+        """
+        Returns:
+            dict: Copies of the notifications owned by `chat_id`, keyed like the store.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return {key: dict(self._notifications[key]) for key in self._keys_by_chat.get(chat_id, ())}
+
+    def set_notification(self, key, notification):
+        """
+        Adds or replaces the notification stored under `key`.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            previous = self._notifications.get(key)
+            if previous:
+                self._unindex_notification(key, previous)
+            self._notifications[key] = dict(notification)
+            self._index_notification(key, notification)
+            self._dirty_notifications.add(key)
+            self._new_notifications.add(key)
+            self._notify(key, notification)
+            self._schedule_flush()
+
+    def update_notification(self, key, **fields):
+        """
+        Updates fields of an existing notification, e.g. previous_price.
+
+        Returns:
+            bool: True if the notification exists.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            notification = self._notifications.get(key)
+            if notification is None:
+                return False
+            notification.update(fields)
+            self._dirty_notifications.add(key)
+            self._notify(key, notification)
+            self._schedule_flush()
+            return True
+
+    def remove_notification(self, key):
+        """
+        Returns:
+            bool: True if a notification was removed.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            notification = self._notifications.pop(key, None)
+            if notification is None:
+                return False
+            self._unindex_notification(key, notification)
+            self._dirty_notifications.add(key)
+            self._new_notifications.discard(key)
+            self._notify(key, None)
+            self._schedule_flush()
+            return True
+
+    #================= persistence ==============
+
+    def _schedule_flush(self):
+        # Must be called with the lock held
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """
+        Writes pending changes to the backend immediately.
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not (self._dirty_tokens or self._dirty_notifications):
+                return
+            dirty_tokens, self._dirty_tokens = self._dirty_tokens, set()
+            dirty_notifications, self._dirty_notifications = self._dirty_notifications, set()
+            new_notifications, self._new_notifications = self._new_notifications, set()
+            try:
+                self.backend.commit(self._watchlist, self._notifications, dirty_tokens, dirty_notifications,
+                                    new_notifications)
+            except Exception as e:
+                logging.error("Failed to persist store changes: %s", e)
+                # Keep the changes pending so the next flush retries them
+                self._dirty_tokens |= dirty_tokens
+                self._dirty_notifications |= dirty_notifications
+                self._new_notifications |= new_notifications
+                self._schedule_flush()
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+    load_dotenv()
+    from utils import load_json_file, save_json_file, WATCHLIST_FILE, NOTIFICATIONS_FILE, SQLITE_DB_FILE, STORE_WAL_FILE
+
+    if sys.argv[1:] != ['migrate']:
+        sys.exit("usage: python storage.py migrate")
+    sqlite_backend = SqliteBackend(SQLITE_DB_FILE)
+    if not sqlite_backend.is_empty():
+        sys.exit(f"{SQLITE_DB_FILE} already contains data; refusing to migrate over it.")
+    json_backend = WriteAheadLog(JsonBackend(WATCHLIST_FILE, NOTIFICATIONS_FILE, load_json_file, save_json_file), STORE_WAL_FILE)
+    tokens, alerts = migrate_json_to_sqlite(json_backend, sqlite_backend)
+    print(f"Migrated {tokens} watchlist entries and {alerts} notifications to {SQLITE_DB_FILE}.")
@@ -0,0 +1,51 @@
+import os
+import sys
+import json
+
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from storage import JsonBackend
+
+class FakeClock:
+    """
+    Clock whose time only moves when a test sets `now`.
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _save_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return True
+
+@pytest.fixture
+def load_json():
+    # Stands in for utils.load_json_file
+    return _load_json
+
+@pytest.fixture
+def save_json():
+    # Stands in for utils.save_json_file
+    return _save_json
+
+@pytest.fixture
+def json_backend(tmp_path, load_json, save_json):
+    return JsonBackend(str(tmp_path / 'watchlist.json'), str(tmp_path / 'notifications.json'), load_json, save_json)
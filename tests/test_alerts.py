@@ -0,0 +1,82 @@
+import pytest
+
+from alerts import TriggerIndex, trigger_price
+
+def alert(change_type, threshold, previous_price=1.0, previous_price_at=100.0, symbol='T'):
+    return {'chat_id': 1, 'symbol': symbol, 'change_type': change_type, 'threshold_percentage': threshold,
+            'previous_price': previous_price, 'previous_price_at': previous_price_at}
+
+@pytest.fixture
+def index():
+    index = TriggerIndex()
+    index.update('1:up', alert('up', 50.0))      # fires at 1.5 and above
+    index.update('1:down', alert('down', 50.0))  # fires at 0.5 and below
+    return index
+
+def test_trigger_prices():
+    assert trigger_price('up', 50, 2.0) == 3.0
+    assert trigger_price('down', '50', 2.0) == 1.0
+    assert trigger_price('sideways', 50, 2.0) is None
+    assert trigger_price('up', 50, None) is None
+    assert trigger_price('up', 50, 0) is None
+
+@pytest.mark.parametrize('price, fired', [
+    (1.0, []),
+    (1.4999, []),
+    (1.5, ['1:up']),
+    (2.0, ['1:up']),
+    (0.5001, []),
+    (0.5, ['1:down']),
+    (0.1, ['1:down']),
+])
+def test_crossing_boundaries(index, price, fired):
+    assert index.crossed('T', price) == fired
+    assert index.crossed('OTHER', price) == []
+
+def test_nearest_triggers(index):
+    index.update('2:up', alert('up', 10.0))
+    assert index.nearest_triggers('T') == (pytest.approx(1.1), 0.5)
+    assert index.nearest_triggers('OTHER') == (None, None)
+
+def test_alerts_without_a_reference_are_uninitialized():
+    index = TriggerIndex()
+    index.update('1:T', dict(alert('up', 50.0), previous_price=None))
+    assert index.uninitialized('T') == ['1:T']
+    assert index.crossed('T', 100.0) == []
+    assert index.symbols() == {'T'}
+
+    index.update('1:T', alert('up', 50.0))
+    assert index.uninitialized('T') == []
+    assert index.crossed('T', 1.5) == ['1:T']
+
+def test_removal_and_new_threshold(index):
+    index.update('1:up', None)
+    assert index.crossed('T', 2.0) == []
+    assert len(index) == 1
+
+    # A new reference price moves the trigger
+    index.update('1:down', alert('down', 50.0, previous_price=2.0))
+    assert index.crossed('T', 0.5) == ['1:down']
+    assert index.crossed('T', 1.0) == ['1:down']
+    assert index.crossed('T', 1.0001) == []
+
+    index.update('1:down', None)
+    assert len(index) == 0
+    assert index.symbols() == set()
+    assert index.nearest_triggers('T') == (None, None)
+
+def test_windowed_alerts_are_not_indexed():
+    index = TriggerIndex()
+    index.update('1:T', dict(alert('up', 10.0), kind='change', window_minutes=60))
+    assert len(index) == 0
+
+def test_expired_references_are_reported_once(index):
+    index.update('2:up', alert('up', 10.0, previous_price_at=200.0))
+    assert index.expired('T', 100.0) == []
+    assert sorted(index.expired('T', 150.0)) == ['1:down', '1:up']
+    assert index.expired('T', 150.0) == []
+    assert index.expired('T', 250.0) == ['2:up']
+
+    # Updating the reference schedules the alert again
+    index.update('1:up', alert('up', 50.0, previous_price_at=300.0))
+    assert index.expired('T', 350.0) == ['1:up']
@@ -0,0 +1,74 @@
+import time
+import threading
+from types import SimpleNamespace
+
+from dispatcher import ChatDispatcher, UserStates
+
+def make_update(update_id, chat_id):
+    return SimpleNamespace(update_id=update_id, message=SimpleNamespace(chat=SimpleNamespace(id=chat_id)))
+
+class FakeBot:
+    """
+    Stands in for telebot.TeleBot: process_new_updates advances last_update_id
+    and runs the handler of every update, like the real one.
+    """
+
+    def __init__(self, handler):
+        self.last_update_id = 0
+        self.handler = handler
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            self.last_update_id = max(self.last_update_id, update.update_id)
+            self.handler(update)
+
+def test_tasks_of_a_chat_run_in_order():
+    dispatcher = ChatDispatcher(workers=4)
+    seen = []
+    for i in range(50):
+        dispatcher.submit(1, seen.append, i)
+    dispatcher.shutdown(wait=True)
+    assert seen == list(range(50))
+
+def test_chats_run_concurrently():
+    dispatcher = ChatDispatcher(workers=2)
+    release = threading.Event()
+    done = threading.Event()
+    dispatcher.submit(1, release.wait, 5)
+    dispatcher.submit(2, done.set)
+    assert done.wait(2), "a blocked chat delayed another chat"
+    release.set()
+    dispatcher.shutdown(wait=True)
+
+def test_queued_update_is_acknowledged_and_handled_once():
+    calls = {}
+    release = threading.Event()
+
+    def handler(update):
+        calls[update.update_id] = calls.get(update.update_id, 0) + 1
+        if update.update_id == 1:
+            release.wait(5)
+
+    bot = FakeBot(handler)
+    dispatcher = ChatDispatcher(workers=4)
+    dispatcher.attach(bot)
+    pending = [make_update(1, 7), make_update(2, 7)]
+
+    # Long polling: getUpdates returns every update after last_update_id, again and again
+    for _ in range(20):
+        bot.process_new_updates([update for update in pending if update.update_id > bot.last_update_id])
+        time.sleep(0.01)
+    release.set()
+    dispatcher.shutdown(wait=True)
+    assert bot.last_update_id == 2
+    assert calls == {1: 1, 2: 1}
+
+def test_user_states_expire():
+    now = [0.0]
+    states = UserStates(ttl=10, clock=lambda: now[0])
+    states[1] = {'state': 'waiting'}
+    now[0] = 5
+    assert states.get(1) == {'state': 'waiting'}
+    now[0] = 20
+    assert states.get(1) is None
+    assert 1 not in states
@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+import requests
+
+import feeds
+from benchmarks.fakes import FakePriceStream
+from feeds import PriceFeed, StreamingFeed, TickCoalescer
+
+TOKENS = [('eth', f"0x{i:040x}") for i in range(7)]
+
+@pytest.fixture
+def stream():
+    stream = FakePriceStream().start()
+    yield stream
+    stream.stop()
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(feeds, 'HTTP_BACKOFF_BASE', 0.01)
+
+class Sink:
+    def __init__(self):
+        self.prices = {}
+        self._condition = threading.Condition()
+
+    def __call__(self, ticks):
+        with self._condition:
+            self.prices.update(ticks)
+            self._condition.notify_all()
+
+    def wait_for(self, key, price, timeout=5):
+        with self._condition:
+            return self._condition.wait_for(lambda: self.prices.get(key) == price, timeout)
+
+@pytest.fixture
+def running_feed(stream):
+    feeds_started = []
+
+    def start(tokens, sink, **kwargs):
+        feed = StreamingFeed(tokens, sink, stream.url, flush_interval=0.01, **kwargs)
+        thread = threading.Thread(target=feed.run, daemon=True)
+        thread.start()
+        feeds_started.append((feed, thread))
+        return feed
+
+    yield start
+    for feed, thread in feeds_started:
+        feed.stop()
+        thread.join(5)
+        assert not thread.is_alive()
+
+def test_price_feed_is_abstract():
+    with pytest.raises(TypeError):
+        PriceFeed(dict, print)
+
+def test_coalescer_keeps_the_latest_tick_per_token():
+    coalescer = TickCoalescer()
+    for i in range(50):
+        coalescer.put(TOKENS[i % 7], float(i))
+    assert coalescer.drain(0) == {TOKENS[i % 7]: float(i) for i in range(50)}
+    assert coalescer.stats() == {'received': 50, 'coalesced': 43, 'delivered': 7, 'pending': 0}
+    assert coalescer.drain(0) == {}
+
+def test_streamed_burst_is_coalesced(stream):
+    feed = StreamingFeed(lambda: dict.fromkeys(TOKENS), None, stream.url)
+    subscribed = feed._subscription()
+
+    def read():
+        with pytest.raises(requests.ConnectionError):
+            feed._read(subscribed)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    assert stream.wait_for_subscriptions(1)
+    # A tick for a token that is not watched is dropped
+    stream.send(*[(*TOKENS[i % 7], float(i)) for i in range(50)], ('eth', '0xunknown', 1.0))
+    for _ in range(500):
+        if feed.coalescer.stats()['received'] == 50:
+            break
+        threading.Event().wait(0.01)
+
+    assert feed.coalescer.drain(0) == {TOKENS[i % 7]: float(i) for i in range(50)}
+    assert feed.coalescer.stats() == {'received': 50, 'coalesced': 43, 'delivered': 7, 'pending': 0}
+    stream.close_streams()
+    reader.join(5)
+    assert not reader.is_alive()
+
+def test_reconnects_when_the_server_closes_the_stream(stream, running_feed):
+    sink = Sink()
+    running_feed(lambda: dict.fromkeys(TOKENS[:2]), sink)
+    assert stream.wait_for_subscriptions(1)
+    stream.send((*TOKENS[0], 1.0))
+    assert sink.wait_for(TOKENS[0], 1.0)
+
+    stream.close_streams()
+    assert stream.wait_for_subscriptions(2)
+    assert stream.subscriptions[1] == set(TOKENS[:2])
+    stream.send((*TOKENS[0], 2.0))
+    assert sink.wait_for(TOKENS[0], 2.0)
+
+def test_resubscribes_when_the_watched_tokens_change(stream, running_feed):
+    watched = dict.fromkeys(TOKENS[:2])
+    sink = Sink()
+    running_feed(lambda: dict(watched), sink, resubscribe_interval=0.05)
+    assert stream.wait_for_subscriptions(1)
+    assert stream.subscriptions[0] == set(TOKENS[:2])
+
+    watched[TOKENS[2]] = None
+    assert stream.wait_for_subscriptions(2)
+    assert stream.subscriptions[1] == set(TOKENS[:3])
+    stream.send((*TOKENS[2], 3.0))
+    assert sink.wait_for(TOKENS[2], 3.0)
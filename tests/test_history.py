@@ -0,0 +1,61 @@
+import pytest
+
+from history import PriceHistory
+
+TIERS = ((0, 4), (60, 3))
+KEY = ('eth', '0xabc')
+OTHER = ('sol', 'So11111111111111111111111111111111111111112')
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'history.bin')
+
+def raw(history, key):
+    times, prices = history.series(key, 10000, now=10000)
+    return list(zip(times, prices))
+
+def buckets(history, key):
+    times, prices = history.series(key, 10000, now=10000, resolution=60)
+    return list(zip(times, prices))
+
+def test_ring_wraps_around_keeping_the_latest_ticks():
+    history = PriceHistory(tiers=TIERS)
+    for i in range(7):
+        history.record(KEY, float(i), 30.0 * i)
+    assert raw(history, KEY) == [(90.0, 3.0), (120.0, 4.0), (150.0, 5.0), (180.0, 6.0)]
+    # One bucket per minute with the last price of the minute
+    assert buckets(history, KEY) == [(60.0, 3.0), (120.0, 5.0), (180.0, 6.0)]
+    assert history.window(KEY, 60, now=180.0) == {'min': 4.0, 'max': 6.0, 'last': 6.0, 'last_time': 180.0}
+
+def test_round_trip_through_the_mapped_file(path):
+    history = PriceHistory(path, tiers=TIERS)
+    for i in range(7):
+        history.record(KEY, float(i), 30.0 * i)
+    history.record(OTHER, 100.0, 0.0)
+    history.save()
+
+    # Ticks of known tokens are written into the mapping, which the file shares
+    history.record(KEY, 7.0, 210.0)
+    reader = PriceHistory(path, tiers=TIERS)
+    assert raw(reader, KEY) == [(120.0, 4.0), (150.0, 5.0), (180.0, 6.0), (210.0, 7.0)]
+    reader.close()
+
+    # Tokens first seen after loading are written by the next save
+    history.record(('bsc', '0xdef'), 1.0, 0.0)
+    history.close()
+    reopened = PriceHistory(path, tiers=TIERS)
+    assert sorted(reopened.keys()) == sorted([KEY, OTHER, ('bsc', '0xdef')])
+    assert raw(reopened, KEY) == [(120.0, 4.0), (150.0, 5.0), (180.0, 6.0), (210.0, 7.0)]
+    assert buckets(reopened, KEY) == [(60.0, 3.0), (120.0, 5.0), (180.0, 7.0)]
+    assert raw(reopened, OTHER) == [(0.0, 100.0)]
+
+    # The mapped rings keep wrapping
+    reopened.record(KEY, 8.0, 240.0)
+    assert raw(reopened, KEY) == [(150.0, 5.0), (180.0, 6.0), (210.0, 7.0), (240.0, 8.0)]
+    reopened.close()
+
+def test_file_with_other_tiers_is_ignored(path):
+    history = PriceHistory(path, tiers=TIERS)
+    history.record(KEY, 1.0, 0.0)
+    history.close()
+    assert len(PriceHistory(path, tiers=((0, 8),))) == 0
@@ -0,0 +1,62 @@
+import pytest
+
+from history import PriceHistory
+from indicators import MAX_WINDOW_MINUTES, RESOLUTION, WindowedAlerts, parse_windowed_alert, price_matrix
+
+KEY = ('eth', '0xabc')
+NOW = 1700000000.0 - 1700000000.0 % RESOLUTION + 30
+
+def record_minutes(history, prices):
+    # One tick per minute, the last one in the current minute
+    for i, price in enumerate(prices):
+        history.record(KEY, price, NOW - (len(prices) - 1 - i) * RESOLUTION)
+
+def test_parses_every_kind():
+    assert parse_windowed_alert('up 10% in 60m') == {
+        'kind': 'change', 'change_type': 'up', 'threshold_percentage': 10.0, 'window_minutes': 60}
+    assert parse_windowed_alert('down sma 15m 1h') == {
+        'kind': 'sma_cross', 'change_type': 'down', 'fast_minutes': 15, 'slow_minutes': 60}
+    assert parse_windowed_alert('up ema 5m 30min')['kind'] == 'ema_cross'
+    assert parse_windowed_alert('up breakout 2 60m') == {
+        'kind': 'breakout', 'change_type': 'up', 'threshold_sigma': 2.0, 'window_minutes': 60}
+
+@pytest.mark.parametrize('details', ['up 10%', 'sideways 10% in 60m', 'up sma 1h 15m', 'up 10% in 0m', 'up breakout 2 1m'])
+def test_rejects_malformed_details(details):
+    assert parse_windowed_alert(details) is None
+
+@pytest.mark.parametrize('details', ['up 10% in 4h', 'up sma 15m 4h', 'down ema 15m 239m', 'up breakout 2 240m'])
+def test_rejects_windows_longer_than_the_history(details):
+    with pytest.raises(ValueError):
+        parse_windowed_alert(details)
+
+def test_price_matrix_carries_prices_forward():
+    history = PriceHistory()
+    history.record(KEY, 1.0, NOW - 3 * RESOLUTION)
+    history.record(KEY, 2.0, NOW - RESOLUTION)
+    matrix = price_matrix(history, [KEY, ('eth', '0xunknown')], 5, NOW)
+    assert matrix[0, 1:].tolist() == [1.0, 1.0, 2.0, 2.0]
+    assert matrix[0, 0] != matrix[0, 0]
+    assert all(value != value for value in matrix[1])
+
+@pytest.mark.parametrize('details', ['up 10% in 60m', f'up 10% in {MAX_WINDOW_MINUTES}m'])
+def test_change_alert_fires(details):
+    history = PriceHistory()
+    record_minutes(history, [1.0] * MAX_WINDOW_MINUTES + [1.2])
+    alerts = WindowedAlerts()
+    alerts.update('1:T', {'chat_id': 1, 'symbol': 'T', **parse_windowed_alert(details)})
+    fired = alerts.evaluate(history, {'T': KEY}, NOW)
+    assert [(key, round(value, 6)) for key, _, value in fired] == [('1:T', 20.0)]
+
+def test_longest_crossover_fires():
+    history = PriceHistory()
+    record_minutes(history, [1.0] * (MAX_WINDOW_MINUTES) + [2.0])
+    alerts = WindowedAlerts()
+    alerts.update('1:T', {'chat_id': 1, 'symbol': 'T', **parse_windowed_alert(f'up sma 1m {MAX_WINDOW_MINUTES - 1}m')})
+    assert [key for key, _, _ in alerts.evaluate(history, {'T': KEY}, NOW)] == ['1:T']
+
+def test_fired_alert_waits_for_its_cooldown():
+    history = PriceHistory()
+    record_minutes(history, [1.0] * 61 + [1.2])
+    alerts = WindowedAlerts()
+    alerts.update('1:T', {'chat_id': 1, 'symbol': 'T', 'fired_at': NOW - 60, **parse_windowed_alert('up 10% in 60m')})
+    assert alerts.evaluate(history, {'T': KEY}, NOW) == []
@@ -0,0 +1,65 @@
+import queue
+import logging
+
+from logs import DuplicateFilter, RotatingLogFileHandler, _DeferredQueueHandler
+
+def make_record(message, *args, level=logging.WARNING):
+    return logging.LogRecord('test', level, __file__, 1, message, args, None)
+
+def test_repeats_are_suppressed_and_counted(clock):
+    duplicates = DuplicateFilter(interval=60, clock=clock)
+    assert duplicates.filter(make_record("timeout on %s", 'eth'))
+    clock.now = 10
+    assert not duplicates.filter(make_record("timeout on %s", 'eth'))
+    assert not duplicates.filter(make_record("timeout on %s", 'eth'))
+    # A different message or level is not a repeat
+    assert duplicates.filter(make_record("timeout on %s", 'sol'))
+    assert duplicates.filter(make_record("timeout on %s", 'eth', level=logging.ERROR))
+
+    clock.now = 61
+    record = make_record("timeout on %s", 'eth')
+    assert duplicates.filter(record)
+    assert record.getMessage() == "timeout on eth (repeated 2 more times in the last 61s)"
+    clock.now = 62
+    assert not duplicates.filter(make_record("timeout on %s", 'eth'))
+
+def test_info_is_never_suppressed(clock):
+    duplicates = DuplicateFilter(interval=60, clock=clock)
+    assert all(duplicates.filter(make_record("polled", level=logging.INFO)) for _ in range(3))
+
+def test_queued_record_keeps_the_message_of_the_call():
+    records = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(records)
+    data = {'ABC': 1}
+    handler.handle(make_record("Saved data: %s", data, level=logging.DEBUG))
+    data['DEF'] = 2
+    record = records.get_nowait()
+    assert record.getMessage() == "Saved data: {'ABC': 1}"
+    assert record.args is None
+
+def read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+def test_rotates_when_the_file_is_full(tmp_path):
+    path = str(tmp_path / 'bot.log')
+    handler = RotatingLogFileHandler(path, max_bytes=20, backup_count=2, interval=0)
+    for i in range(4):
+        handler.emit(make_record("line %s of the log", i))
+    handler.close()
+    assert read(path) == ["line 3 of the log"]
+    assert read(path + '.1') == ["line 2 of the log"]
+    assert read(path + '.2') == ["line 1 of the log"]
+    assert not (tmp_path / 'bot.log.3').exists()
+
+def test_rotates_when_the_file_is_old(tmp_path):
+    path = str(tmp_path / 'bot.log')
+    handler = RotatingLogFileHandler(path, max_bytes=0, backup_count=2, interval=3600)
+    handler.emit(make_record("first"))
+    handler.emit(make_record("second"))
+    # The file is past its interval
+    handler.rollover_at -= 3600
+    handler.emit(make_record("third"))
+    handler.close()
+    assert read(path) == ["third"]
+    assert read(path + '.1') == ["first", "second"]
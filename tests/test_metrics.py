@@ -0,0 +1,76 @@
+import urllib.request
+
+import pytest
+
+from metrics import CALLS, CALL_DURATION, MetricsServer, Registry, instrumented
+
+def test_exposition_format():
+    registry = Registry()
+    requests = registry.counter('requests_total', "Requests by method.", labels=('method',))
+    requests.inc(method='get')
+    requests.inc(2, method='post "x"')
+    latency = registry.histogram('latency_seconds', "Latency.", buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    registry.gauge('queue_length', "Queued items.", lambda: 3)
+    registry.gauge('pending', "Pending by chat.", lambda: {'b': 2, 'a': 1}, label='chat')
+
+    assert registry.render() == (
+        '# HELP requests_total Requests by method.\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{method="get"} 1.0\n'
+        'requests_total{method="post \\"x\\""} 2.0\n'
+        '# HELP latency_seconds Latency.\n'
+        '# TYPE latency_seconds histogram\n'
+        'latency_seconds_bucket{le="0.1"} 1.0\n'
+        'latency_seconds_bucket{le="1.0"} 2.0\n'
+        'latency_seconds_bucket{le="+Inf"} 3.0\n'
+        'latency_seconds_sum 5.55\n'
+        'latency_seconds_count 3.0\n'
+        '# HELP queue_length Queued items.\n'
+        '# TYPE queue_length gauge\n'
+        'queue_length 3.0\n'
+        '# HELP pending Pending by chat.\n'
+        '# TYPE pending gauge\n'
+        'pending{chat="a"} 1.0\n'
+        'pending{chat="b"} 2.0\n'
+    )
+
+def test_registering_again_returns_the_same_metric():
+    registry = Registry()
+    counter = registry.counter('calls_total', "Calls.")
+    assert registry.counter('calls_total', "Calls.") is counter
+    with pytest.raises(ValueError):
+        registry.histogram('calls_total', "Calls.")
+
+def test_failing_gauge_is_left_out():
+    registry = Registry()
+    registry.gauge('broken', "Broken.", lambda: 1 / 0)
+    assert registry.render() == '# HELP broken Broken.\n# TYPE broken gauge\n'
+
+def test_instrumented_counts_calls_and_errors():
+    @instrumented(name='test:divide')
+    def divide(a, b):
+        return a / b
+
+    ok, errors = CALLS.value(function='test:divide', outcome='ok'), CALLS.value(function='test:divide', outcome='error')
+    assert divide(4, 2) == 2
+    with pytest.raises(ZeroDivisionError):
+        divide(1, 0)
+    assert CALLS.value(function='test:divide', outcome='ok') == ok + 1
+    assert CALLS.value(function='test:divide', outcome='error') == errors + 1
+    assert divide.__name__ == 'divide'
+    assert ('pricetracker_call_duration_seconds_count', '{function="test:divide"}', 2) in CALL_DURATION.samples()
+
+def test_metrics_endpoint():
+    registry = Registry()
+    registry.counter('hits_total', "Hits.").inc()
+    server = MetricsServer(port=0, registry=registry)
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert response.read().decode() == registry.render()
+    finally:
+        server.shutdown()
@@ -0,0 +1,98 @@
+import time
+import threading
+
+from telebot.apihelper import ApiTelegramException
+
+from outbox import MessageOutbox, TokenBucket
+
+class Telegram:
+    """
+    Records the messages sent, failing the first ones with a 429 if asked to.
+    """
+
+    def __init__(self, rate_limited=0, retry_after=0.2):
+        self.sent = []
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+
+    def __call__(self, chat_id, text):
+        with self._lock:
+            if self.rate_limited:
+                self.rate_limited -= 1
+                raise ApiTelegramException('sendMessage', None, {
+                    'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                    'parameters': {'retry_after': self.retry_after}})
+            self.sent.append((time.monotonic(), chat_id, text))
+
+def drain(outbox, timeout=10):
+    outbox.start()
+    outbox.stop(timeout)
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, capacity=3, now=0.0)
+    for _ in range(3):
+        assert bucket.available_at(0.0) == 0.0
+        bucket.take(0.0)
+    assert bucket.available_at(0.0) == 0.5
+    assert not bucket.is_full(1.0)
+    assert bucket.available_at(1.0) == 1.0
+    assert bucket.is_full(1.5)
+    # Idle time does not build up more than the burst
+    assert bucket.is_full(100.0) and bucket.tokens == 3
+
+def test_messages_to_a_chat_are_merged():
+    telegram = Telegram()
+    outbox = MessageOutbox(telegram, merge_window=60)
+    for text in ('a', 'b', 'c'):
+        outbox.send(1, text)
+    outbox.send(2, 'd')
+    drain(outbox)
+    assert sorted((chat_id, text) for _, chat_id, text in telegram.sent) == [(1, 'a\n\nb\n\nc'), (2, 'd')]
+    assert outbox.stats() == {'queued': 4, 'sent': 4, 'merged': 2, 'rate_limited': 0, 'failed': 0, 'pending_chats': 0}
+
+def test_merged_messages_stay_within_the_length_limit():
+    telegram = Telegram()
+    outbox = MessageOutbox(telegram, merge_window=60)
+    parts = ['x' * 2000, 'y' * 2000, 'z' * 100, 'w' * 4096]
+    for text in parts:
+        outbox.send(1, text)
+    drain(outbox)
+    assert [text for _, _, text in telegram.sent] == [parts[0] + '\n\n' + parts[1], parts[2], parts[3]]
+    assert all(len(text) <= MessageOutbox.MAX_MESSAGE_LENGTH for _, _, text in telegram.sent)
+
+def test_a_chat_is_limited_to_its_rate():
+    telegram = Telegram()
+    outbox = MessageOutbox(telegram, global_rate=1000, chat_rate=20, chat_burst=1, merge_window=0)
+    # Too long to be merged, so every one is a message of its own
+    for i in range(4):
+        outbox.send(1, str(i) * 3000)
+    outbox.send(2, 'other chat')
+    drain(outbox)
+    times = [at for at, chat_id, _ in telegram.sent if chat_id == 1]
+    assert len(times) == 4
+    assert all(later - earlier >= 0.04 for earlier, later in zip(times, times[1:]))
+    # Another chat does not wait for the limited one
+    assert [chat_id for _, chat_id, _ in telegram.sent].index(2) < 3
+
+def test_all_chats_share_the_global_rate():
+    telegram = Telegram()
+    outbox = MessageOutbox(telegram, global_rate=10, chat_rate=100, chat_burst=10, merge_window=0)
+    for chat_id in range(13):
+        outbox.send(chat_id, 'hello')
+    drain(outbox)
+    times = [at for at, _, _ in telegram.sent]
+    assert len(times) == 13
+    # A burst of 10, then one message every 0.1s
+    assert times[12] - times[0] >= 0.25
+
+def test_rate_limited_message_is_retried_after_retry_after():
+    telegram = Telegram(rate_limited=1, retry_after=0.2)
+    outbox = MessageOutbox(telegram, merge_window=0)
+    started = time.monotonic()
+    outbox.send(1, 'alert')
+    drain(outbox)
+    assert [(chat_id, text) for _, chat_id, text in telegram.sent] == [(1, 'alert')]
+    assert telegram.sent[0][0] - started >= 0.2
+    stats = outbox.stats()
+    assert (stats['sent'], stats['rate_limited'], stats['failed']) == (1, 1, 0)
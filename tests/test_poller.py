@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import poller
+from poller import PricePoller
+
+def run_cycles(clock, durations, interval=300):
+    """
+    Runs a poller whose cycles take the given times on `clock`, then cancels it.
+
+    Returns:
+        tuple: The clock times the cycles started at and the waits between them.
+    """
+    starts, waits = [], []
+
+    async def cycle(_):
+        starts.append(clock.now)
+        if len(starts) > len(durations):
+            raise asyncio.CancelledError()
+        duration = durations[len(starts) - 1]
+        if isinstance(duration, Exception):
+            raise duration
+        clock.now += duration
+
+    async def sleep(seconds):
+        waits.append(seconds)
+        clock.now += seconds
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(PricePoller(cycle, interval=interval, clock=clock, sleep=sleep).run())
+    return starts, waits
+
+def test_cycles_keep_a_fixed_cadence(clock):
+    starts, waits = run_cycles(clock, [10, 120, 299.5])
+    assert starts == [0, 300, 600, 900]
+    assert waits == [290, 180, 0.5]
+
+def test_overrunning_cycle_skips_the_missed_ticks(clock):
+    # The second cycle runs past two ticks, so the next one starts at the tick after
+    starts, waits = run_cycles(clock, [10, 700, 10])
+    assert starts == [0, 300, 1200, 1500]
+    assert waits == [290, 200, 290]
+
+def test_failed_cycle_keeps_the_cadence(clock):
+    starts, _ = run_cycles(clock, [RuntimeError('boom'), 10])
+    assert starts == [0, 300, 600]
+
+def test_price_requests_in_flight_are_limited(monkeypatch):
+    lock = threading.Lock()
+    in_flight, peak, requested = [0], [0], []
+
+    def refresh_token_prices(batch):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            requested.append(len(batch))
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        return {poller.price_key(token['network'], token['address']): '1.0' for token in batch}
+
+    monkeypatch.setattr(poller, 'refresh_token_prices', refresh_token_prices)
+    tokens = [{'network': 'eth', 'address': f"0x{i:040x}"} for i in range(poller.DEXSCREENER_BATCH_SIZE * 5)]
+    results = []
+
+    async def cycle(price_poller):
+        # Duplicates are fetched once
+        results.append(await price_poller.fetch_prices(tokens + tokens[:3]))
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(PricePoller(cycle, concurrency=2).run())
+    assert requested == [poller.DEXSCREENER_BATCH_SIZE] * 5
+    assert peak[0] == 2
+    assert len(results[0]) == len(tokens)
+
+def test_stop_cancels_a_running_poller():
+    started = threading.Event()
+
+    async def cycle(_):
+        started.set()
+        await asyncio.sleep(60)
+
+    price_poller = PricePoller(cycle)
+    thread = threading.Thread(target=price_poller.run_forever)
+    thread.start()
+    assert started.wait(5)
+    price_poller.stop()
+    thread.join(5)
+    assert not thread.is_alive()
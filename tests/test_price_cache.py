@@ -0,0 +1,100 @@
+import threading
+
+import utils
+from price_cache import PriceCache, price_key
+
+KEY = price_key('eth', '0xABC')
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = PriceCache(ttl=60, clock=clock)
+    cache.set(KEY, 1.5)
+    clock.now = 60
+    assert cache.get(KEY) == 1.5
+    assert cache.get(KEY, max_age=30) is None
+    clock.now = 61
+    assert cache.get(KEY) is None
+
+def test_fresh_entries_are_not_loaded_again(clock):
+    cache = PriceCache(ttl=60, clock=clock)
+    calls = []
+
+    def loader(keys):
+        calls.append(keys)
+        return {key: 1.0 for key in keys}
+
+    assert cache.get_many([KEY], loader) == {KEY: 1.0}
+    clock.now = 30
+    assert cache.get_many([KEY], loader) == {KEY: 1.0}
+    clock.now = 90
+    assert cache.get_many([KEY], loader) == {KEY: 1.0}
+    assert calls == [[KEY], [KEY]]
+
+def test_concurrent_misses_share_one_load(clock):
+    cache = PriceCache(ttl=60, clock=clock)
+    calls = []
+    loading = threading.Event()
+    release = threading.Event()
+
+    def loader(keys):
+        calls.append(keys)
+        loading.set()
+        release.wait(5)
+        return {key: 2.0 for key in keys}
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_many([KEY], loader)))
+    first.start()
+    assert loading.wait(5)
+    second = threading.Thread(target=lambda: results.append(cache.get_many([KEY], loader)))
+    second.start()
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert calls == [[KEY]]
+    assert results == [{KEY: 2.0}, {KEY: 2.0}]
+
+def test_failed_loads_are_not_cached(clock):
+    cache = PriceCache(ttl=60, clock=clock)
+    calls = []
+
+    def loader(keys):
+        calls.append(keys)
+        raise RuntimeError("DEX Screener is down")
+
+    assert cache.get_many([KEY], loader) == {}
+    assert cache.get_many([KEY], lambda keys: {}) == {}
+    assert cache.get(KEY) is None
+    assert len(calls) == 1
+
+def test_unavailable_prices_are_not_cached(monkeypatch):
+    missing, found = price_key('eth', '0xdead'), price_key('eth', '0xbeef')
+    tokens = {key: {'network': key[0], 'address': key[1].upper()} for key in (missing, found)}
+    monkeypatch.setattr(utils, 'get_crypto_prices',
+                        lambda addresses: {address: ('N/A' if 'DEAD' in address else '1.5') for address in addresses})
+    loader = utils._load_token_prices(tokens)
+    assert loader([missing, found]) == {found: '1.5'}
+
+    cache = PriceCache(ttl=60)
+    monkeypatch.setattr(utils, 'price_cache', cache)
+    assert utils.get_token_prices(tokens.values()) == {missing: 'N/A', found: '1.5'}
+    assert cache.get(missing) is None
+    assert cache.get(found) == '1.5'
+
+def test_restored_entries_keep_their_age(clock):
+    cache = PriceCache(ttl=60, clock=clock)
+    cache.set(price_key('eth', '0x1'), 1.0)
+    clock.now = 40
+    cache.set(KEY, 1.5)
+    snapshot = cache.snapshot()
+    assert snapshot == [(price_key('eth', '0x1'), 1.0, 40), (KEY, 1.5, 0)]
+
+    restored = PriceCache(ttl=60, clock=type(clock)(now=500))
+    restored.set(KEY, 2.0)
+    # The first entry is 40 + 30 seconds old by now, and KEY is already cached
+    assert restored.restore(snapshot, elapsed=30) == 0
+    assert restored.get(KEY) == 2.0
+
+    restored = PriceCache(ttl=60, clock=type(clock)(now=500))
+    assert restored.restore(snapshot, elapsed=10) == 2
+    assert restored.get(price_key('eth', '0x1'), max_age=51) == 1.0
+    assert restored.get(price_key('eth', '0x1'), max_age=49) is None
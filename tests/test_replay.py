@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from alerts import TriggerIndex, evaluate_threshold_alerts
+from replay import PolledSeries, simulate
+from storage import Store, notification_key
+
+THRESHOLDS = [0.5, 2.0, 5.0]
+
+def random_walk(seed, ticks=3000):
+    rng = np.random.default_rng(seed)
+    times = np.cumsum(rng.exponential(10.0, ticks))
+    prices = np.exp(np.cumsum(rng.normal(0, 0.004, ticks)))
+    return times, prices
+
+def poll_alerts(json_backend, polls, change_type, reset_interval):
+    # Feeds the polled prices through the evaluation the bot runs on every poll
+    store = Store(json_backend, flush_delay=3600)
+    index = TriggerIndex()
+    store.add_listener(index.update)
+    for chat_id, threshold in enumerate(THRESHOLDS):
+        store.set_notification(notification_key(chat_id, 'T'), {
+            'chat_id': chat_id, 'symbol': 'T', 'change_type': change_type, 'threshold_percentage': threshold})
+    fired_at = {chat_id: [] for chat_id in range(len(THRESHOLDS))}
+    for now, price in zip(polls.times.tolist(), polls.prices.tolist()):
+        for _, notification, _ in evaluate_threshold_alerts(index, store, 'T', price, now, reset_interval):
+            fired_at[notification['chat_id']].append(now)
+    return [fired_at[chat_id] for chat_id in range(len(THRESHOLDS))]
+
+@pytest.mark.parametrize('change_type', ['up', 'down'])
+@pytest.mark.parametrize('interval, reset_interval', [(30, 300), (300, 300), (60, 30)])
+@pytest.mark.parametrize('seed', [1, 2])
+def test_replay_fires_like_the_bot(json_backend, change_type, interval, reset_interval, seed):
+    times, prices = random_walk(seed)
+    polls = PolledSeries(times, prices, times[0], times[-1], interval)
+    expected = poll_alerts(json_backend, polls, change_type, reset_interval)
+    assert any(expected)
+
+    results = simulate(polls, change_type, THRESHOLDS, reset_interval)
+    assert [result['fired_at'].tolist() for result in results] == expected
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from feeds import PollingFeed
+from scheduler import AdaptiveScheduler, nearest_trigger_distance
+
+class FakePoller:
+    def __init__(self, prices):
+        self.prices = prices
+
+    async def fetch_prices(self, tokens):
+        list(tokens)
+        return self.prices
+
+def make_scheduler(clock):
+    return AdaptiveScheduler(base_interval=300, min_interval=30, max_interval=900, clock=clock)
+
+def test_new_tokens_are_due_immediately_and_rescheduled_after_a_poll(clock):
+    scheduler = make_scheduler(clock)
+    scheduler.sync(['a', 'b'])
+    assert sorted(scheduler.pop_due()) == ['a', 'b']
+    assert scheduler.next_due() is None
+    assert scheduler.record('a', 1.0, None) == 300
+    assert scheduler.next_due() == 300
+
+def test_interval_shrinks_near_a_trigger(clock):
+    scheduler = make_scheduler(clock)
+    assert scheduler.interval_for(0.5, 0.0001) == 900
+    assert scheduler.interval_for(0.001, 0.0001) == 30
+    assert nearest_trigger_distance(100.0, upper=110.0, lower=95.0) == pytest.approx(0.05)
+
+@pytest.mark.parametrize('failing', ['sink', 'distances'])
+def test_tokens_stay_scheduled_when_a_cycle_fails(failing, clock):
+    scheduler = make_scheduler(clock)
+
+    def fail(ticks):
+        raise RuntimeError("database is locked")
+
+    feed = PollingFeed(lambda: {'a': {}, 'b': {}},
+                       fail if failing == 'sink' else (lambda ticks: None),
+                       scheduler,
+                       fail if failing == 'distances' else (lambda ticks: {}))
+    with pytest.raises(RuntimeError):
+        asyncio.run(feed._cycle(FakePoller({'a': 1.0, 'b': 2.0})))
+
+    assert scheduler.next_due() == scheduler.base_interval
+    clock.now = scheduler.base_interval
+    assert sorted(scheduler.pop_due()) == ['a', 'b']
+
+def test_restored_schedule_keeps_aging_while_stopped(clock):
+    clock.now = 1000
+    scheduler = make_scheduler(clock)
+    scheduler.sync(['a', 'b'])
+    scheduler.pop_due()
+    scheduler.record('a', 1.0, None)
+    # 'b' is still being polled when the snapshot is taken
+    clock.now = 1010
+    snapshot = scheduler.snapshot()
+    assert snapshot['a'] == {'due_in': 290, 'price': 1.0, 'age': 10, 'rate': None}
+    assert snapshot['b']['due_in'] is None
+
+    # The restarted process has a clock of its own
+    restarted_clock = type(clock)(now=50)
+    restarted = make_scheduler(restarted_clock)
+    restarted.restore(snapshot, elapsed=100)
+    assert restarted.pop_due() == ['b']
+    assert restarted.next_due() == 50 + 190
+    assert restarted.snapshot()['a']['age'] == 110
+
+    late = make_scheduler(restarted_clock)
+    late.restore(snapshot, elapsed=400)
+    assert sorted(late.pop_due()) == ['a', 'b']
@@ -0,0 +1,88 @@
+import pytest
+
+from sharding import HashRing, ShardCoordinator
+
+KEYS = [('eth', f"0x{i:040x}") for i in range(200)]
+
+@pytest.fixture
+def coordinator(tmp_path, clock):
+    def create(worker_id):
+        return ShardCoordinator(str(tmp_path / 'shards.db'), worker_id, worker_ttl=15, clock=clock)
+    return create
+
+def owned(worker):
+    return {key for key in KEYS if worker.owns(key)}
+
+def test_ring_moves_few_keys_when_a_worker_joins():
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'b', 'c', 'd'])
+    moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+    assert all(after.owner(key) == 'd' for key in moved)
+    assert 0 < len(moved) < len(KEYS) / 2
+    assert HashRing().owner(KEYS[0]) is None
+
+def test_single_worker_owns_every_key(coordinator):
+    a = coordinator('a')
+    assert a.heartbeat(KEYS) == set(KEYS)
+    assert owned(a) == set(KEYS)
+    # Renewing does not report the leases as acquired again
+    assert a.heartbeat(KEYS) == set()
+
+def test_handoff_waits_for_release(coordinator, clock):
+    a, b = coordinator('a'), coordinator('b')
+    a.heartbeat(KEYS)
+
+    # B joins but A still holds every lease
+    assert b.heartbeat(KEYS) == set()
+    assert owned(a) == set(KEYS)
+
+    released = []
+    clock.now += 1
+    a.heartbeat(KEYS, before_release=lambda: released.append(True))
+    assert released == [True]
+    moving = set(KEYS) - owned(a)
+    assert moving and not owned(a) & owned(b)
+
+    clock.now += 1
+    assert b.heartbeat(KEYS) == moving
+    assert owned(a) | owned(b) == set(KEYS)
+    assert not owned(a) & owned(b)
+
+def test_dead_worker_leases_are_taken_over_after_expiry(coordinator, clock):
+    a, b = coordinator('a'), coordinator('b')
+    a.heartbeat(KEYS)
+    b.heartbeat(KEYS)
+    a.heartbeat(KEYS)
+    b.heartbeat(KEYS)
+    held_by_a = owned(a)
+    assert held_by_a
+
+    # A stops heartbeating; its leases stay valid until they expire
+    clock.now += 10
+    b.heartbeat(KEYS)
+    assert not owned(b) & held_by_a
+
+    clock.now += 10
+    assert b.heartbeat(KEYS) == held_by_a
+    assert b.workers() == {'b'}
+    assert owned(b) == set(KEYS)
+
+def test_leave_hands_keys_over_immediately(coordinator, clock):
+    a, b = coordinator('a'), coordinator('b')
+    a.heartbeat(KEYS)
+    b.heartbeat(KEYS)
+    a.leave()
+    assert owned(a) == set()
+
+    clock.now += 1
+    assert b.heartbeat(KEYS) == set(KEYS)
+
+def test_messages_are_relayed_in_order(coordinator):
+    a, b, sender = coordinator('a'), coordinator('b'), coordinator(None)
+    a.send(1, 'first')
+    b.send(2, 'second')
+    a.send(1, 'third')
+    assert sender.heartbeat(KEYS) == set()
+    assert sender.take_messages(limit=2) == [(1, 'first'), (2, 'second')]
+    assert sender.take_messages() == [(1, 'third')]
+    assert sender.take_messages() == []
@@ -0,0 +1,124 @@
+import sqlite3
+
+from storage import SqliteBackend, Store, migrate_json_to_sqlite, notification_key, watchlist_key
+
+WATCHLIST = {
+    'ABC': {'symbol': 'ABC', 'network': 'eth', 'address': '0x' + 'a' * 40, 'chat_id': 1},
+    # A second entry for the same token under another symbol
+    'ABC2': {'symbol': 'ABC2', 'network': 'eth', 'address': '0x' + 'a' * 40, 'chat_id': 2},
+    # Entries added by /addtoken are keyed by the symbol as returned by DEX Screener
+    'xyz': {'symbol': 'XYZ', 'network': 'sol', 'address': 'So11111111111111111111111111111111111111112'},
+}
+NOTIFICATIONS = {
+    # Legacy key: the symbol alone
+    'ABC': {'chat_id': 1, 'symbol': 'ABC', 'change_type': 'up', 'threshold_percentage': 10.0,
+            'previous_price': 1.5, 'previous_price_at': 1700000000.0},
+    notification_key(2, 'ABC2'): {'chat_id': 2, 'symbol': 'ABC2', 'kind': 'change', 'change_type': 'down',
+                                  'threshold_percentage': 5.0, 'window_minutes': 60},
+}
+
+def test_json_to_sqlite_round_trip(tmp_path, json_backend):
+    json_backend.commit(WATCHLIST, NOTIFICATIONS, set(WATCHLIST), set(NOTIFICATIONS))
+    sqlite_backend = SqliteBackend(str(tmp_path / 'store.db'))
+    assert migrate_json_to_sqlite(json_backend, sqlite_backend) == (3, 2)
+    sqlite_backend.close()
+
+    watchlist, notifications = SqliteBackend(str(tmp_path / 'store.db')).load()
+    assert watchlist == WATCHLIST
+    assert notifications == {
+        notification_key(1, 'ABC'): NOTIFICATIONS['ABC'],
+        # Columns a notification does not have load as None
+        notification_key(2, 'ABC2'): dict(NOTIFICATIONS[notification_key(2, 'ABC2')], previous_price=None),
+    }
+
+def test_sqlite_commit_updates_and_deletes_rows(tmp_path):
+    backend = SqliteBackend(str(tmp_path / 'store.db'))
+    watchlist = dict(WATCHLIST)
+    backend.commit(watchlist, {}, set(watchlist), set())
+    del watchlist['ABC2']
+    watchlist['ABC'] = dict(watchlist['ABC'], chat_id=3)
+    backend.commit(watchlist, {}, {'ABC', 'ABC2'}, set())
+    assert backend.load() == (watchlist, {})
+
+def test_sqlite_database_without_entry_symbols_is_upgraded(tmp_path):
+    path = str(tmp_path / 'store.db')
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE tokens (id INTEGER PRIMARY KEY, chain TEXT NOT NULL, address TEXT NOT NULL, symbol TEXT NOT NULL);
+        CREATE TABLE watchlist_entries (id INTEGER PRIMARY KEY, symbol TEXT NOT NULL UNIQUE,
+                                        token_id INTEGER NOT NULL, chat_id INTEGER);
+        INSERT INTO tokens VALUES (1, 'eth', '0xabc', 'OLD');
+        INSERT INTO watchlist_entries VALUES (1, 'OLD', 1, NULL);
+    """)
+    connection.commit()
+    connection.close()
+    assert SqliteBackend(path).load()[0] == {'OLD': {'symbol': 'OLD', 'network': 'eth', 'address': '0xabc'}}
+
+def test_store_indexes_follow_changes(json_backend):
+    store = Store(json_backend, flush_delay=60)
+    store.add_tokens({symbol: dict(token) for symbol, token in WATCHLIST.items()})
+    assert store.find_token_by_address('0x' + 'a' * 40)['symbol'] in ('ABC', 'ABC2')
+    store.set_notification(notification_key(1, 'ABC'), dict(NOTIFICATIONS['ABC']))
+    assert list(store.notifications_for_chat(1)) == [notification_key(1, 'ABC')]
+    store.remove_notification(notification_key(1, 'ABC'))
+    assert store.notifications_for_chat(1) == {}
+    store.flush()
+    assert json_backend.load()[0] == WATCHLIST
+
+def test_removing_a_token_keeps_the_alerts_of_other_chats(json_backend):
+    store = Store(json_backend, flush_delay=60)
+    store.add_tokens({symbol: dict(token) for symbol, token in WATCHLIST.items()})
+    for chat_id in (1, 2):
+        store.set_notification(notification_key(chat_id, 'ABC'), dict(NOTIFICATIONS['ABC'], chat_id=chat_id))
+
+    assert store.remove_token('ABC', chat_id=1)
+    assert store.notifications_for_chat(1) == {}
+    assert list(store.notifications_for_chat(2)) == [notification_key(2, 'ABC')]
+    assert store.get_token('ABC') is not None
+
+    # The last chat watching the token takes it off the watchlist
+    assert store.remove_token('ABC', chat_id=2)
+    assert store.get_token('ABC') is None
+    assert store.find_symbol('abc') is None
+    assert not store.remove_token('ABC', chat_id=2)
+
+def test_stale_update_does_not_recreate_a_removed_alert(tmp_path):
+    # A shard worker and the sender share the database, each with its own store
+    path = str(tmp_path / 'store.db')
+    key = notification_key(1, 'T')
+    sender = Store(SqliteBackend(path), flush_delay=60)
+    sender.set_notification(key, {'chat_id': 1, 'symbol': 'T', 'change_type': 'up', 'threshold_percentage': 10.0})
+    sender.flush()
+    worker = Store(SqliteBackend(path), flush_delay=60)
+    assert worker.get_notification(key) is not None
+
+    assert sender.remove_notification(key)
+    sender.flush()
+    assert worker.update_notification(key, previous_price=2.0)
+    worker.flush()
+
+    assert SqliteBackend(path).load()[1] == {}
+    sender.reload()
+    assert sender.remove_notification(key) is False
+
+def test_watchlist_pages_follow_changes(json_backend):
+    store = Store(json_backend, flush_delay=60)
+    store.add_tokens({symbol: dict(token) for symbol, token in WATCHLIST.items()})
+    pages = store.watchlist_pages(2)
+    assert [[symbol for symbol, _ in page] for page in pages] == [['ABC', 'ABC2'], ['xyz']]
+    assert store.watchlist_pages(2) is pages
+
+    store.remove_token('ABC2')
+    assert [[symbol for symbol, _ in page] for page in store.watchlist_pages(2)] == [['ABC', 'xyz']]
+    store.add_token('NEW', {'symbol': 'NEW', 'network': 'eth', 'address': '0x' + 'b' * 40})
+    assert [[symbol for symbol, _ in page] for page in store.watchlist_pages(2)] == [['ABC', 'xyz'], ['NEW']]
+
+def test_symbols_are_found_ignoring_case(json_backend):
+    store = Store(json_backend, flush_delay=60)
+    store.add_tokens({symbol: dict(token) for symbol, token in WATCHLIST.items()})
+    assert watchlist_key(' Xyz ') == 'XYZ'
+    # Entries stored before keys were normalised keep their key
+    assert store.find_symbol('XYZ') == 'xyz'
+    assert store.find_symbol('abc') == 'ABC'
+    store.remove_token('xyz')
+    assert store.find_symbol('XYZ') is None
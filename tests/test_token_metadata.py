@@ -0,0 +1,71 @@
+import pytest
+
+import utils
+from token_metadata import TokenMetadataCache, best_pair, index_pairs
+
+ADDRESS = '0x514910771AF9Ca656af840dff83E8264EcF986CA'
+
+def pair(pair_address, price, liquidity, address=ADDRESS):
+    return {'chainId': 'ethereum', 'pairAddress': pair_address, 'priceUsd': price,
+            'baseToken': {'address': address, 'symbol': 'LINK', 'name': 'ChainLink Token'},
+            'liquidity': {'usd': liquidity} if liquidity is not None else None}
+
+PAIRS = [pair('0xthin', '14.90', 1000.0), pair('0xdeep', '15.00', 5000000.0), pair('0xnone', '16.00', None),
+         pair('0xother', '1.00', 9e9, address='0x' + 'f' * 40)]
+
+@pytest.fixture
+def metadata(tmp_path, load_json, save_json):
+    return TokenMetadataCache(str(tmp_path / 'token_metadata.json'), load_json, save_json)
+
+def test_best_pair_is_the_most_liquid_of_the_token():
+    pairs = index_pairs(PAIRS)[ADDRESS.lower()]
+    assert [p['pairAddress'] for p in pairs] == ['0xthin', '0xdeep', '0xnone']
+    assert best_pair(pairs)['pairAddress'] == '0xdeep'
+    assert best_pair([]) is None
+
+def test_cached_metadata_is_persisted(metadata, load_json, save_json):
+    assert metadata.get('eth', ADDRESS) is None
+    metadata.set('eth', ADDRESS, 'ethereum', 'LINK', 'ChainLink Token', pair_address='0xDEEP')
+    assert metadata.get('ETH', ADDRESS.lower())['symbol'] == 'LINK'
+    assert metadata.best_pairs([ADDRESS.upper().replace('0X', '0x')]) == {ADDRESS.lower(): '0xdeep'}
+
+    reloaded = TokenMetadataCache(metadata.path, load_json, save_json)
+    assert reloaded.get('eth', ADDRESS) == metadata.get('eth', ADDRESS)
+    assert reloaded.best_pairs([ADDRESS, '0x' + 'f' * 40]) == {ADDRESS.lower(): '0xdeep'}
+    assert len(reloaded) == 1
+
+def test_not_found_results_are_remembered_until_resolved(metadata):
+    assert not metadata.is_not_found('eth', ADDRESS)
+    metadata.set_not_found('eth', ADDRESS)
+    assert metadata.is_not_found('eth', ADDRESS.lower())
+    # Not found results are not persisted
+    assert len(metadata) == 0
+
+    metadata.set('eth', ADDRESS, 'ethereum', 'LINK', 'ChainLink Token')
+    assert not metadata.is_not_found('eth', ADDRESS)
+
+def test_not_found_snapshot_expires(metadata, load_json, save_json):
+    metadata.set_not_found('eth', ADDRESS)
+    snapshot = metadata.not_found_snapshot()
+    restored = TokenMetadataCache(metadata.path, load_json, save_json, negative_ttl=300)
+    assert restored.restore_not_found(snapshot, elapsed=600) == 0
+    assert restored.restore_not_found(snapshot, elapsed=10) == 1
+    assert restored.is_not_found('eth', ADDRESS)
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+@pytest.mark.parametrize('cached_pair, price', [(None, '15.00'), ('0xThin', '14.90')])
+def test_batch_prices_come_from_the_cached_or_most_liquid_pair(metadata, monkeypatch, cached_pair, price):
+    if cached_pair:
+        metadata.set('eth', ADDRESS, 'ethereum', 'LINK', 'ChainLink Token', pair_address=cached_pair)
+    monkeypatch.setattr(utils, 'token_metadata', metadata)
+    monkeypatch.setattr(utils, 'http_get', lambda url: Response({'pairs': PAIRS}))
+    assert utils.fetch_price_batch([ADDRESS, '0x' + 'a' * 40]) == {ADDRESS: price, '0x' + 'a' * 40: 'N/A'}
@@ -0,0 +1,294 @@
+import json
+import time
+from email.utils import formatdate
+
+import pytest
+
+import utils
+from price_cache import PriceCache
+from scheduler import AdaptiveScheduler
+from storage import Store
+from token_metadata import TokenMetadataCache
+
+ETH = '0x514910771AF9Ca656af840dff83E8264EcF986CA'
+BSC = '0x' + 'b' * 40
+SOL = 'So11111111111111111111111111111111111111112'
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+class FakeSession:
+    """
+    Session returning the given responses in turn; an exception is raised instead.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+class StatusResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+@pytest.fixture
+def http(monkeypatch):
+    """
+    Installs a FakeSession and records the waits of http_get instead of sleeping.
+    """
+    sleeps = []
+    monkeypatch.setattr(utils, '_http_stats', dict.fromkeys(utils._http_stats, 0))
+    monkeypatch.setattr(utils.time, 'sleep', sleeps.append)
+    # Always wait the longest backoff allowed
+    monkeypatch.setattr(utils.random, 'uniform', lambda low, high: high)
+
+    def install(*responses):
+        session = FakeSession(*responses)
+        monkeypatch.setattr(utils, '_http_session', session)
+        return session
+
+    install.sleeps = sleeps
+    return install
+
+#================= HTTP client =================
+
+def test_retryable_statuses_are_retried_with_backoff(http):
+    session = http(StatusResponse(503), StatusResponse(500), StatusResponse(200))
+    assert utils.http_get('https://example.test').status_code == 200
+    assert session.calls == 3
+    assert http.sleeps == [utils.HTTP_BACKOFF_BASE, utils.HTTP_BACKOFF_BASE * 2]
+    stats = utils.get_http_stats()
+    assert (stats['requests'], stats['retries'], stats['errors']) == (3, 2, 0)
+    assert stats['backoff_seconds'] == pytest.approx(utils.HTTP_BACKOFF_BASE * 3)
+
+def test_retry_after_is_honoured_in_seconds_and_as_a_date(http):
+    http(StatusResponse(429, {'Retry-After': '7'}),
+         StatusResponse(429, {'Retry-After': formatdate(time.time() + 20, usegmt=True)}),
+         StatusResponse(429, {'Retry-After': str(utils.HTTP_BACKOFF_MAX * 10)}),
+         StatusResponse(200))
+    assert utils.http_get('https://example.test').status_code == 200
+    assert http.sleeps[0] == 7.0
+    assert 18 < http.sleeps[1] <= 20
+    # Waits are capped however long the server asks for
+    assert http.sleeps[2] == utils.HTTP_BACKOFF_MAX
+
+def test_last_error_status_is_returned_after_the_retries(http):
+    session = http(*[StatusResponse(502)] * 3, StatusResponse(200))
+    assert utils.http_get('https://example.test', max_retries=2).status_code == 502
+    assert session.calls == 3
+    assert utils.get_http_stats()['retries'] == 2
+
+def test_other_errors_are_not_retried(http):
+    session = http(StatusResponse(404), StatusResponse(200))
+    assert utils.http_get('https://example.test').status_code == 404
+    assert session.calls == 1 and http.sleeps == []
+
+def test_connection_errors_are_retried_then_raised(http):
+    error = utils.requests.exceptions.ConnectionError('refused')
+    http(error, StatusResponse(200))
+    assert utils.http_get('https://example.test').status_code == 200
+
+    http(error, utils.requests.exceptions.Timeout('slow'))
+    with pytest.raises(utils.requests.exceptions.Timeout):
+        utils.http_get('https://example.test', max_retries=1)
+    stats = utils.get_http_stats()
+    assert (stats['requests'], stats['retries'], stats['errors']) == (4, 2, 3)
+    assert stats['average_latency_seconds'] == stats['latency_seconds'] / 4
+
+#================= batched prices ==============
+
+def test_addresses_are_deduplicated_and_chunked():
+    addresses = [f"0x{i:040x}" for i in range(65)]
+    batches = utils.chunk_addresses(addresses + [addresses[0].upper().replace('0X', '0x'), '', None])
+    assert [len(batch) for batch in batches] == [30, 30, 5]
+    assert sum(batches, []) == addresses
+    assert utils.chunk_addresses([]) == []
+
+def test_prices_are_fetched_in_batches_and_missing_pairs_are_unavailable(monkeypatch, tmp_path, load_json, save_json):
+    monkeypatch.setattr(utils, 'token_metadata', TokenMetadataCache(str(tmp_path / 'm.json'), load_json, save_json))
+    addresses = [f"0x{i:040x}" for i in range(utils.DEXSCREENER_BATCH_SIZE * 2 + 1)]
+    requested = []
+
+    def http_get(url):
+        batch = url[len(utils.DEXSCREENER_TOKENS_URL):].split(',')
+        requested.append(batch)
+        # The response leaves out the pairs of odd addresses
+        return Response({'pairs': [{'pairAddress': f"0xpair{address[-4:]}", 'priceUsd': str(int(address, 16)),
+                                    'baseToken': {'address': address.upper().replace('0X', '0x')}}
+                                   for address in batch if int(address, 16) % 2 == 0]})
+
+    monkeypatch.setattr(utils, 'http_get', http_get)
+    prices = utils.get_crypto_prices(addresses)
+    assert [len(batch) for batch in requested] == [30, 30, 1]
+    assert prices == {address: str(i) if i % 2 == 0 else 'N/A' for i, address in enumerate(addresses)}
+
+def test_failed_batch_leaves_the_other_batches_priced(monkeypatch, tmp_path, load_json, save_json):
+    monkeypatch.setattr(utils, 'token_metadata', TokenMetadataCache(str(tmp_path / 'm.json'), load_json, save_json))
+    addresses = [f"0x{i:040x}" for i in range(utils.DEXSCREENER_BATCH_SIZE + 1)]
+
+    def http_get(url):
+        if addresses[0] in url:
+            raise utils.requests.exceptions.ConnectionError('down')
+        return Response({'pairs': [{'priceUsd': '2.0', 'baseToken': {'address': addresses[-1]}}]})
+
+    monkeypatch.setattr(utils, 'http_get', http_get)
+    prices = utils.get_crypto_prices(addresses)
+    assert prices[addresses[-1]] == '2.0'
+    assert {prices[address] for address in addresses[:-1]} == {'N/A'}
+
+#================= import ======================
+
+@pytest.mark.parametrize('text', [
+    f"eth,{ETH}\nbsc,{BSC}\nsol,{SOL}",
+    f"network,address\neth,{ETH}\nbsc,{BSC}\nsol,{SOL}\n",
+    f"eth {ETH}\nbsc;{BSC}\n\nsol:{SOL}",
+    f"eth\t{ETH}\r\nBSC , {BSC}\r\nsol {SOL}",
+    json.dumps([{'network': 'eth', 'address': ETH}, ['bsc', BSC], {'network': 'sol', 'address': SOL}]),
+])
+def test_import_formats_give_the_same_tokens(text):
+    assert utils.parse_import(text) == ([('eth', ETH), ('bsc', BSC), ('sol', SOL)], [])
+
+def test_import_reports_invalid_entries_and_drops_duplicates():
+    text = f"eth {ETH}\neth {ETH.lower()}\nbtc {ETH}\nsol 0xnotbase58\neth\neth {ETH} extra"
+    assert utils.parse_import(text) == ([('eth', ETH)], [f"btc {ETH}", 'sol 0xnotbase58', 'eth', f"eth {ETH} extra"])
+
+def test_import_of_a_single_json_object():
+    assert utils.parse_import(json.dumps({'network': 'eth', 'address': ETH})) == ([('eth', ETH)], [])
+    assert utils.parse_import('[{"network": "eth"') == ([], ['[{"network": "eth"'])
+
+@pytest.mark.parametrize('text', ['', '   \n\t'])
+def test_empty_import_has_nothing_to_import(text):
+    assert utils.parse_import(text) == ([], [])
+
+def test_import_limits():
+    lines = '\n'.join(f"eth 0x{i:040x}" for i in range(3))
+    assert len(utils.parse_import(lines, max_tokens=3)[0]) == 3
+    with pytest.raises(ValueError, match='Too many tokens'):
+        utils.parse_import(lines, max_tokens=2)
+    with pytest.raises(ValueError, match='too large'):
+        utils.parse_import(lines, max_size=len(lines) - 1)
+
+def test_resolve_tokens_batches_lookups_and_caches_results(tmp_path, load_json, save_json, monkeypatch):
+    metadata = TokenMetadataCache(str(tmp_path / 'token_metadata.json'), load_json, save_json)
+    metadata.set('eth', ETH, 'ethereum', 'LINK', 'ChainLink Token')
+    monkeypatch.setattr(utils, 'token_metadata', metadata)
+    addresses = [f"0x{i:040x}" for i in range(utils.DEXSCREENER_BATCH_SIZE + 5)]
+    requested = []
+
+    def http_get(url):
+        batch = url[len(utils.DEXSCREENER_TOKENS_URL):].split(',')
+        requested.append(batch)
+        # Every other token is found
+        return Response({'pairs': [{'chainId': 'ethereum', 'pairAddress': '0xpair', 'liquidity': {'usd': 1},
+                                    'baseToken': {'address': address, 'symbol': f"T{address[-2:]}", 'name': 'Token'}}
+                                   for address in batch if int(address, 16) % 2 == 0]})
+
+    monkeypatch.setattr(utils, 'http_get', http_get)
+    progress = []
+    results = utils.resolve_tokens([('eth', ETH)] + [('eth', address) for address in addresses],
+                                   concurrency=2, progress=progress.append)
+
+    # The cached token is answered without a request
+    assert sorted(map(len, requested)) == [5, utils.DEXSCREENER_BATCH_SIZE]
+    assert results[('eth', ETH)] == ('ethereum', 'LINK', 'ChainLink Token')
+    assert results[('eth', addresses[2])] == ('ethereum', 'T02', 'Token')
+    assert results[('eth', addresses[1])] == (None, None, None)
+    assert progress[0] == 1 and progress[-1] == len(addresses) + 1
+    assert metadata.get('eth', addresses[2])['symbol'] == 'T02'
+    assert metadata.is_not_found('eth', addresses[1])
+
+    requested.clear()
+    utils.resolve_tokens([('eth', addresses[1]), ('eth', addresses[2])])
+    assert requested == []
+
+def test_resolve_tokens_marks_a_failed_batch_unresolved(tmp_path, load_json, save_json, monkeypatch):
+    monkeypatch.setattr(utils, 'token_metadata', TokenMetadataCache(str(tmp_path / 'm.json'), load_json, save_json))
+
+    def http_get(url):
+        raise utils.requests.exceptions.ConnectionError('down')
+
+    monkeypatch.setattr(utils, 'http_get', http_get)
+    assert utils.resolve_tokens([('eth', ETH)]) == {('eth', ETH): (None, None, None)}
+    # A failed lookup is not remembered as not found
+    assert not utils.token_metadata.is_not_found('eth', ETH)
+
+def test_price_lookup_by_symbol_finds_legacy_lowercase_keys(json_backend, monkeypatch):
+    store = Store(json_backend, flush_delay=60)
+    store.add_token('link', {'symbol': 'LINK', 'network': 'eth', 'address': ETH})
+    monkeypatch.setattr(utils, 'get_store', lambda: store)
+    monkeypatch.setattr(utils, 'get_token_prices',
+                        lambda tokens: {utils.price_key(t['network'], t['address']): '15.00' for t in tokens})
+    assert utils.get_crypto_price('LINK') == '15.00'
+    assert utils.get_crypto_price('Link') == '15.00'
+    assert utils.get_crypto_price(ETH) == '15.00'
+    assert utils.get_crypto_price('NONE') == 'N/A'
+
+#================= warm state ==================
+
+@pytest.fixture
+def fresh_caches(tmp_path, load_json, save_json, monkeypatch):
+    """
+    Gives utils empty caches, as in a newly started process.
+    """
+    def install():
+        monkeypatch.setattr(utils, 'price_cache', PriceCache(ttl=300))
+        monkeypatch.setattr(utils, 'token_metadata', TokenMetadataCache(str(tmp_path / 'm.json'), load_json, save_json))
+
+    install()
+    return install
+
+@pytest.fixture
+def warm_state(tmp_path, fresh_caches, monkeypatch):
+    monkeypatch.setattr(utils, 'WARM_STATE_FILE', str(tmp_path / 'warm_state.json'))
+    return utils.WARM_STATE_FILE
+
+def test_warm_state_round_trip(warm_state, fresh_caches, load_json, monkeypatch):
+    key = utils.price_key('eth', ETH)
+    utils.price_cache.set(key, '15.00')
+    utils.token_metadata.set_not_found('sol', SOL)
+    scheduler = AdaptiveScheduler()
+    scheduler.sync([key])
+    scheduler.pop_due()
+    scheduler.record(key, 15.0, None)
+    assert utils.save_warm_state(scheduler)
+    due_in = scheduler.snapshot()[key]['due_in']
+
+    # Restarted a minute later
+    fresh_caches()
+    saved_at = load_json(warm_state)['saved_at']
+    monkeypatch.setattr(utils.time, 'time', lambda: saved_at + 60)
+    restored = AdaptiveScheduler()
+    assert utils.load_warm_state(restored)
+    assert utils.price_cache.get(key) == '15.00'
+    assert utils.price_cache.get(key, max_age=59) is None
+    assert utils.token_metadata.is_not_found('sol', SOL)
+    assert restored.snapshot()[key]['due_in'] == pytest.approx(due_in - 60, abs=1)
+
+def test_stale_or_invalid_warm_state_is_ignored(warm_state, fresh_caches, load_json, save_json, monkeypatch):
+    assert not utils.load_warm_state()
+    utils.price_cache.set(utils.price_key('eth', ETH), '15.00')
+    assert utils.save_warm_state()
+    state = load_json(warm_state)
+
+    fresh_caches()
+    monkeypatch.setattr(utils.time, 'time', lambda: state['saved_at'] + utils.WARM_STATE_MAX_AGE + 1)
+    assert not utils.load_warm_state()
+    assert len(utils.price_cache) == 0
+
+    monkeypatch.setattr(utils.time, 'time', lambda: state['saved_at'])
+    save_json(warm_state, dict(state, prices=[['eth', '15.00']]))
+    assert not utils.load_warm_state()
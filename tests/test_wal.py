@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from storage import WriteAheadLog
+
+@pytest.fixture
+def log_file(tmp_path):
+    return str(tmp_path / 'store.log')
+
+def token(symbol):
+    return {'symbol': symbol, 'network': 'eth', 'address': '0x' + symbol.lower() * 4}
+
+def test_replays_log_over_snapshot(json_backend, log_file, load_json):
+    json_backend.commit({'ABC': token('ABC'), 'DEF': token('DEF')}, {}, {'ABC', 'DEF'}, set())
+    wal = WriteAheadLog(json_backend, log_file)
+    watchlist, notifications = wal.load()
+    watchlist['GHI'] = token('GHI')
+    del watchlist['DEF']
+    notifications['1:GHI'] = {'chat_id': 1, 'symbol': 'GHI'}
+    wal.commit(watchlist, notifications, {'GHI', 'DEF'}, {'1:GHI'})
+
+    # The snapshot is untouched until the log is compacted
+    assert set(load_json(json_backend.watchlist_file)) == {'ABC', 'DEF'}
+    assert WriteAheadLog(json_backend, log_file).load() == (watchlist, notifications)
+
+def test_replay_is_idempotent(json_backend, log_file):
+    wal = WriteAheadLog(json_backend, log_file)
+    watchlist = {'ABC': token('ABC')}
+    wal.commit(watchlist, {}, {'ABC'}, set())
+    # The same records already in the snapshot, e.g. after a crash during compaction
+    json_backend.commit(watchlist, {}, {'ABC'}, set())
+    assert WriteAheadLog(json_backend, log_file).load() == (watchlist, {})
+
+def test_torn_record_is_dropped_and_cut_off(json_backend, log_file):
+    wal = WriteAheadLog(json_backend, log_file)
+    wal.commit({'ABC': token('ABC')}, {}, {'ABC'}, set())
+    with open(log_file, 'rb') as f:
+        valid = f.read()
+    # A crash in the middle of the next append
+    with open(log_file, 'ab') as f:
+        f.write(b'{"s": "w", "k": "DEF", "v": {"sym')
+
+    wal = WriteAheadLog(json_backend, log_file)
+    assert wal.load() == ({'ABC': token('ABC')}, {})
+    with open(log_file, 'rb') as f:
+        assert f.read() == valid
+
+    # New records are appended after the valid ones and survive the next load
+    wal.commit({'ABC': token('ABC'), 'DEF': token('DEF')}, {}, {'DEF'}, set())
+    assert WriteAheadLog(json_backend, log_file).load() == ({'ABC': token('ABC'), 'DEF': token('DEF')}, {})
+
+def test_corrupt_record_discards_the_rest_of_the_log(json_backend, log_file):
+    wal = WriteAheadLog(json_backend, log_file)
+    wal.commit({'ABC': token('ABC')}, {}, {'ABC'}, set())
+    with open(log_file, 'ab') as f:
+        f.write(b'not json\n')
+        f.write((json.dumps({'s': 'w', 'k': 'DEF', 'v': token('DEF')}) + '\n').encode())
+    assert WriteAheadLog(json_backend, log_file).load() == ({'ABC': token('ABC')}, {})
+
+def test_compaction_writes_snapshot_and_empties_log(json_backend, log_file):
+    wal = WriteAheadLog(json_backend, log_file, compact_bytes=1)
+    watchlist = {'ABC': token('ABC')}
+    notifications = {'1:ABC': {'chat_id': 1, 'symbol': 'ABC'}}
+    wal.commit(watchlist, notifications, {'ABC'}, {'1:ABC'})
+
+    with open(log_file, 'rb') as f:
+        assert f.read() == b''
+    assert json_backend.load() == (watchlist, notifications)
+    assert WriteAheadLog(json_backend, log_file).load() == (watchlist, notifications)
+
+def test_compaction_writes_keys_replayed_from_previous_run(json_backend, log_file):
+    WriteAheadLog(json_backend, log_file).commit({'ABC': token('ABC')}, {}, {'ABC'}, set())
+
+    wal = WriteAheadLog(json_backend, log_file, compact_bytes=1)
+    watchlist, notifications = wal.load()
+    watchlist['DEF'] = token('DEF')
+    wal.commit(watchlist, notifications, {'DEF'}, set())
+    assert json_backend.load() == (watchlist, {})
@@ -0,0 +1,61 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from webhook import WebhookServer
+
+SECRET = 'hunter2'
+UPDATE = {
+    'update_id': 42,
+    'message': {
+        'message_id': 1,
+        'date': 1700000000,
+        'chat': {'id': 7, 'type': 'private'},
+        'from': {'id': 7, 'is_bot': False, 'first_name': 'Test'},
+        'text': '/start',
+    },
+}
+
+class FakeBot:
+    def __init__(self):
+        self.updates = []
+
+    def process_new_updates(self, updates):
+        self.updates.extend(updates)
+
+@pytest.fixture
+def bot():
+    return FakeBot()
+
+@pytest.fixture
+def server(bot):
+    server = WebhookServer(bot, port=0, secret_token=SECRET)
+    thread = server.start()
+    yield server
+    server.shutdown()
+    thread.join(5)
+
+def post(server, body, secret=SECRET):
+    request = urllib.request.Request(f"http://127.0.0.1:{server.port}{server.path}", data=body, method='POST',
+                                     headers={'X-Telegram-Bot-Api-Secret-Token': secret})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def test_valid_update_is_dispatched(server, bot):
+    assert post(server, json.dumps(UPDATE).encode()) == 200
+    assert [update.update_id for update in bot.updates] == [42]
+    assert bot.updates[0].message.chat.id == 7
+    assert bot.updates[0].message.text == '/start'
+
+def test_wrong_secret_token_is_rejected(server, bot):
+    assert post(server, json.dumps(UPDATE).encode(), secret='wrong') == 403
+    assert bot.updates == []
+
+def test_malformed_body_is_rejected(server, bot):
+    assert post(server, b'{"update_id": ') == 400
+    assert bot.updates == []
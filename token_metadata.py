@@ -0,0 +1,174 @@
+import logging
+import threading
+from price_cache import PriceCache, price_key
+
+#===============================================
+#================= PAIR SELECTION ==============
+#===============================================
+
+def _liquidity(pair):
+    try:
+        return float((pair.get('liquidity') or {}).get('usd') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def index_pairs(pairs):
+    """
+    Groups DEX Screener pairs by the lowercase address of their base token.
+
+    Args:
+        pairs (list): The 'pairs' array of a DEX Screener response.
+
+    Returns:
+        dict: Lists of pairs by lowercase base token address, in response order.
+    """
+    index = {}
+    for pair in pairs or []:
+        address = ((pair.get('baseToken') or {}).get('address') or '').lower()
+        if address:
+            index.setdefault(address, []).append(pair)
+    return index
+
+def best_pair(pairs):
+    """
+    Returns the pair with the most USD liquidity; the first one on a tie.
+    """
+    return max(pairs, key=_liquidity) if pairs else None
+
+#===============================================
+#================= METADATA CACHE ==============
+#===============================================
+
+class TokenMetadataCache:
+    """
+    Persistent cache of token metadata resolved through DEX Screener.
+
+    Entries are keyed by price_key(network, address) and hold the token's
+    chainId, symbol and name and the address of its best pair. A lowercase
+    address index answers best_pairs() by address alone. Addresses that resolved
+    to nothing are remembered in a short-lived negative cache, so retries with
+    the same invalid address do not query the API again.
+    """
+
+    def __init__(self, path, load, save, negative_ttl=300, negative_max_size=10000):
+        """
+        Args:
+            path (str): The JSON file entries are persisted in.
+            load (callable): Reads a JSON file, see utils.load_json_file.
+            save (callable): Writes a JSON file, see utils.save_json_file.
+            negative_ttl (float): Seconds a "not found" result is remembered.
+            negative_max_size (int): Maximum number of "not found" results kept.
+        """
+        self.path = path
+        self._load = load
+        self._save = save
+        self._entries = None     # "network:address" -> metadata, loaded lazily
+        self._by_address = {}    # lowercase address -> metadata
+        self._not_found = PriceCache(ttl=negative_ttl, max_size=negative_max_size)
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _file_key(key):
+        return ':'.join(key)
+
+    def _ensure_loaded(self):
+        # Must be called with the lock held
+        if self._entries is None:
+            self._entries = self._load(self.path) or {}
+            self._by_address = {entry['address'].lower(): entry for entry in self._entries.values()}
+            logging.info("Loaded metadata for %s tokens from %s.", len(self._entries), self.path)
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._entries)
+
+    def get(self, network, address):
+        """
+        Returns:
+            dict: The cached metadata of the token, or None if it is not cached.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return self._entries.get(self._file_key(price_key(network, address)))
+
+    def is_not_found(self, network, address):
+        """
+        Returns:
+            bool: True if the token recently failed to resolve.
+        """
+        return self._not_found.get(price_key(network, address)) is not None
+
+    def set(self, network, address, chain_id, symbol, name, pair_address=None):
+        """
+        Stores the metadata of a token and persists the cache.
+
+        Returns:
+            dict: The stored metadata.
+        """
+        return self.set_many([(network, address, chain_id, symbol, name, pair_address)])[0]
+
+    def set_many(self, tokens):
+        """
+        Stores the metadata of several tokens and persists the cache once.
+
+        Args:
+            tokens (iterable): (network, address, chain_id, symbol, name, pair_address) tuples.
+
+        Returns:
+            list: The stored metadata, in the order given.
+        """
+        entries = []
+        with self._lock:
+            self._ensure_loaded()
+            for network, address, chain_id, symbol, name, pair_address in tokens:
+                key = price_key(network, address)
+                entry = {
+                    'network': key[0],
+                    'address': address,
+                    'chain_id': chain_id,
+                    'symbol': symbol,
+                    'name': name,
+                    'pair_address': pair_address,
+                }
+                self._entries[self._file_key(key)] = entry
+                self._by_address[key[1]] = entry
+                self._not_found.invalidate(key)
+                entries.append(entry)
+            if entries:
+                self._save(self.path, self._entries)
+        return entries
+
+    def set_not_found(self, network, address):
+        """
+        Remembers for a while that a token could not be resolved.
+        """
+        self._not_found.set(price_key(network, address), True)
+
+    def not_found_snapshot(self):
+        """
+        Returns:
+            list: The "not found" results, see PriceCache.snapshot().
+        """
+        return self._not_found.snapshot()
+
+    def restore_not_found(self, entries, elapsed=0.0):
+        """
+        Loads "not found" results from not_found_snapshot(), see PriceCache.restore().
+        """
+        return self._not_found.restore(entries, elapsed)
+
+    def best_pairs(self, addresses):
+        """
+        Returns:
+            dict: The lowercase address of the best pair by lowercase token address,
+                  for the given addresses that have one cached.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            pairs = {}
+            for address in addresses:
+                entry = self._by_address.get(address.lower())
+                if entry and entry.get('pair_address'):
+                    pairs[address.lower()] = entry['pair_address'].lower()
+            return pairs
@@ -1,12 +1,26 @@
 import os
+import re
+import csv
 import json
+import time
+import random
+import socket
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
 import requests
-import telebot
-from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from price_cache import PriceCache, price_key
+from history import PriceHistory
+from token_metadata import TokenMetadataCache, index_pairs, best_pair
+from storage import JsonBackend, SqliteBackend, Store, WriteAheadLog, notification_key, watchlist_key
+from metrics import instrumented
+from logs import start_logging
 
-# Load environment variables
-load_dotenv()
+# Settings are read from the environment when this module is imported, so entry
+# points load the .env file before importing it. Importing has no other side
+# effects: the bot, the store and the price history are created on first use.
 
 #===============================================
 #================= CONFIGURATION ===============
@@ -14,19 +28,310 @@ load_dotenv()
 
 WATCHLIST_FILE = 'watchlist.json'
 NOTIFICATIONS_FILE = 'notifications.json'
+TOKEN_METADATA_FILE = 'token_metadata.json'
+TOKEN_NOT_FOUND_TTL = 300  # seconds an address that resolved to no token is not looked up again
 ITEMS_PER_PAGE = 5
+SUPPORTED_NETWORKS = ('eth', 'sol', 'bsc')  # networks offered by /addtoken and accepted by /importwatchlist
+IMPORT_MAX_TOKENS = 1000          # tokens accepted by one /importwatchlist
+IMPORT_MAX_FILE_SIZE = 1000000    # bytes of an uploaded import file
+IMPORT_CONCURRENCY = 4            # batched DEX Screener lookups in flight during an import
+IMPORT_PROGRESS_INTERVAL = 1.0    # minimum seconds between two progress message edits
+STORE_FLUSH_DELAY = 1.0  # seconds of changes batched into one write
+STORE_WAL_FILE = 'store.wal'         # append-only log of changes on top of the JSON files
+STORE_WAL_COMPACT_BYTES = 1000000    # log size that triggers rewriting the JSON files
+POLL_INTERVAL = 300      # seconds over which notification price changes are measured
+POLL_MIN_INTERVAL = 30   # shortest polling interval for a token close to a trigger
+POLL_MAX_INTERVAL = 900  # longest polling interval for a quiet token far from any trigger
+POLL_CONCURRENCY = 8     # batched price requests in flight during a cycle
 
-# Configure logging
-logging.basicConfig(filename='crypto_tracker.log', level=logging.INFO,
-                    format='%(asctime)s:%(levelname)s:%(message)s')
+# Outgoing alert messages (Telegram allows about 30 messages per second overall
+# and about one per second to a single chat)
+OUTBOX_GLOBAL_RATE = 25     # messages per second across all chats
+OUTBOX_CHAT_RATE = 1        # messages per second to one chat
+OUTBOX_CHAT_BURST = 3       # messages one chat may receive in a burst
+OUTBOX_MERGE_WINDOW = 1.0   # seconds alerts for one chat are collected into a single message
+
+# How the bot receives updates: 'polling' (default) or 'webhook'. In webhook mode
+# a local HTTP server receives updates; WEBHOOK_URL is the public HTTPS address
+# registered with Telegram (e.g. a reverse proxy forwarding to WEBHOOK_HOST:WEBHOOK_PORT).
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+RESTART_DELAY = 15       # seconds to wait before restarting the bot after an error
+RESTART_MAX_DELAY = 300  # longest wait between restarts, reached by doubling RESTART_DELAY
+
+# Update handling, see dispatcher.py. Handlers run on a pool of DISPATCH_WORKERS
+# threads; the updates of one chat are still handled one at a time, in order.
+DISPATCH_WORKERS = 8
+USER_STATE_TTL = 3600    # seconds of inactivity after which a chat's conversation state is dropped
+
+# Price source: 'polling' (default) polls the DEX Screener API, 'stream' consumes
+# prices pushed by a line-delimited JSON stream at PRICE_STREAM_URL, see feeds.py.
+PRICE_FEED = os.getenv('PRICE_FEED', 'polling').lower()
+PRICE_STREAM_URL = os.getenv('PRICE_STREAM_URL')
+STREAM_FLUSH_INTERVAL = 0.5  # seconds of streamed ticks coalesced into one evaluation
+
+# Storage backend: 'json' (default) or 'sqlite'. Run `python storage.py migrate`
+# once to copy the JSON files into the database before switching.
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json').lower()
+SQLITE_DB_FILE = os.getenv('SQLITE_DB_FILE', 'pricetracker.db')
+
+# Sharded polling, see sharding.py: '' (default) runs everything in one process,
+# 'worker' polls the share of tokens assigned to this worker, and 'sender' runs
+# the bot and relays the workers' alerts to Telegram. Requires the SQLite backend.
+SHARD_MODE = os.getenv('SHARD_MODE', '').lower()
+SHARD_DB_FILE = os.getenv('SHARD_DB_FILE', 'shards.db')
+SHARD_WORKER_ID = os.getenv('SHARD_WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+SHARD_HEARTBEAT_INTERVAL = 5  # seconds between worker heartbeats
+SHARD_WORKER_TTL = 15         # seconds without a heartbeat after which a worker's tokens move
+SHARD_RELOAD_INTERVAL = 30    # seconds between reloads of the shared store by a worker
+
+# Price history kept for every polled token, see history.py. Each worker keeps its own.
+HISTORY_FILE = os.getenv('HISTORY_FILE', f"price_history-{SHARD_WORKER_ID}.bin" if SHARD_MODE == 'worker' else 'price_history.bin')
+HISTORY_SAVE_INTERVAL = 600  # seconds between snapshots of the history file
+
+DEXSCREENER_TOKENS_URL = "https://api.dexscreener.com/latest/dex/tokens/"
+# Maximum number of comma-separated addresses accepted by the tokens endpoint
+DEXSCREENER_BATCH_SIZE = 30
+
+# HTTP client settings
+HTTP_CONNECT_TIMEOUT = 3.05  # seconds to establish a connection
+HTTP_READ_TIMEOUT = 10       # seconds to wait for the server to send data
+HTTP_POOL_SIZE = 10          # keep-alive connections kept per host
+HTTP_MAX_RETRIES = 3         # retries after the first attempt
+HTTP_BACKOFF_BASE = 0.5      # seconds, doubled on every retry
+HTTP_BACKOFF_MAX = 30        # upper bound for a single backoff or Retry-After wait
+HTTP_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Price cache settings. The TTL matches the polling interval so prices refreshed
+# by the poller keep serving interactive commands until the next cycle.
+PRICE_CACHE_TTL = 300
+PRICE_CACHE_MAX_SIZE = 10000
+
+# Local metrics endpoint, see metrics.py: Prometheus metrics at /metrics and an
+# on-demand profile at /debug/profile. Disabled unless METRICS_PORT is set.
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0')) or None
+# If set, a sampling profiler runs for the whole process and writes its hot stacks here on shutdown
+PROFILE_FILE = os.getenv('PROFILE_FILE')
+
+# Snapshot of the last-known prices, caches and polling schedule written on
+# shutdown and restored on startup, see save_warm_state(). Each worker keeps its own.
+WARM_STATE_FILE = os.getenv('WARM_STATE_FILE', f"warm_state-{SHARD_WORKER_ID}.json" if SHARD_MODE == 'worker' else 'warm_state.json')
+WARM_STATE_MAX_AGE = 3600  # seconds after which a snapshot is ignored
+
+# Logging, see logs.py. Records are written by a background thread to LOG_FILE,
+# rotated at LOG_MAX_BYTES or every LOG_ROTATE_INTERVAL seconds. LOG_FORMAT=json
+# writes one JSON object per line. Repeats of a warning or error are dropped for
+# LOG_SUPPRESS_INTERVAL seconds.
+LOG_FILE = os.getenv('LOG_FILE', 'crypto_tracker.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_MAX_BYTES = 10000000
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_INTERVAL = 86400
+LOG_SUPPRESS_INTERVAL = 300
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_API_TOKEN')
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
+
+#===============================================
+#================= STARTUP =====================
+#===============================================
+
+def configure_logging():
+    """
+    Sends log records to LOG_FILE through the queued pipeline of logs.py. Called by
+    the entry points rather than on import, so tools importing this module keep
+    their own logging setup.
+    """
+    if LOG_FORMAT not in ('text', 'json'):
+        raise ValueError(f"Unknown LOG_FORMAT {LOG_FORMAT!r}; expected 'text' or 'json'")
+    level = logging.getLevelName(LOG_LEVEL)
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown LOG_LEVEL {LOG_LEVEL!r}")
+    start_logging(LOG_FILE, level=level, json_lines=LOG_FORMAT == 'json', max_bytes=LOG_MAX_BYTES,
+                  backup_count=LOG_BACKUP_COUNT, interval=LOG_ROTATE_INTERVAL,
+                  suppress_interval=LOG_SUPPRESS_INTERVAL)
+
+_bot = None
+_bot_lock = threading.Lock()
+
+def get_bot():
+    """
+    Returns the Telegram bot client, creating it on first use.
+
+    Returns:
+        telebot.TeleBot: The bot shared by the handlers and the outbox.
+    """
+    global _bot
+    if _bot is None:
+        with _bot_lock:
+            if _bot is None:
+                import telebot
+                # Handlers run in the dispatcher's workers, not on telebot's own thread pool
+                _bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN, threaded=False)
+    return _bot
+
+#===============================================
+#================= HTTP CLIENT =================
+#===============================================
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+_http_stats = {
+    'requests': 0,
+    'retries': 0,
+    'errors': 0,
+    'latency_seconds': 0.0,
+    'backoff_seconds': 0.0,
+}
+_http_stats_lock = threading.Lock()
+
+def _record_http_stat(name, value=1):
+    with _http_stats_lock:
+        _http_stats[name] += value
+
+def get_http_session():
+    """
+    Returns the shared HTTP session, creating it on first use.
+
+    The session keeps connections alive so repeated DEX Screener lookups reuse
+    the same TLS connection instead of handshaking on every call.
+
+    Returns:
+        requests.Session: The pooled session shared by all API helpers.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                # Retries are handled by http_get so they can be counted and jittered
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+def get_http_stats():
+    """
+    Returns a snapshot of the HTTP client counters.
+
+    Returns:
+        dict: Total requests sent (including retries), retries, transport errors,
+              cumulative request latency and backoff time in seconds, and the
+              average latency per request.
+    """
+    with _http_stats_lock:
+        stats = dict(_http_stats)
+    stats['average_latency_seconds'] = stats['latency_seconds'] / stats['requests'] if stats['requests'] else 0.0
+    return stats
+
+def _retry_after_seconds(response):
+    """
+    Parses the Retry-After header of a response.
+
+    Args:
+        response (requests.Response): The response to inspect.
+
+    Returns:
+        float: The number of seconds to wait, or None if the header is missing or invalid.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff_seconds(attempt):
+    """
+    Returns a jittered exponential backoff delay for the given retry attempt.
+    """
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+def http_get(url, timeout=None, max_retries=HTTP_MAX_RETRIES):
+    """
+    Sends a GET request through the shared session with timeouts and bounded retries.
+
+    Connection errors, timeouts and responses with a status in HTTP_RETRY_STATUSES
+    are retried up to `max_retries` times. The wait between attempts honours the
+    server's Retry-After header when present, and otherwise uses jittered
+    exponential backoff.
+
+    Args:
+        url (str): The URL to fetch.
+        timeout (tuple): Optional (connect, read) timeout in seconds.
+        max_retries (int): Number of retries after the first attempt.
+
+    Returns:
+        requests.Response: The last response received. Callers should still call
+                           raise_for_status() to handle a final error status.
+
+    Raises:
+        requests.exceptions.RequestException: If the last attempt failed without a response.
+    """
+    session = get_http_session()
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+    for attempt in range(max_retries + 1):
+        started = time.monotonic()
+        try:
+            response = session.get(url, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            _record_http_stat('requests')
+            _record_http_stat('errors')
+            _record_http_stat('latency_seconds', time.monotonic() - started)
+            if attempt == max_retries:
+                raise
+            delay = _backoff_seconds(attempt)
+            logging.warning("Request to %s failed (%s); retrying in %.2fs", url, e, delay)
+        else:
+            _record_http_stat('requests')
+            _record_http_stat('latency_seconds', time.monotonic() - started)
+            if response.status_code not in HTTP_RETRY_STATUSES or attempt == max_retries:
+                return response
+            retry_after = _retry_after_seconds(response)
+            delay = min(HTTP_BACKOFF_MAX, retry_after) if retry_after is not None else _backoff_seconds(attempt)
+            logging.warning("Request to %s returned %s; retrying in %.2fs", url, response.status_code, delay)
+
+        _record_http_stat('retries')
+        _record_http_stat('backoff_seconds', delay)
+        time.sleep(delay)
+
+price_cache = PriceCache(ttl=PRICE_CACHE_TTL, max_size=PRICE_CACHE_MAX_SIZE)
+
+_price_history = None
+_price_history_lock = threading.Lock()
+
+def get_price_history():
+    """
+    Returns the price history, mapping HISTORY_FILE on first use.
+
+    Returns:
+        PriceHistory: The history of the polled prices.
+    """
+    global _price_history
+    if _price_history is None:
+        with _price_history_lock:
+            if _price_history is None:
+                _price_history = PriceHistory(HISTORY_FILE)
+    return _price_history
 
 #===============================================
 #================= UTILITY FUNCTIONS ============
 #===============================================
 
+@instrumented
 def load_json_file(file_name):
     """
     Loads JSON data from a file.
@@ -37,19 +342,23 @@ def load_json_file(file_name):
     Returns:
         dict: The data loaded from the JSON file, or an empty dictionary if the file does not exist or is invalid.
     """
-    logging.info(f"Loading JSON file: {file_name}")
+    logging.info("Loading JSON file: %s", file_name)
     if not os.path.exists(file_name):
-        logging.warning(f"{file_name} does not exist.")
+        logging.warning("%s does not exist.", file_name)
         return {}
     try:
         with open(file_name, 'r') as file:
             data = json.load(file)
-            logging.debug(f"Loaded data: {data}")
+            logging.debug("Loaded data: %s", data)
             return data
     except json.JSONDecodeError as e:
-        logging.error(f"JSON decode error for file {file_name}: {e}")
+        # Move the damaged file aside so the next save cannot overwrite what is left of it
+        backup_name = f"{file_name}.corrupt-{int(time.time())}"
+        logging.error("JSON decode error for file %s: %s. Moved it to %s.", file_name, e, backup_name)
+        os.replace(file_name, backup_name)
         return {}
 
+@instrumented
 def save_json_file(file_name, data):
     """
     Saves JSON data to a file.
@@ -59,20 +368,66 @@ def save_json_file(file_name, data):
         data (dict): The data to save to the JSON file.
 
     Returns:
-        None
+        bool: True if the file was written.
     """
-    logging.info(f"Saving data to JSON file: {file_name}")
+    logging.info("Saving data to JSON file: %s", file_name)
+    # Write to a temporary file and rename it over the original, so a crash
+    # mid-write never leaves a truncated file behind
+    temp_name = f"{file_name}.tmp"
     try:
-        with open(file_name, 'w') as file:
+        with open(temp_name, 'w') as file:
             json.dump(data, file, indent=4)
-            logging.debug(f"Saved data: {data}")
-    except IOError as e:
-        logging.error(f"Error saving JSON file {file_name}: {e}")
-        
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, file_name)
+        logging.debug("Saved data: %s", data)
+        return True
+    except (IOError, OSError) as e:
+        logging.error("Error saving JSON file %s: %s", file_name, e)
+        return False
+
+def create_storage_backend():
+    """
+    Creates the storage backend selected by STORAGE_BACKEND.
+
+    Returns:
+        SqliteBackend or WriteAheadLog: The backend used by the store. The JSON
+        files are written through a write-ahead log.
+    """
+    if STORAGE_BACKEND == 'sqlite':
+        logging.info("Using SQLite storage: %s", SQLITE_DB_FILE)
+        return SqliteBackend(SQLITE_DB_FILE)
+    return WriteAheadLog(JsonBackend(WATCHLIST_FILE, NOTIFICATIONS_FILE, load_json_file, save_json_file),
+                         STORE_WAL_FILE, compact_bytes=STORE_WAL_COMPACT_BYTES)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """
+    Returns the store, opening the storage backend on first use.
+
+    Returns:
+        Store: The watchlist and notifications.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = Store(create_storage_backend(), flush_delay=STORE_FLUSH_DELAY)
+    return _store
+
+token_metadata = TokenMetadataCache(TOKEN_METADATA_FILE, load_json_file, save_json_file, negative_ttl=TOKEN_NOT_FOUND_TTL)
+
+@instrumented
 def get_token_info(token_address, network):
     """
     Retrieves token details (network, name, and symbol) using the DEX Screener API.
 
+    Results are cached in token_metadata, so resolving the same token again does not
+    query the API, and addresses that resolved to nothing are not retried for
+    TOKEN_NOT_FOUND_TTL seconds.
+
     Args:
         token_address (str): The contract address of the token.
         network (str): The network where the token is deployed.
@@ -81,30 +436,170 @@ def get_token_info(token_address, network):
         tuple: A tuple containing the network (chainId), symbol, and name of the token. 
                Returns (None, None, None) if the token details are not found or an error occurs.
     """
-    base_url = "https://api.dexscreener.com/latest/dex/tokens/"
-    url = f"{base_url}{token_address}"
+    cached = token_metadata.get(network, token_address)
+    if cached:
+        return cached['chain_id'], cached['symbol'], cached['name']
+    if token_metadata.is_not_found(network, token_address):
+        logging.info("Skipping lookup of %s, recently not found.", token_address)
+        return None, None, None
+
+    url = f"{DEXSCREENER_TOKENS_URL}{token_address}"
     
     try:
-        response = requests.get(url)
+        response = http_get(url)
         response.raise_for_status()  # Raises an exception for HTTP errors
         data = response.json()
 
-        logging.debug(f"API response for {network} token: {data}")
+        logging.debug("API response for %s token: %s", network, data)
         
-        # Check if 'pairs' key exists in the data
-        if 'pairs' in data:
-            for pair in data['pairs']:
-                base_token = pair['baseToken']
-                # Check if the base token's address matches the provided token address
-                if base_token['address'].lower() == token_address.lower():
-                    # Returning network (chainId), symbol, and name
-                    return pair['chainId'], base_token['symbol'], base_token['name']
-        logging.error(f"No matching token details found for {token_address}.")
+        # Pick the most liquid pair whose base token is the requested token
+        pair = best_pair(index_pairs(data.get('pairs')).get(token_address.lower()))
+        if pair:
+            base_token = pair['baseToken']
+            token_metadata.set(network, token_address, pair['chainId'], base_token['symbol'], base_token['name'],
+                               pair_address=pair.get('pairAddress'))
+            # Returning network (chainId), symbol, and name
+            return pair['chainId'], base_token['symbol'], base_token['name']
+        token_metadata.set_not_found(network, token_address)
+        logging.error("No matching token details found for %s.", token_address)
     
     except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to get token info for {token_address}: {e}")
+        logging.error("Failed to get token info for %s: %s", token_address, e)
     return None, None, None
 
+ADDRESS_PATTERNS = {
+    'eth': re.compile(r'0x[0-9a-fA-F]{40}'),
+    'bsc': re.compile(r'0x[0-9a-fA-F]{40}'),
+    'sol': re.compile(r'[1-9A-HJ-NP-Za-km-z]{32,44}'),
+}
+
+def parse_import(text, max_tokens=IMPORT_MAX_TOKENS, max_size=IMPORT_MAX_FILE_SIZE):
+    """
+    Parses the tokens of a watchlist import.
+
+    Accepts one token per line as network and address separated by a comma,
+    semicolon, colon or whitespace (so CSV files work, with or without a
+    network,address header), or a JSON list of {"network": ..., "address": ...}
+    objects or [network, address] pairs.
+
+    Args:
+        text (str): The pasted text or file contents.
+        max_tokens (int): Most valid tokens accepted.
+        max_size (int): Most characters of text accepted.
+
+    Returns:
+        tuple: The valid (network, address) pairs without duplicates, in input order,
+               and the invalid entries as strings.
+
+    Raises:
+        ValueError: If the text or the number of tokens exceeds a limit.
+    """
+    if len(text) > max_size:
+        raise ValueError(f"The import is too large. The limit is {max_size // 1000} KB.")
+    text = text.strip()
+    rows = []
+    if text and text[0] in '[{':
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return [], [text[:50]]
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, dict):
+                rows.append([item.get('network'), item.get('address')])
+            elif isinstance(item, (list, tuple)):
+                rows.append(list(item))
+            else:
+                rows.append([item])
+    else:
+        for row in csv.reader(text.splitlines()):
+            fields = [field for part in row for field in re.split(r'[\s;:]+', part.strip()) if field]
+            if fields:
+                rows.append(fields)
+        if rows and [field.lower() for field in rows[0]] == ['network', 'address']:
+            rows = rows[1:]
+
+    tokens, invalid, seen = [], [], set()
+    for row in rows:
+        if len(row) != 2 or not all(isinstance(field, str) for field in row):
+            invalid.append(' '.join(str(field) for field in row))
+            continue
+        network, address = row[0].strip().lower(), row[1].strip()
+        pattern = ADDRESS_PATTERNS.get(network)
+        if network not in SUPPORTED_NETWORKS or not pattern or not pattern.fullmatch(address):
+            invalid.append(f"{row[0]} {row[1]}")
+            continue
+        key = price_key(network, address)
+        if key not in seen:
+            seen.add(key)
+            tokens.append((network, address))
+    if len(tokens) > max_tokens:
+        raise ValueError(f"Too many tokens ({len(tokens)}). Import at most {max_tokens} at a time.")
+    return tokens, invalid
+
+def resolve_tokens(tokens, concurrency=IMPORT_CONCURRENCY, progress=None):
+    """
+    Resolves many tokens like get_token_info(), with batched concurrent requests.
+
+    Tokens found in token_metadata or recently not found are answered without a
+    request. The others are looked up DEXSCREENER_BATCH_SIZE addresses per
+    request, `concurrency` requests at a time, and the results are cached with
+    a single write.
+
+    Args:
+        tokens (list): (network, address) pairs, without duplicates.
+        concurrency (int): Maximum number of requests in flight.
+        progress (callable): Called with the number of tokens resolved so far,
+                             from the calling thread, after every batch.
+
+    Returns:
+        dict: (chainId, symbol, name) by (network, address); (None, None, None) for
+              tokens not found or whose lookup failed.
+    """
+    results = {}
+    pending = []
+    for network, address in tokens:
+        cached = token_metadata.get(network, address)
+        if cached:
+            results[(network, address)] = (cached['chain_id'], cached['symbol'], cached['name'])
+        elif token_metadata.is_not_found(network, address):
+            results[(network, address)] = (None, None, None)
+        else:
+            pending.append((network, address))
+    if progress:
+        progress(len(results))
+
+    def lookup(batch):
+        response = http_get(f"{DEXSCREENER_TOKENS_URL}{','.join(address for _, address in batch)}")
+        response.raise_for_status()
+        return index_pairs(response.json().get('pairs'))
+
+    batches = [pending[i:i + DEXSCREENER_BATCH_SIZE] for i in range(0, len(pending), DEXSCREENER_BATCH_SIZE)]
+    found = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='resolve') as executor:
+        futures = {executor.submit(lookup, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                pairs_by_address = future.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logging.error("Failed to resolve a batch of %s tokens: %s", len(batch), e)
+                results.update((token, (None, None, None)) for token in batch)
+            else:
+                for network, address in batch:
+                    pair = best_pair(pairs_by_address.get(address.lower()))
+                    if pair:
+                        base_token = pair['baseToken']
+                        found.append((network, address, pair['chainId'], base_token['symbol'], base_token['name'], pair.get('pairAddress')))
+                        results[(network, address)] = (pair['chainId'], base_token['symbol'], base_token['name'])
+                    else:
+                        token_metadata.set_not_found(network, address)
+                        results[(network, address)] = (None, None, None)
+            if progress:
+                progress(len(results))
+    token_metadata.set_many(found)
+    return results
+
+@instrumented
 def get_crypto_price(identifier):
     """
     Retrieves the token price in USD using the DEX Screener API.
@@ -115,38 +610,198 @@ def get_crypto_price(identifier):
     Returns:
         str: The price of the token in USD, or 'N/A' if the price information is not found or an error occurs.
     """
-    watchlist = load_json_file(WATCHLIST_FILE)
-
     # Determine if the identifier is a symbol or an address
     token_info = None
     if identifier.startswith("0x"):  # Likely an address
-        token_info = next((item for item in watchlist.values() if item['address'].lower() == identifier.lower()), None)
+        token_info = get_store().find_token_by_address(identifier)
     else:  # Likely a symbol
-        token_info = watchlist.get(identifier.upper())
+        # Finds entries stored under a lowercase key before keys were normalised
+        symbol = get_store().find_symbol(identifier)
+        token_info = get_store().get_token(symbol) if symbol else None
 
     if not token_info:
-        logging.error(f"No token found with identifier {identifier}.")
+        logging.error("No token found with identifier %s.", identifier)
         return 'N/A'
 
-    token_address = token_info['address']
-    url = f"https://api.dexscreener.com/latest/dex/tokens/{token_address}"
+    price = get_token_prices([token_info]).get(price_key(token_info['network'], token_info['address']), 'N/A')
+    if price == 'N/A':
+        logging.error("No price information found for token %s.", identifier)
+    return price
+
+def chunk_addresses(addresses, size=DEXSCREENER_BATCH_SIZE):
+    """
+    Removes duplicate addresses and splits them into batches for the tokens endpoint.
+
+    Args:
+        addresses (iterable): Token contract addresses, in any case.
+        size (int): Maximum number of addresses per batch.
+
+    Returns:
+        list: A list of address lists, each holding at most `size` addresses.
+              Duplicates are detected case-insensitively; the first spelling is kept.
+    """
+    unique = {}
+    for address in addresses:
+        if address:
+            unique.setdefault(address.lower(), address)
+    ordered = list(unique.values())
+    return [ordered[i:i + size] for i in range(0, len(ordered), size)]
+
+def fetch_price_batch(addresses):
+    """
+    Retrieves USD prices for a single batch of addresses with one DEX Screener request.
+
+    Args:
+        addresses (list): Up to DEXSCREENER_BATCH_SIZE token contract addresses.
+
+    Returns:
+        dict: A mapping of each requested address to its price in USD, or 'N/A'
+              if no matching pair was returned or the request failed.
+    """
+    prices = {address: 'N/A' for address in addresses}
+    if not addresses:
+        return prices
+
+    url = f"{DEXSCREENER_TOKENS_URL}{','.join(addresses)}"
+    cached_pairs = token_metadata.best_pairs(addresses)
 
     try:
-        response = requests.get(url)
+        response = http_get(url)
         response.raise_for_status()  # Raises an exception for HTTP errors
         data = response.json()
 
-        # Check if 'pairs' key exists in the data
-        if 'pairs' in data:
-            for pair in data['pairs']:
-                base_token = pair['baseToken']
-                # Check if the base token's address matches the provided token address
-                if base_token['address'].lower() == token_address.lower():
-                    # Returning the price in USD
-                    return pair.get('priceUsd', 'N/A')
-
-        logging.error(f"No price information found for token {identifier}.")
+        # Price each token from the best pair cached when it was added, falling
+        # back to the most liquid pair reported for it, as chosen when adding
+        pairs_by_address = index_pairs(data.get('pairs'))
+        for address in addresses:
+            pairs = pairs_by_address.get(address.lower())
+            if not pairs:
+                continue
+            cached = cached_pairs.get(address.lower())
+            pair = next((pair for pair in pairs if cached and (pair.get('pairAddress') or '').lower() == cached), None)
+            if pair is None:
+                pair = best_pair(pairs)
+            prices[address] = pair.get('priceUsd', 'N/A')
 
     except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to get crypto price for {identifier}: {e}")
-        return 'N/A'
+        logging.error("Failed to get crypto prices for batch of %s tokens: %s", len(addresses), e)
+    return prices
+
+def get_crypto_prices(addresses):
+    """
+    Retrieves USD prices for many tokens, batching addresses into multi-address requests.
+
+    Args:
+        addresses (iterable): Token contract addresses. Duplicates are fetched once.
+
+    Returns:
+        dict: A mapping of address to price in USD ('N/A' when unavailable), keyed by
+              the spelling of each address as first seen in `addresses`.
+    """
+    prices = {}
+    for batch in chunk_addresses(addresses):
+        prices.update(fetch_price_batch(batch))
+    return prices
+
+def _load_token_prices(tokens_by_key):
+    """
+    Returns a price cache loader fetching fresh prices for the given tokens.
+    """
+    def loader(keys):
+        prices = get_crypto_prices(tokens_by_key[key]['address'] for key in keys)
+        by_address = {address.lower(): price for address, price in prices.items()}
+        return {key: by_address[key[1]] for key in keys if by_address.get(key[1], 'N/A') != 'N/A'}
+    return loader
+
+def get_token_prices(tokens, max_age=None):
+    """
+    Returns USD prices for watchlist tokens, answering from the price cache when fresh.
+
+    Tokens missing from the cache are fetched together in batched requests. Concurrent
+    callers missing on the same token share a single request.
+
+    Args:
+        tokens (iterable): Watchlist entries with 'network' and 'address' keys.
+        max_age (float): Optional freshness bound in seconds overriding PRICE_CACHE_TTL.
+
+    Returns:
+        dict: A mapping of price_key(network, address) to price in USD, or 'N/A'
+              for tokens whose price could not be fetched.
+    """
+    tokens_by_key = {price_key(token['network'], token['address']): token for token in tokens}
+    prices = price_cache.get_many(tokens_by_key, _load_token_prices(tokens_by_key), max_age=max_age)
+    return {key: prices.get(key, 'N/A') for key in tokens_by_key}
+
+def refresh_token_prices(tokens):
+    """
+    Fetches fresh prices for watchlist tokens and stores them in the price cache.
+
+    Used by the poller, which needs current prices regardless of cache age.
+
+    Args:
+        tokens (iterable): Watchlist entries with 'network' and 'address' keys.
+
+    Returns:
+        dict: A mapping of price_key(network, address) to price in USD, or 'N/A'.
+    """
+    return get_token_prices(tokens, max_age=0)
+
+#===============================================
+#================= WARM STATE ==================
+#===============================================
+
+def _key_to_text(key):
+    return ':'.join(key)
+
+def _text_to_key(text):
+    return tuple(text.split(':', 1))
+
+def save_warm_state(scheduler=None):
+    """
+    Writes the last-known prices, the "not found" token lookups and the polling
+    schedule to WARM_STATE_FILE, so a restarted bot starts with them instead of
+    an empty cache and every token due at once.
+
+    Args:
+        scheduler (AdaptiveScheduler): The poller's schedule, if this process polls.
+
+    Returns:
+        bool: True if the snapshot was written.
+    """
+    state = {
+        'saved_at': time.time(),
+        'prices': [[_key_to_text(key), value, age] for key, value, age in price_cache.snapshot()],
+        'not_found': [[_key_to_text(key), value, age] for key, value, age in token_metadata.not_found_snapshot()],
+        'schedule': {_key_to_text(key): entry for key, entry in scheduler.snapshot().items()} if scheduler is not None else {},
+    }
+    return save_json_file(WARM_STATE_FILE, state)
+
+def load_warm_state(scheduler=None):
+    """
+    Restores a snapshot written by save_warm_state(), unless it is older than
+    WARM_STATE_MAX_AGE. Entries keep aging while the bot is down, so prices
+    expire and tokens fall due when they would have.
+
+    Args:
+        scheduler (AdaptiveScheduler): The poller's schedule, if this process polls.
+
+    Returns:
+        bool: True if a snapshot was restored.
+    """
+    state = load_json_file(WARM_STATE_FILE)
+    if not state:
+        return False
+    elapsed = max(0.0, time.time() - state.get('saved_at', 0))
+    if elapsed > WARM_STATE_MAX_AGE:
+        logging.info("Ignoring warm state saved %.0fs ago.", elapsed)
+        return False
+    try:
+        prices = price_cache.restore(((_text_to_key(key), value, age) for key, value, age in state.get('prices', [])), elapsed)
+        token_metadata.restore_not_found(((_text_to_key(key), value, age) for key, value, age in state.get('not_found', [])), elapsed)
+        if scheduler is not None:
+            scheduler.restore({_text_to_key(key): entry for key, entry in state.get('schedule', {}).items()}, elapsed)
+    except (TypeError, ValueError) as e:
+        logging.error("Invalid warm state in %s: %s", WARM_STATE_FILE, e)
+        return False
+    logging.info("Restored warm state saved %.0fs ago: %s prices, %s scheduled tokens.", elapsed, prices, len(state.get('schedule', {})))
+    return True
@@ -0,0 +1,102 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+
+#===============================================
+#================= WEBHOOK SERVER ==============
+#===============================================
+
+class WebhookServer:
+    """
+    Local HTTP endpoint receiving Telegram updates pushed by a webhook.
+
+    Each POST to `path` is handed to bot.process_new_updates(), which queues it
+    with the bot's dispatcher (see dispatcher.py), and acknowledged immediately.
+    """
+
+    def __init__(self, bot, host='127.0.0.1', port=8443, path='/telegram', secret_token=None):
+        """
+        Args:
+            bot (telebot.TeleBot): The bot whose handlers process the updates.
+            host (str): Interface to listen on.
+            port (int): Port to listen on; 0 picks a free port.
+            path (str): URL path Telegram posts updates to.
+            secret_token (str): If set, requests must carry it in the
+                                X-Telegram-Bot-Api-Secret-Token header.
+        """
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    self.send_error(404)
+                    return
+                if server.secret_token and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != server.secret_token:
+                    logging.warning("Rejected webhook request with an invalid secret token.")
+                    self.send_error(403)
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    update = types.Update.de_json(json.loads(self.rfile.read(length)))
+                except (ValueError, KeyError, TypeError) as e:
+                    logging.error("Invalid webhook payload: %s", e)
+                    self.send_error(400)
+                    return
+                server.submit(update)
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logging.debug("Webhook %s: " + format, self.address_string(), *args)
+
+        return Handler
+
+    def submit(self, update):
+        """
+        Hands an update to the bot.
+        """
+        try:
+            self.bot.process_new_updates([update])
+        except Exception as e:
+            logging.error("Error processing update %s: %s", update.update_id, e)
+
+    def serve_forever(self):
+        """
+        Serves requests until shutdown() is called.
+        """
+        logging.info("Webhook server listening on %s:%s%s", self._server.server_address[0], self.port, self.path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+
+        Returns:
+            threading.Thread: The server thread.
+        """
+        thread = threading.Thread(target=self.serve_forever, name='webhook-server', daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        """
+        Stops serving. Safe to call from any thread.
+        """
+        self._server.shutdown()